@@ -0,0 +1,262 @@
+"""
+batch_encoding.py encodes many input files in one run. The files are shared to a pool
+of worker processes, so the interpreter start-up, the eccodes import and the bufr
+sample are paid only once for each worker and not once for each file.
+The chunks of rows of one big input can be encoded in the same way (encode_chunks).
+The input files can also be only checked (validate_files), which does not load eccodes.
+"""
+import collections
+import contextlib
+import io
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+import metrics
+import errors
+import output_writer
+import rain2bufr
+
+INPUT_FILE_ENDINGS = ('.dat', '.csv')
+
+def list_input_files(directory):
+    """
+    This function returns the input files in directory in alphabetical order.
+    Only the files which end to one of INPUT_FILE_ENDINGS are returned.
+    """
+    input_filenames = []
+    for name in sorted(os.listdir(directory)):
+        path = os.path.join(directory, name)
+        if name.endswith(INPUT_FILE_ENDINGS) and os.path.isfile(path):
+            input_filenames.append(path)
+    return input_filenames
+
+def encode_one(input_filename, options=None, return_messages=False, profile=False):
+    """
+    This function encodes one input file (input_filename) with the encoding options
+    (see rain2bufr.OPTIONS) in a worker process.
+    Returns [input_filename, output filenames, error message, metrics record]. If the
+    encoding succeeds, the error message is empty. If it fails, the list of output
+    filenames is empty. The metrics record (see metrics) is made only if profile is
+    True, otherwise it is None.
+    If return_messages is True, the messages are not written. Instead of the output
+    filenames, the result of rain2bufr.encode_groups is returned, so that the
+    messages can be written by the main process (to a bulletin or by an output writer,
+    see output_writer).
+    The error messages of the encoding (errors.RainToBufrError) and the messages printed
+    by the encoding modules are collected to the error message, so they do not get
+    mixed with the other workers' messages.
+    """
+    printed = io.StringIO()
+    record = metrics.new_record(input_filename) if profile else None
+    try:
+        with contextlib.redirect_stdout(printed):
+            if return_messages:
+                encoded = rain2bufr.encode_file_messages(input_filename, options, record)
+                return [input_filename, encoded, '', record]
+            bufr_filenames = rain2bufr.encode_file(input_filename, options, None, record)
+        return [input_filename, bufr_filenames, '', record]
+    except errors.RainToBufrError as err:
+        message = (printed.getvalue() + str(err)).strip()
+        return [input_filename, [], message, record]
+    except Exception as err:
+        message = printed.getvalue().strip()
+        if message != '':
+            message = message + '\n'
+        return [input_filename, [], message + type(err).__name__ + ': ' + str(err), record]
+    finally:
+        metrics.finish(record)
+
+def encode_files(input_filenames, workers, options=None, writer=None, records=None):
+    """
+    This function encodes input files (input_filenames) with the encoding options
+    in a pool of worker processes (workers = number of processes). The result of
+    each file is printed in the order of input_filenames.
+    If a bulletin writer (writer, see bulletin_writer) is given, the workers return
+    the messages and they are appended to the bulletin in the order of input_filenames.
+    The bulletin is synced before the results are printed: after each file, or with
+    options['durability'] 'batch' after options['commit_files'] files.
+    If options['durability'] is 'batch', the workers return the messages too, and
+    the output files are written by one output writer (see output_writer), which
+    syncs them in group commits of options['commit_files'] files. The result of a
+    file is printed only after its output files have been committed, and a file whose
+    output files could not be written or committed is reported as failed.
+    If a list (records) is given, each file is measured and its metrics record (see
+    metrics) is appended to the list.
+    Returns the number of failed files.
+    """
+    failed = 0
+    workers = max(1, min(workers, len(input_filenames)))
+    all_settings = rain2bufr.get_options(options)
+    files = None
+    if writer is None and all_settings['durability'] == 'batch':
+        files = output_writer.from_options(all_settings)
+    uncommitted = []
+    with ProcessPoolExecutor(max_workers=workers) as executor, \
+            files or contextlib.nullcontext():
+        all_options = [options] * len(input_filenames)
+        return_messages = [writer is not None or files is not None] * len(input_filenames)
+        profile = [records is not None] * len(input_filenames)
+        for result in executor.map(encode_one, input_filenames, all_options, return_messages,
+                                   profile):
+            input_filename, bufr_filenames, message, record = result
+            if message == '' and (writer is not None or files is not None):
+                if files is not None:
+                    files.start(input_filename)
+                try:
+                    bufr_filenames = rain2bufr.write_groups(bufr_filenames, options, writer,
+                                                            record, files)
+                except OSError as err:
+                    if files is not None:
+                        files.discard(input_filename)
+                    bufr_filenames = []
+                    message = 'OSError: ' + str(err)
+            if record is not None:
+                metrics.finish(record)
+                records.append(record)
+            uncommitted.append([input_filename, bufr_filenames, message])
+            if files is not None:
+                ready = files.full()
+            elif writer is not None and all_settings['durability'] == 'batch':
+                ready = len(uncommitted) >= all_settings['commit_files']
+            else:
+                ready = True
+            if ready:
+                failed += print_results(uncommitted, files, writer)
+                uncommitted = []
+        failed += print_results(uncommitted, files, writer)
+    print(len(input_filenames) - failed, 'of', len(input_filenames), 'files encoded.')
+    return failed
+
+def print_results(results, files=None, writer=None):
+    """
+    Commits the waiting files of the output writer (files, see output_writer) and
+    syncs the bulletin writer (writer, see bulletin_writer) if they are given, and
+    prints the results ([input filename, output filenames, error message] of each
+    file). A file whose output could not be committed or synced is failed.
+    Returns the number of failed files.
+    """
+    failed = 0
+    commit_errors = {} if files is None else files.commit()
+    if writer is not None and len(results) > 0:
+        try:
+            writer.sync()
+        except OSError as err:
+            commit_errors = dict((result[0], err) for result in results)
+    for input_filename, bufr_filenames, message in results:
+        if message == '' and input_filename in commit_errors:
+            message = 'OSError: ' + str(commit_errors[input_filename])
+        if message == '' and len(bufr_filenames) > 0:
+            print('OK     ', input_filename, '->', ', '.join(bufr_filenames))
+        else:
+            failed += 1
+            print('FAILED ', input_filename)
+            print('    ' + message.replace('\n', '\n    '), file=sys.stderr)
+    return failed
+
+def validate_one(input_filename, options=None):
+    """
+    This function checks one input file (input_filename) by rain2bufr.validate_file in
+    a worker process.
+    Returns [input_filename, number of valid rows, number of quarantined rows, error
+    message]. If the file is valid, the error message is empty.
+    """
+    printed = io.StringIO()
+    try:
+        with contextlib.redirect_stdout(printed):
+            valid_rows, quarantine = rain2bufr.validate_file(input_filename, options)
+    except errors.RainToBufrError as err:
+        return [input_filename, 0, 0, (printed.getvalue() + str(err)).strip()]
+    except Exception as err:
+        message = printed.getvalue().strip()
+        if message != '':
+            message = message + '\n'
+        return [input_filename, 0, 0, message + type(err).__name__ + ': ' + str(err)]
+    quarantined = 0 if quarantine is None else len(quarantine.entries)
+    return [input_filename, valid_rows, quarantined, '']
+
+def validate_files(input_filenames, workers, options=None):
+    """
+    This function checks input files (input_filenames) with the encoding options in
+    a pool of worker processes (workers = number of processes), or in this process if
+    workers is 1. The result of each file is printed in the order of input_filenames.
+    Returns the number of invalid files.
+    """
+    failed = 0
+    workers = max(1, min(workers, len(input_filenames)))
+    all_options = [options] * len(input_filenames)
+    with contextlib.ExitStack() as stack:
+        if workers == 1:
+            results = map(validate_one, input_filenames, all_options)
+        else:
+            executor = stack.enter_context(ProcessPoolExecutor(max_workers=workers))
+            results = executor.map(validate_one, input_filenames, all_options)
+        for input_filename, valid_rows, quarantined, message in results:
+            if message == '':
+                text = str(valid_rows) + ' rows'
+                if quarantined > 0:
+                    text = text + ', ' + str(quarantined) + ' quarantined'
+                print('OK     ', input_filename, '->', text)
+            else:
+                failed += 1
+                print('FAILED ', input_filename)
+                print('    ' + message.replace('\n', '\n    '), file=sys.stderr)
+    print(len(input_filenames) - failed, 'of', len(input_filenames), 'files valid.')
+    return failed
+
+def encode_chunk(keys, chunk, options, sequence, quarantined=False, profile=False):
+    """
+    This function encodes one chunk of rows of an input (keys, chunk, see
+    rain2bufr.encode_rows) with the encoding options and the bufr sequence in a
+    worker process.
+    Returns [messages, quarantine entries, measured stages]. The quarantine entries
+    (see errors.Quarantine) are returned only if quarantined is True and the stages
+    (see metrics) only if profile is True, otherwise they are None.
+    """
+    quarantine = errors.Quarantine() if quarantined else None
+    record = metrics.new_record('') if profile else None
+    messages = rain2bufr.encode_rows(keys, chunk, options['max_bytes'], options['compressed'],
+                                     record, sequence, quarantine, options['verify'])
+    return [messages,
+            None if quarantine is None else quarantine.entries,
+            None if record is None else record['stages']]
+
+def encode_chunks(keys, columns, groups, options, record=None, sequence=None, quarantine=None):
+    """
+    This function encodes the rows of one input (keys, columns) in chunks in a pool of
+    options['row_workers'] worker processes. The rows are in groups ([row indices or
+    None for all the rows, chunks] of each group, see rain2bufr.group_rows and
+    rain2bufr.split_rows), and the chunks of all the groups are sent to the same pool.
+    At most two chunks for each worker are sent at a time, so the copies of the rows
+    which wait for a worker do not fill the memory. The messages are collected in the
+    order of the chunks, so they are the same with any number of workers.
+    The quarantined rows are added to the quarantine and the stages measured by the
+    workers to the metrics record (record).
+    Returns the messages of each group. The errors of the workers are raised.
+    """
+    group_messages = [[] for _ in groups]
+    workers = max(1, min(options['row_workers'], sum(len(chunks) for _, chunks in groups)))
+    waiting = collections.deque()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for group_number, [rows, chunks] in enumerate(groups):
+            for start, stop in chunks:
+                chunk = rain2bufr.chunk_columns(columns, rows, start, stop)
+                waiting.append([group_number,
+                                executor.submit(encode_chunk, keys, chunk, options, sequence,
+                                                quarantine is not None, record is not None)])
+                if len(waiting) >= 2 * workers:
+                    collect_chunk(waiting.popleft(), group_messages, quarantine, record)
+        while len(waiting) > 0:
+            collect_chunk(waiting.popleft(), group_messages, quarantine, record)
+    return group_messages
+
+def collect_chunk(waiting, group_messages, quarantine, record):
+    """
+    Adds the result of encode_chunk (waiting = [group number, future]) to the messages
+    of its group (group_messages), quarantine and record.
+    """
+    group_number, future = waiting
+    chunk_messages, entries, stages = future.result()
+    group_messages[group_number].extend(chunk_messages)
+    if quarantine is not None:
+        quarantine.entries.extend(entries)
+    metrics.add_stages(record, stages)
@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+
+"""
+benchmark.py generates synthetic rain observation data and measures how long each stage
+of the encoding takes:
+    parse:   read_dat_file.read
+    columns: separate_keys_and_values.get_columns
+    subset:  rain_values.Subset
+    encode:  bufr_encode (with the message cloned from its template)
+    write:   writing the messages to the output file
+Run program by command: python3 benchmark.py --rows 10 1000 100000 --output results.json
+Results of an earlier run can be compared with: --compare earlier_results.json
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+import eccodes
+import rain2bufr
+import rain_values as subA
+import read_dat_file
+import separate_keys_and_values
+
+# Snow depth keys of each key set. GROUND06 can be added to every key set.
+KEY_SETS = {
+    'snow': ['SNOW'],
+    'snow06': ['SNOW06', 'SNOW'],
+    'snow18': ['SNOW18', 'SNOW'],
+    'snow_man': ['SNOW_MAN'],
+    'snow_aws': ['SNOW_AWS'],
+}
+STAGES = ['parse', 'columns', 'subset', 'encode', 'write']
+
+def generate_row(rng, nsi, snow_keys, ground06, missing_ratio):
+    """
+    Makes one data row of a station (nsi) with random, but realistic values. Each
+    numeric value is missing ("/") with probability missing_ratio.
+    """
+    def value(text):
+        if rng.random() < missing_ratio:
+            return '/'
+        return text
+
+    hour = rng.choice([5, 6, 17])
+    snow = rng.choice([-1, 0, rng.randint(1, 150)])
+    if snow > 0 and rng.random() < 0.5:
+        swe = str(round(snow * 0.01 * rng.uniform(150.0, 400.0), 1))
+    else:
+        swe = '/'
+    if nsi % 3 == 0:
+        wsi = '0-20000-0-' + str(nsi % 100000).zfill(5)
+    else:
+        wsi = '0-246-0-' + str(nsi)
+    pairs = [
+        ['TTAAII', 'ISXD62'], ['ELGROUND', '0'], ['ELSNOW', value('0')],
+        ['ELSTAT', value(str(rng.randint(0, 1300)))], ['NSI', str(nsi)],
+        ['LAT', value(str(round(rng.uniform(59.5, 70.1), 5)))],
+        ['LON', value(str(round(rng.uniform(19.5, 31.5), 5)))],
+        ['METHODSNOW', value(str(rng.randint(0, 2)))],
+        ['STATION_NAME', 'Station ' + str(nsi)], ['STATION_TYPE', str(rng.randint(0, 1))],
+        ['WMON', '/'], ['WSI', wsi], ['DD', '04'],
+        ['GROUND', value(str(rng.randint(0, 9)))],
+    ]
+    if ground06:
+        pairs.append(['GROUND06', value(str(rng.randint(0, 9)))])
+    pairs.extend([['HH24', str(hour).zfill(2)], ['MI', '00'], ['MM', '04'],
+                  ['OBSTIME', '2022-04-04 ' + str(hour).zfill(2) + ':00']])
+    for key in snow_keys:
+        pairs.append([key, value(str(snow))])
+    pairs.extend([['SWE', swe], ['T', value(str(round(rng.uniform(-30.0, 20.0), 1)))],
+                  ['VALUE_COUNT', '8'], ['YYYY', '2022']])
+    return ';'.join(key + '=' + text for key, text in pairs) + '*\n'
+
+def generate_dat(filename, rows, key_set='snow', ground06=False, missing_ratio=0.1, seed=0):
+    """
+    Writes a .dat file (filename) with rows data rows. key_set is one of KEY_SETS.
+    """
+    rng = random.Random(seed)
+    with open(filename, 'w', encoding='utf8') as fout:
+        fout.write('FILENAME: /benchmark/ISXD62_2022-04-04_06:00_SC_20220811080144.dat\n')
+        for i in range(0, rows):
+            fout.write(generate_row(rng, 100000 + i, KEY_SETS[key_set], ground06,
+                                    missing_ratio))
+
+def run_stages(input_filename, output_dir, options):
+    """
+    Encodes the input file (input_filename) stage by stage and returns the time of
+    each stage in seconds, the number of messages and the size of the output.
+    """
+    times = dict.fromkeys(STAGES, 0.0)
+
+    start = time.perf_counter()
+    with open(input_filename, 'r', encoding='utf8') as in_file:
+        output, data = read_dat_file.read(in_file)
+    times['parse'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    keys, sub_array = separate_keys_and_values.get_columns(data)
+    times['columns'] = time.perf_counter() - start
+
+    messages = []
+    for first, last in rain2bufr.split_rows(len(data), options['max_subsets']):
+        chunk = [column[first:last] for column in sub_array]
+        start = time.perf_counter()
+        subset_array = subA.Subset(keys, chunk)
+        times['subset'] += time.perf_counter() - start
+
+        start = time.perf_counter()
+        messages.append(rain2bufr.encode_subset(subset_array, options['compressed']))
+        times['encode'] += time.perf_counter() - start
+
+    start = time.perf_counter()
+    output_filename = os.path.join(output_dir, output[0] + '.bufr')
+    rain2bufr.write_messages(output_filename, messages, False)
+    times['write'] = time.perf_counter() - start
+
+    return {'times': times, 'messages': len(messages),
+            'output_bytes': os.path.getsize(output_filename)}
+
+def run(rows_list, key_sets, ground06, missing_ratio, repeat, options):
+    """
+    Runs the benchmark for each number of rows (rows_list) and key set (key_sets).
+    Each case is run repeat times and the fastest time of each stage is kept.
+    Returns the results as a dictionary.
+    """
+    results = []
+    with tempfile.TemporaryDirectory() as work_dir:
+        for rows in rows_list:
+            for key_set in key_sets:
+                input_filename = os.path.join(work_dir, 'input.dat')
+                generate_dat(input_filename, rows, key_set, ground06, missing_ratio)
+                best = None
+                for _ in range(0, repeat):
+                    result = run_stages(input_filename, work_dir, options)
+                    if best is None:
+                        best = result
+                    else:
+                        for stage in STAGES:
+                            best['times'][stage] = min(best['times'][stage],
+                                                       result['times'][stage])
+                best['rows'] = rows
+                best['key_set'] = key_set
+                best['input_bytes'] = os.path.getsize(input_filename)
+                best['total'] = sum(best['times'].values())
+                results.append(best)
+                print_result(best)
+    return {
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'eccodes': eccodes.codes_get_api_version(),
+        'ground06': ground06,
+        'missing_ratio': missing_ratio,
+        'options': options,
+        'results': results,
+    }
+
+def print_result(result):
+    """
+    Prints the stage times of one benchmark case.
+    """
+    parts = [str(result['rows']).rjust(8), result['key_set'].ljust(9)]
+    for stage in STAGES:
+        parts.append(stage + ' ' + format(result['times'][stage], '.4f'))
+    parts.append('total ' + format(result['total'], '.4f') + ' s')
+    print('  '.join(parts))
+
+def compare(new, old):
+    """
+    Prints the ratio new time / old time of each stage for the cases which are in both
+    benchmark results (new and old). A ratio smaller than 1 means the new run is faster.
+    """
+    old_results = {}
+    for result in old['results']:
+        old_results[(result['rows'], result['key_set'])] = result
+    print('\nnew / old:')
+    for result in new['results']:
+        old_result = old_results.get((result['rows'], result['key_set']))
+        if old_result is None:
+            continue
+        parts = [str(result['rows']).rjust(8), result['key_set'].ljust(9)]
+        for stage in STAGES + ['total']:
+            if stage == 'total':
+                new_time, old_time = result['total'], old_result['total']
+            else:
+                new_time, old_time = result['times'][stage], old_result['times'][stage]
+            if old_time > 0:
+                parts.append(stage + ' ' + format(new_time / old_time, '.2f'))
+        print('  '.join(parts))
+
+def main():
+    """
+    Main function gets the benchmark settings from command line, runs the benchmark,
+    saves the results and compares them to earlier results.
+    """
+    parser = argparse.ArgumentParser(description='Benchmarks the stages of the encoding.')
+    parser.add_argument('--rows', type=int, nargs='+', default=[10, 1000, 10000],
+                        help='numbers of data rows (10 - 1 000 000)')
+    parser.add_argument('--key-sets', nargs='+', default=['snow'], choices=sorted(KEY_SETS))
+    parser.add_argument('--ground06', action='store_true', help='add GROUND06 key')
+    parser.add_argument('--missing-ratio', type=float, default=0.1,
+                        help='share of missing "/" values')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--max-subsets', type=int, default=0,
+                        help='maximum number of subsets in one message (default: no limit)')
+    parser.add_argument('--compressed', action='store_true')
+    parser.add_argument('--output', help='save the results to this JSON file')
+    parser.add_argument('--compare', help='compare to the results in this JSON file')
+    args = parser.parse_args()
+
+    options = rain2bufr.get_options({'max_subsets': args.max_subsets,
+                                     'compressed': args.compressed})
+    results = run(args.rows, args.key_sets, args.ground06, args.missing_ratio,
+                  max(args.repeat, 1), options)
+    if args.output is not None:
+        with open(args.output, 'w', encoding='utf8') as fout:
+            json.dump(results, fout, indent=1)
+    if args.compare is not None:
+        with open(args.compare, 'r', encoding='utf8') as fin:
+            compare(results, json.load(fin))
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,187 @@
+"""
+bufr_sequences.py describes the bufr sequences which the Subset objects (see rain_values)
+can be encoded to. Each sequence is described once as a mapping from Subset columns to
+bufr keys:
+    name:        name of the sequence, used in options['sequence']
+    descriptors: the unexpanded descriptors of the message
+    select_keys: input keys which select the sequence automatically
+    columns:     [bufr key, Subset attribute, kind] in the order of the descriptors.
+                 kind is 'array' (numbers), 'string' (texts) or 'ranks'. A 'ranks' column
+                 has a 4th item, the number of occurrences of the key in the sequence, and
+                 the values of the occurrences are one after another in the attribute for
+                 each subset.
+New sequences are added with register. The columns of a sequence are compiled to an
+encoding plan (encoding_plan) once for uncompressed and once for compressed data.
+The bufr keys of the columns are checked against the bufr keys of key_schema
+(KeySpec.bufr_key): a column of a Subset attribute which is set straight from an input
+key should have the bufr key of that key (check_columns), and each bufr key of
+key_schema should be in some sequence (unused_bufr_keys).
+"""
+import collections
+import functools
+import errors
+import key_schema
+
+Sequence = collections.namedtuple('Sequence', ['name', 'descriptors', 'select_keys', 'columns'])
+
+SEQUENCES = collections.OrderedDict()
+DEFAULT = 'snow'
+
+def register(sequence):
+    """
+    Adds a sequence (Sequence) to SEQUENCES. A sequence with the same name is replaced.
+    The columns are checked by check_columns.
+    """
+    check_columns(sequence)
+    SEQUENCES[sequence.name] = sequence
+    encoding_plan.cache_clear()
+
+def schema_bufr_keys():
+    """
+    Returns {Subset attribute: bufr key} of the keys of key_schema.SCHEMA which have
+    a bufr key.
+    """
+    bufr_keys = {}
+    for spec in key_schema.SCHEMA.values():
+        if spec.bufr_key is None:
+            continue
+        if isinstance(spec.attribute, list):
+            bufr_keys.update(zip(spec.attribute, spec.bufr_key))
+        else:
+            bufr_keys[spec.attribute] = spec.bufr_key
+    return bufr_keys
+
+def check_columns(sequence):
+    """
+    Raises errors.OptionError if a column of the sequence sets a Subset attribute of
+    key_schema to another bufr key than KeySpec.bufr_key of its input key.
+    """
+    bufr_keys = schema_bufr_keys()
+    for column in sequence.columns:
+        key, attribute = column[0:2]
+        if attribute in bufr_keys and bufr_keys[attribute] != key:
+            raise errors.OptionError('Sequence ' + sequence.name + ' sets ' + attribute +
+                                     ' to ' + key + ', but key_schema has ' +
+                                     bufr_keys[attribute] + '.\n')
+
+def unused_bufr_keys():
+    """
+    Returns the bufr keys of key_schema.SCHEMA which are in none of the sequences.
+    """
+    used = set(column[0] for sequence in SEQUENCES.values() for column in sequence.columns)
+    return sorted(set(schema_bufr_keys().values()) - used)
+
+def select(keys, name='auto'):
+    """
+    Returns the sequence (Sequence) with the name. If name is 'auto', the first
+    sequence which has one of its select_keys in the input keys (keys) is returned,
+    or the DEFAULT sequence if there is none.
+    If there is no sequence with the name, errors.OptionError is raised.
+    """
+    if name == 'auto':
+        for sequence in SEQUENCES.values():
+            if any(key in keys for key in sequence.select_keys):
+                return sequence
+        name = DEFAULT
+    if name not in SEQUENCES:
+        raise errors.OptionError('Unknown bufr sequence: ' + str(name) + '.\n\n'
+                                 + 'Known sequences are: ' + ', '.join(SEQUENCES) + '.\n')
+    return SEQUENCES[name]
+
+@functools.lru_cache(maxsize=None)
+def encoding_plan(name, compressed):
+    """
+    Compiles the columns of the sequence (name) to an encoding plan: a tuple of
+    [kind, bufr key, Subset attribute, start, step], where kind is 'array' or 'string'.
+    The values of the attribute from start with step are set to the bufr key.
+    In uncompressed data all the occurrences of a 'ranks' key are set at once.
+    In compressed data (compressed is True) each occurrence (#1#key, #2#key, ...)
+    has one value for each subset, so they are set one by one.
+    """
+    plan = []
+    for column in SEQUENCES[name].columns:
+        key, attribute, kind = column[0:3]
+        if kind == 'ranks' and compressed:
+            count = column[3]
+            for rank in range(0, count):
+                plan.append(('array', '#' + str(rank + 1) + '#' + key, attribute, rank, count))
+        elif kind == 'ranks':
+            plan.append(('array', key, attribute, 0, 1))
+        else:
+            plan.append((kind, key, attribute, 0, 1))
+    return tuple(plan)
+
+# Snow observation, snow density, snow water equivalent.
+# 307103: 301150, 307101, 013117, 003028, 013163
+register(Sequence('snow', [307103], ['SNOW', 'SNOW06', 'SNOW18', 'SNOW_MAN', 'SNOW_AWS', 'SWE'], [
+    # WIGOS identifier:
+    # 301150: 001125, 001126, 001127, 001128
+    ['wigosIdentifierSeries', 'WSI_IDS', 'array'],
+    ['wigosIssuerOfIdentifier', 'WSI_IDI', 'array'],
+    ['wigosIssueNumber', 'WSI_INR', 'array'],
+    ['wigosLocalIdentifierCharacter', 'WSI_LID', 'string'],
+    # Snow observation:
+    # 307101: 301089, 001019, 002001, 301011, 301012, 301021,
+    #         007030, 007032, 012101, 007032, 002177, 020062, 013013
+        # National station identification:
+        # 301089: 001101 State identifier (Finland = 613), 001102 National station number
+    ['stateIdentifier', 'STATEID', 'array'],
+    ['nationalStationNumber', 'NSI', 'array'],
+    ['longStationName', 'LONG_STATION_NAME', 'string'],
+    ['stationType', 'STATION_TYPE', 'array'],
+        # 301011: Year, month, day. 301012: Hour, minute.
+        # 301021: Latitude and longitude (high accuracy)
+    ['year', 'YYYY', 'array'],
+    ['month', 'MM', 'array'],
+    ['day', 'DD', 'array'],
+    ['hour', 'HH24', 'array'],
+    ['minute', 'MI', 'array'],
+    ['latitude', 'LAT', 'array'],
+    ['longitude', 'LON', 'array'],
+        # 007030: Height of station ground above mean sea level [m]
+        # 007032: Height of the temperature sensor and of the snow sensor [m]
+        # 012101: Temperature/air temperature [K]
+        # 002177: Method of snow depth measurement
+        # 020062: State of the ground
+        # 013013: Total snow depth [m]
+    ['heightOfStationGroundAboveMeanSeaLevel', 'ELSTAT', 'array'],
+    ['heightOfSensorAboveLocalGroundOrDeckOfMarinePlatform', 'SENSOR', 'ranks', 2],
+    ['airTemperature', 'T', 'array'],
+    ['methodOfSnowDepthMeasurement', 'METHODSNOW', 'array'],
+    ['stateOfGround', 'GR', 'array'],
+    ['totalSnowDepth', 'SNOW_TOTAL', 'array'],
+    # 013117: Snow density (liquid water content) [kg/m³]
+    # 003028: Method of snow water equivalent measurement
+    # 013163: Snow water equivalent [kg/m²]
+    ['snowDensityLiquidWaterContent', 'SDLWC', 'array'],
+    ['methodOfSnowWaterEquivalentMeasurement', 'MSWE', 'array'],
+    ['snowWaterEquivalent', 'SWE', 'array'],
+]))
+
+# Precipitation observation.
+# 301150, 301089, 001019, 002001, 301011, 301012, 301021, 007030, 007032, 004024, 013011
+register(Sequence('precipitation', [301150, 301089, 1019, 2001, 301011, 301012, 301021,
+                                    7030, 7032, 4024, 13011], ['RR'], [
+    ['wigosIdentifierSeries', 'WSI_IDS', 'array'],
+    ['wigosIssuerOfIdentifier', 'WSI_IDI', 'array'],
+    ['wigosIssueNumber', 'WSI_INR', 'array'],
+    ['wigosLocalIdentifierCharacter', 'WSI_LID', 'string'],
+    ['stateIdentifier', 'STATEID', 'array'],
+    ['nationalStationNumber', 'NSI', 'array'],
+    ['longStationName', 'LONG_STATION_NAME', 'string'],
+    ['stationType', 'STATION_TYPE', 'array'],
+    ['year', 'YYYY', 'array'],
+    ['month', 'MM', 'array'],
+    ['day', 'DD', 'array'],
+    ['hour', 'HH24', 'array'],
+    ['minute', 'MI', 'array'],
+    ['latitude', 'LAT', 'array'],
+    ['longitude', 'LON', 'array'],
+    ['heightOfStationGroundAboveMeanSeaLevel', 'ELSTAT', 'array'],
+        # 007032: Height of the precipitation gauge [m]
+        # 004024: Time period of the precipitation [h], negative = before the observation
+        # 013011: Total precipitation [kg/m²]
+    ['heightOfSensorAboveLocalGroundOrDeckOfMarinePlatform', 'ELRAIN', 'array'],
+    ['timePeriod', 'RR_PERIOD', 'array'],
+    ['totalPrecipitationOrTotalWaterEquivalent', 'RR', 'array'],
+]))
@@ -0,0 +1,86 @@
+"""
+bufr_templates.py keeps a cache of bufr message templates. A template is a message made
+from the sample (edition 4) with the header and the descriptors of a sequence (a list of
+descriptors, see bufr_sequences) already set and packed. New messages are cloned from the
+templates and unpacked, so the sample is not loaded and the header keys and the
+descriptors are not set again for every message.
+The templates are kept by (sequence, number of subsets, compressed data flag) and the
+least recently used template is released when there are more than CACHE_SIZE of them.
+eccodes is imported in the functions, so it is loaded only when a message is made.
+"""
+from collections import OrderedDict
+
+CACHE_SIZE = 32
+MAX_CACHED_SUBSETS = 1000
+templates = OrderedDict()
+
+def set_header(ibufr, nsub, compressed):
+    """
+    Sets the header keys of a bufr message (ibufr) for nsub subsets. compressed is 1 for
+    compressed data and 0 for uncompressed data. The typical date and time are set
+    later for each message.
+    """
+    from eccodes import codes_set
+    codes_set(ibufr, 'edition', 4)
+    codes_set(ibufr, 'masterTableNumber', 0)
+    codes_set(ibufr, 'bufrHeaderCentre', 86)
+    codes_set(ibufr, 'bufrHeaderSubCentre', 0)
+    codes_set(ibufr, 'updateSequenceNumber', 1)
+    codes_set(ibufr, 'dataCategory', 0)
+    codes_set(ibufr, 'internationalDataSubCategory', 0)
+    codes_set(ibufr, 'dataSubCategory', 1)
+    codes_set(ibufr, 'masterTablesVersionNumber', 35)
+    codes_set(ibufr, 'localTablesVersionNumber', 0)
+    codes_set(ibufr, 'observedData', 1)
+    codes_set(ibufr, 'numberOfSubsets', nsub)
+    codes_set(ibufr, 'compressedData', compressed)
+
+def make_message(sequence, nsub, compressed):
+    """
+    Makes a new bufr message from the sample (edition 4) for the sequence (a list of
+    descriptors) with nsub subsets.
+    """
+    from eccodes import codes_bufr_new_from_samples, codes_set_array
+    ibufr = codes_bufr_new_from_samples('BUFR4')
+    set_header(ibufr, nsub, compressed)
+    codes_set_array(ibufr, 'unexpandedDescriptors', list(sequence))
+    return ibufr
+
+def new_message(sequence, nsub, compressed=0):
+    """
+    Returns a new bufr message for the sequence (a list of descriptors) with nsub subsets.
+    The message should be released with codes_release.
+        1. If there is a template for the message, the template is cloned and unpacked.
+        2. If not, the message is made from the sample. It is packed once, so that
+           its data section has all the subsets with missing values, and a clone of
+           it is kept as the template.
+    Unpacking a clone is faster than making the message from the sample only up to
+    about MAX_CACHED_SUBSETS subsets, so bigger messages are always made from the sample.
+    """
+    from eccodes import codes_clone, codes_release, codes_set
+    key = (tuple(sequence), nsub, compressed)
+    if nsub > MAX_CACHED_SUBSETS:
+        return make_message(sequence, nsub, compressed)
+
+    # 1.
+    if key in templates:
+        templates.move_to_end(key)
+        ibufr = codes_clone(templates[key])
+        codes_set(ibufr, 'unpack', 1)
+        return ibufr
+
+    # 2.
+    ibufr = make_message(sequence, nsub, compressed)
+    codes_set(ibufr, 'pack', 1)
+    templates[key] = codes_clone(ibufr)
+    if len(templates) > CACHE_SIZE:
+        codes_release(templates.popitem(last=False)[1])
+    return ibufr
+
+def clear():
+    """
+    Releases all the cached templates.
+    """
+    from eccodes import codes_release
+    while len(templates) > 0:
+        codes_release(templates.popitem()[1])
@@ -0,0 +1,224 @@
+"""
+bulletin_writer.py appends many bufr messages to one bulletin file instead of writing
+each message to its own file.
+Each message can be put into a WMO envelope (Manual on the GTS, WMO-No. 386):
+    nnnnnnnnFF SOH CR CR LF ccc CR CR LF TTAAii CCCC YYGGgg CR CR LF message CR CR LF ETX
+where nnnnnnnn is the length of the envelope from SOH to ETX, FF = 00 is the format
+identifier and ccc is the channel sequence number.
+The bulletin file can be rotated: a new file is started when the current one has
+max_messages messages or when the next message would make it bigger than max_bytes.
+Rotated files are numbered: name_0001.bufr, name_0002.bufr, ...
+An existing bulletin file is appended to, and the numbering of rotated files continues
+after the existing files, so a restarted program does not overwrite earlier bulletins.
+The channel sequence numbers continue from the last envelope of the existing bulletin.
+With the durability levels 'batch' and 'file' (see output_writer), sync syncs the
+bulletin with fsync, so that the messages written so far are kept over a crash.
+"""
+import os
+import output_writer
+
+SOH = b'\x01'
+ETX = b'\x03'
+CRCRLF = b'\r\r\n'
+
+def last_sequence_number(filename):
+    """
+    Returns the channel sequence number of the last WMO envelope in the bulletin file
+    filename, or 0 if the file does not exist or has no envelopes. The envelopes are
+    skipped by their lengths, so only their beginnings are read. Reading stops at the
+    first part which is not an envelope.
+    """
+    sequence_number = 0
+    try:
+        with open(filename, 'rb') as fin:
+            size = os.fstat(fin.fileno()).st_size
+            position = 0
+            while position + 17 <= size:
+                fin.seek(position)
+                start = fin.read(17)
+                length = start[:8]
+                if not length.isdigit() or start[8:14] != b'00' + SOH + CRCRLF or \
+                        not start[14:17].isdigit():
+                    break
+                sequence_number = int(start[14:17])
+                position += 10 + int(length)
+    except OSError:
+        return 0
+    return sequence_number
+
+class BulletinWriter:
+    """
+    This class writes bufr messages to a bulletin file (filename).
+        wmo_envelope: if True, each message is put into a WMO envelope.
+        max_messages: maximum number of messages in one file (0 = no limit).
+        max_bytes: maximum size of one file in bytes (0 = no limit).
+        durability: 'none', 'batch' or 'file' (see output_writer). If it is not
+                    'none', sync and close sync the files with fsync.
+    The messages are kept over a crash only after sync. The writer should be closed
+    after the last message, which syncs it too. It can also be used in a with
+    statement.
+    """
+    def __init__(self, filename, wmo_envelope=False, max_messages=0, max_bytes=0,
+                 durability='none'):
+        self.filename = filename
+        self.wmo_envelope = wmo_envelope
+        self.max_messages = max_messages
+        self.max_bytes = max_bytes
+        self.durability = durability
+        self.new_files = []
+        self.file_number = 0
+        self.fout = None
+        self.messages_in_file = 0
+        self.bytes_in_file = 0
+        self.sequence_number = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        self.close()
+
+    def rotated(self):
+        """
+        Returns True if the bulletin is rotated to numbered files.
+        """
+        return self.max_messages > 0 or self.max_bytes > 0
+
+    def current_filename(self):
+        """
+        Returns the name of the file which is written now. Files are numbered only
+        when they are rotated.
+        """
+        if not self.rotated():
+            return self.filename
+        return self.numbered_filename(self.file_number)
+
+    def numbered_filename(self, file_number):
+        """
+        Returns the name of the rotated file file_number.
+        """
+        name, ending = os.path.splitext(self.filename)
+        return name + '_' + str(file_number).zfill(4) + ending
+
+    def continue_sequence(self):
+        """
+        Continues the sequence numbers of the WMO envelopes from the bulletin which is
+        appended to, or from the last existing rotated file. This is done before the
+        first message, so a restarted program does not repeat the sequence numbers.
+        """
+        if not self.rotated():
+            self.sequence_number = last_sequence_number(self.filename)
+            return
+        last = 0
+        while os.path.exists(self.numbered_filename(last + 1)):
+            last += 1
+        if last > 0:
+            self.sequence_number = last_sequence_number(self.numbered_filename(last))
+
+    def open_next(self):
+        """
+        Closes the current file and opens the next one. A rotated file gets the next
+        number which has no file yet. A bulletin which is not rotated is appended to.
+        """
+        self.close()
+        self.file_number += 1
+        while self.rotated() and os.path.exists(self.current_filename()):
+            self.file_number += 1
+        filename = self.current_filename()
+        if not os.path.exists(filename):
+            self.new_files.append(filename)
+        self.fout = open(filename, 'ab')
+        self.messages_in_file = 0
+        self.bytes_in_file = self.fout.tell()
+
+    def envelope(self, message, heading):
+        """
+        Puts a bufr message (bytes) into a WMO envelope with the abbreviated heading
+        (heading = 'TTAAii CCCC YYGGgg').
+        """
+        self.sequence_number = (self.sequence_number + 1) % 1000
+        body = (SOH + CRCRLF + str(self.sequence_number).zfill(3).encode('ascii') + CRCRLF
+                + heading.encode('ascii') + CRCRLF + message + CRCRLF + ETX)
+        return str(len(body)).zfill(8).encode('ascii') + b'00' + body
+
+    def write(self, message, heading=''):
+        """
+        Appends one bufr message (bytes) to the bulletin. heading is the abbreviated
+        heading, which is needed only with the WMO envelope.
+        Returns the name of the file the message was written to.
+        """
+        if self.wmo_envelope:
+            if self.file_number == 0:
+                self.continue_sequence()
+            message = self.envelope(message, heading)
+        if self.fout is None:
+            self.open_next()
+        elif 0 < self.max_messages <= self.messages_in_file:
+            self.open_next()
+        elif 0 < self.max_bytes < self.bytes_in_file + len(message):
+            self.open_next()
+        self.fout.write(message)
+        self.messages_in_file += 1
+        self.bytes_in_file += len(message)
+        return self.current_filename()
+
+    def write_messages(self, messages, heading=''):
+        """
+        Appends bufr messages (a list of bytes) with the same abbreviated heading to
+        the bulletin. Returns the names of the files the messages were written to.
+        """
+        filenames = []
+        for message in messages:
+            filename = self.write(message, heading)
+            if filename not in filenames:
+                filenames.append(filename)
+        return filenames
+
+    def sync(self):
+        """
+        Writes the buffered messages to the current file. If the durability level is
+        not 'none', the file is synced with fsync, and so are the directories of
+        the files made since the last sync.
+        """
+        if self.fout is not None:
+            self.fout.flush()
+            if self.durability != 'none':
+                os.fsync(self.fout.fileno())
+        if self.durability != 'none' and len(self.new_files) > 0:
+            output_writer.sync_directories(self.new_files)
+        self.new_files = []
+
+    def close(self):
+        """
+        Syncs (see sync) and closes the current file.
+        """
+        if self.fout is not None:
+            try:
+                self.sync()
+            finally:
+                self.fout.close()
+                self.fout = None
+
+def add_bulletin_arguments(parser):
+    """
+    Adds the command line arguments of the bulletin writer to parser
+    (argparse.ArgumentParser).
+    """
+    parser.add_argument('--bulletin', metavar='FILE',
+                        help='append all the messages to bulletin file FILE')
+    parser.add_argument('--wmo-envelope', action='store_true',
+                        help='put each message of the bulletin into a WMO envelope')
+    parser.add_argument('--bulletin-max-messages', type=int, default=0,
+                        help='start a new bulletin file after this many messages')
+    parser.add_argument('--bulletin-max-bytes', type=int, default=0,
+                        help='start a new bulletin file before it gets bigger than this')
+
+def from_arguments(args):
+    """
+    Returns a BulletinWriter made by the parsed command line arguments (args),
+    or None if no bulletin file is given.
+    """
+    if args.bulletin is None:
+        return None
+    return BulletinWriter(args.bulletin, args.wmo_envelope, args.bulletin_max_messages,
+                          args.bulletin_max_bytes, getattr(args, 'durability', 'none'))
@@ -0,0 +1,269 @@
+"""
+encoding_cache.py keeps the results of the encoding in a cache directory, so that an
+input which is delivered again is answered without making the Subset objects or using
+eccodes. The input is still read in the usual way (also by memory mapping), because
+the key is made of the rows which were read.
+
+The key of a cache entry is a hash of the parsed input (the naming information, the
+keys and the value columns, see rain2bufr.read_input) and of the options which change
+the messages (KEY_OPTIONS). The columns are hashed in the order of the key names and
+the rows in the order of their values, and the numbers are hashed as floats, so a
+retried delivery with the same rows is the same input even if its white space, row
+order or column order or its type (.dat or .csv) differs. Then the stored messages
+have the subsets in the order of the first delivery. In quarantine the row numbers
+and the rows dropped while reading are a part of the key, because the quarantine
+report refers to them. The station keys filled in from a station registry are in
+the columns, so they are in the key too. Each entry is one file (key.entry) with
+the result of rain2bufr.encode_groups. The output directory is not stored, it is
+taken from the options when the entry is used.
+
+An entry file is not a Python object, so an entry written by another user of a shared
+directory can not run code. The file is:
+    header length:  4 bytes, big-endian unsigned integer
+    header:         JSON text (UTF-8) {"version", "groups" ([output name, heading,
+                    [length of each message]] of each group), "quarantine" (null or
+                    {"input_name", "row_numbers", "entries"}), "subsets"}
+    messages:       the bufr messages of all the groups one after another
+An entry which does not follow the format is treated as missing.
+
+The size of the directory is kept under max_bytes: when it grows bigger, the least
+recently used entries (the oldest modification times) are removed. Using an entry
+updates its modification time. Several processes can use the same directory: the
+entries are written to a temporary file and renamed, so a reader never sees half an
+entry.
+"""
+import hashlib
+import json
+import os
+import struct
+import tempfile
+import numpy as np
+import errors
+
+# Change this when the format of the entries or the encoding changes, so that the
+# old entries are not used.
+CACHE_VERSION = 4
+# Options which change the encoded messages or the quarantine.
+KEY_OPTIONS = ('max_subsets', 'max_bytes', 'compressed', 'sort_by_station', 'sequence',
+               'on_error', 'group_by_time')
+ENTRY_ENDING = '.entry'
+HEADER_LENGTH = struct.Struct('>I')
+# When the directory is cleaned, it is made this much smaller than max_bytes, so that
+# it is not cleaned again after every new entry.
+EVICT_TO = 0.9
+
+# Open caches of this process by directory.
+CACHES = {}
+
+def open_cache(options):
+    """
+    Returns the cache (EncodingCache) of options['cache_dir'], or None if the
+    directory is not given. The cache is opened once in each process.
+    """
+    directory = options.get('cache_dir', '')
+    if directory == '':
+        return None
+    if directory not in CACHES:
+        CACHES[directory] = EncodingCache(directory, options.get('cache_max_bytes', 0))
+    return CACHES[directory]
+
+def normalize(column):
+    """
+    Returns the values of a column as a NumPy array: numbers as floats and the other
+    values as texts. A float array is returned as it is, without copying it.
+    """
+    if isinstance(column, np.ndarray) and column.dtype.kind in 'fiu':
+        return column.astype(np.float64, copy=False)
+    if all(isinstance(value, float) for value in column):
+        return np.asarray(column, dtype=np.float64)
+    return np.asarray([str(value) for value in column], dtype=str)
+
+def cache_key(output, keys, columns, options, quarantine=None):
+    """
+    Returns the key of the parsed input (output, keys, columns, see
+    rain2bufr.read_input) encoded with options. In quarantine (quarantine, see
+    errors.Quarantine) the last column has the row numbers and the rows dropped while
+    reading are in the quarantine.
+        1. The settings, the naming information and the dropped rows are hashed.
+        2. The columns are normalized and sorted by their key names. The rows are
+           sorted by their values (texts by their order in the column).
+        3. The columns are hashed one at a time in the order of the rows.
+    """
+    # 1.
+    digest = hashlib.sha256()
+    settings = [CACHE_VERSION, list(output)] + [options[name] for name in KEY_OPTIONS]
+    settings.append(None if quarantine is None else quarantine.entries)
+    digest.update(repr(settings).encode('utf8'))
+
+    # 2.
+    names = list(keys) + ['row number'] * (len(columns) - len(keys))
+    order = sorted(range(0, len(columns)), key=lambda index: names[index])
+    values = [normalize(columns[index]) for index in order]
+    sort_keys = []
+    for column in values:
+        if column.dtype.kind == 'U':
+            column = np.unique(column, return_inverse=True)[1]
+        sort_keys.append(column)
+    rows = np.lexsort(sort_keys[::-1]) if len(sort_keys) > 0 else np.array([], dtype=int)
+
+    # 3.
+    for index, column in zip(order, values):
+        digest.update(b'\0' + names[index].encode('utf8') + b'\0')
+        column = column[rows]
+        if column.dtype.kind == 'U':
+            digest.update('\0'.join(column.tolist()).encode('utf8'))
+        else:
+            digest.update(column.tobytes())
+    return digest.hexdigest()
+
+def pack_entry(groups, subsets):
+    """
+    Returns the entry file (bytes) of the result of rain2bufr.encode_groups (groups)
+    with the number of encoded subsets.
+    """
+    quarantine = groups[0][3]
+    if quarantine is not None:
+        quarantine = {'input_name': quarantine.input_name,
+                      'row_numbers': [int(number) for number in quarantine.row_numbers],
+                      'entries': [[int(number), message]
+                                  for number, message in quarantine.entries]}
+    header = {'version': CACHE_VERSION,
+              'groups': [[os.path.basename(output_filename), heading,
+                          [len(message) for message in messages]]
+                         for output_filename, heading, messages, _ in groups],
+              'quarantine': quarantine, 'subsets': subsets}
+    header = json.dumps(header).encode('utf8')
+    return b''.join([HEADER_LENGTH.pack(len(header)), header] +
+                    [message for group in groups for message in group[2]])
+
+def unpack_entry(content):
+    """
+    Returns the entry {'groups' ([output name, heading, messages] of each group),
+    'quarantine' (errors.Quarantine or None), 'subsets'} of an entry file (content,
+    bytes). Raises ValueError if the file does not follow the format.
+    """
+    # 1. The header
+    if len(content) < HEADER_LENGTH.size:
+        raise ValueError('short entry')
+    start = HEADER_LENGTH.size + HEADER_LENGTH.unpack_from(content)[0]
+    header = json.loads(content[HEADER_LENGTH.size:start].decode('utf8'))
+    if header['version'] != CACHE_VERSION:
+        raise ValueError('wrong version')
+
+    # 2. The messages of each group
+    groups = []
+    for output_name, heading, lengths in header['groups']:
+        if output_name != os.path.basename(output_name) or output_name.startswith('.'):
+            raise ValueError('wrong output name')
+        messages = []
+        for length in lengths:
+            message = content[start:start + length]
+            if len(message) != length or not message.startswith(b'BUFR') or \
+                    not message.endswith(b'7777'):
+                raise ValueError('wrong message')
+            messages.append(message)
+            start += length
+        groups.append([output_name, heading, messages])
+    if start != len(content) or len(groups) == 0:
+        raise ValueError('wrong length')
+
+    # 3. The quarantine
+    quarantine = header['quarantine']
+    if quarantine is not None:
+        quarantine = errors.Quarantine(str(quarantine['input_name']))
+        quarantine.row_numbers = [int(number) for number in header['quarantine']['row_numbers']]
+        quarantine.entries = [[int(number), str(message)]
+                              for number, message in header['quarantine']['entries']]
+    return {'groups': groups, 'quarantine': quarantine, 'subsets': int(header['subsets'])}
+
+class EncodingCache:
+    """
+    This class is the cache directory (directory) of at most max_bytes bytes
+    (0 = no limit).
+        get returns the entry of a key, or None if there is no entry.
+        put stores a new entry and removes the least recently used ones if the
+        directory is too big.
+    hits and misses count the calls of get.
+    """
+    def __init__(self, directory, max_bytes=0):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(directory, exist_ok=True)
+        self.size = sum(size for _, size, _ in self.entries())
+
+    def path(self, key):
+        """
+        Returns the file name of the entry of key.
+        """
+        return os.path.join(self.directory, key + ENTRY_ENDING)
+
+    def get(self, key):
+        """
+        Returns the entry of key: {'groups' ([output name, heading, messages] of each
+        group), 'quarantine', 'subsets'} or None. An entry which can not be read is
+        treated as missing.
+        """
+        path = self.path(key)
+        try:
+            with open(path, 'rb') as fin:
+                entry = unpack_entry(fin.read())
+            os.utime(path)
+        except (OSError, ValueError, KeyError, TypeError):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return entry
+
+    def put(self, key, groups, subsets):
+        """
+        Stores the result of rain2bufr.encode_groups (groups) with the number of
+        encoded subsets as the entry of key.
+        """
+        content = pack_entry(groups, subsets)
+        fd, temp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as fout:
+                fout.write(content)
+            self.size += os.path.getsize(temp_path)
+            os.replace(temp_path, self.path(key))
+        except OSError:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        if self.max_bytes > 0 and self.size > self.max_bytes:
+            self.evict()
+
+    def entries(self):
+        """
+        Returns [file name, size, modification time] of each entry in the directory.
+        """
+        entries = []
+        with os.scandir(self.directory) as scan:
+            for item in scan:
+                if not item.name.endswith(ENTRY_ENDING):
+                    continue
+                try:
+                    stat = item.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append([item.path, stat.st_size, stat.st_mtime])
+        return entries
+
+    def evict(self):
+        """
+        Removes the least recently used entries until the directory is smaller than
+        EVICT_TO * max_bytes. The size is counted again from the directory, because
+        other processes may have added and removed entries.
+        """
+        entries = sorted(self.entries(), key=lambda entry: entry[2])
+        self.size = sum(entry[1] for entry in entries)
+        for path, size, _ in entries:
+            if self.size <= EVICT_TO * self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            self.size -= size
@@ -0,0 +1,297 @@
+#!/usr/bin/env python3
+
+"""
+encoding_server.py is a resident HTTP service which encodes the data sent to it.
+The process stays alive between the requests, so eccodes is loaded only once and no
+temporary files are written.
+Run program by command: python3 encoding_server.py --port 8080
+or on a local socket:   python3 encoding_server.py --unix /path/to/socket
+
+Requests:
+    POST /encode?type=dat   body: the text of a .dat file (type=csv for csv data)
+        200: the bufr messages (application/x-bufr). The suggested file name is in
+             Content-Disposition and the number of quarantined rows in
+             X-Quarantined-Rows.
+        400: the data could not be encoded, the body has the error message.
+        413: the body is bigger than --max-body-bytes.
+        500: the encoding failed for another reason, the body has the error message.
+        503: there are already --max-pending requests waiting, try again later.
+    GET /health
+        200: "ok"
+The encoding options of the command line (see rain2bufr.OPTIONS) can be changed for
+one request by query parameters, for example /encode?type=csv&compressed=1&max_subsets=500.
+A client can send several requests on the same connection.
+
+For example: curl --data-binary @data.dat -o out.bufr http://127.0.0.1:8080/encode
+"""
+import argparse
+import asyncio
+import io
+import os
+import signal
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from urllib.parse import parse_qs, urlsplit
+import errors
+import rain2bufr
+
+# Encoding options which can be given as query parameters, and their types.
+QUERY_OPTIONS = {
+    'compressed': bool,
+    'sort_by_station': bool,
+    'group_by_time': bool,
+    'max_subsets': int,
+    'max_bytes': int,
+    'sequence': str,
+    'on_error': str,
+}
+MAX_HEADER_BYTES = 65536
+CHUNK_SIZE = 65536
+REASONS = {
+    200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+    411: 'Length Required', 413: 'Payload Too Large', 500: 'Internal Server Error',
+    503: 'Service Unavailable',
+}
+
+def encode_payload(payload, type_of_data, options):
+    """
+    This function encodes one request body (payload, bytes) in a worker process.
+    Returns [status, suggested output filename, bufr messages (bytes), number of
+    quarantined rows, error message]. The status is 200 if the encoding succeeds, 400
+    if the data is wrong and 500 if the encoding fails for another reason.
+    """
+    try:
+        input_file = io.StringIO(payload.decode('utf8'))
+        output_filename, _, messages, quarantine = rain2bufr.encode_messages(
+            input_file, type_of_data, options)
+    except UnicodeDecodeError:
+        return [400, '', b'', 0, 'Data should be UTF-8 text.\n']
+    except errors.RainToBufrError as err:
+        return [400, '', b'', 0, str(err)]
+    except Exception as err:
+        return [500, '', b'', 0, type(err).__name__ + ': ' + str(err) + '\n']
+    quarantined = 0 if quarantine is None else len(quarantine.entries)
+    return [200, os.path.basename(output_filename), b''.join(messages), quarantined, '']
+
+def request_options(options, query):
+    """
+    Returns the encoding options updated with the query parameters (query, see
+    QUERY_OPTIONS). Raises ValueError if a value is wrong.
+    """
+    request = dict(options)
+    for name, values in parse_qs(query).items():
+        if name not in QUERY_OPTIONS:
+            continue
+        value = values[-1]
+        if QUERY_OPTIONS[name] is bool:
+            request[name] = value.lower() in ('1', 'true', 'yes')
+        else:
+            request[name] = QUERY_OPTIONS[name](value)
+    return request
+
+class EncodingServer:
+    """
+    This class serves the encoding requests.
+        1. handle reads the requests of a connection one by one.
+        2. encode runs the encoding in a pool of worker processes (workers). At most
+           workers requests are encoded at the same time, and at most max_pending
+           requests are waiting for a free worker. When all the workers are busy and
+           max_pending requests are waiting, more requests get the answer 503, so a
+           busy server does not collect an endless queue.
+        3. The bufr messages are sent back in chunks. Each chunk is sent only when
+           the client has read the earlier ones.
+    Bodies bigger than max_body_bytes are not read.
+    """
+    def __init__(self, options, workers, max_pending=100, max_body_bytes=64 * 1024 * 1024):
+        self.options = rain2bufr.get_options(options)
+        self.workers = max(1, workers)
+        self.max_pending = max_pending
+        self.max_body_bytes = max_body_bytes
+        self.waiting = 0
+        self.semaphore = None
+        self.executor = None
+
+    # 1.
+    async def handle(self, reader, writer):
+        """
+        Reads the requests of one connection (reader, writer) and answers them until
+        the client closes the connection or asks to close it.
+        """
+        try:
+            keep_alive = True
+            while keep_alive:
+                request = await self.read_request(reader, writer)
+                if request is None:
+                    break
+                method, target, headers, status, body = request
+                keep_alive = headers.get('connection', '').lower() != 'close' and status != 413
+                if status == 200:
+                    status, response_headers, body = await self.answer(method, target,
+                                                                       headers, body)
+                else:
+                    response_headers, body = self.text_answer(REASONS[status] + '\n')
+                await self.send(writer, status, response_headers, body, keep_alive)
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.LimitOverrunError,
+                ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def read_request(self, reader, writer):
+        """
+        Reads one request. Returns [method, target, headers, status, body], where status
+        is 200 if the request can be answered, or None if the connection was closed.
+        A client which asks "Expect: 100-continue" sends the body only after the size
+        has been accepted.
+        """
+        request_line = await reader.readline()
+        if request_line == b'':
+            return None
+        method, target, _ = request_line.decode('latin-1').split(' ', 2)
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, value = line.decode('latin-1').split(':', 1)
+            headers[name.strip().lower()] = value.strip()
+
+        if method != 'POST':
+            return [method, target, headers, 200, b'']
+        if 'content-length' not in headers:
+            return [method, target, headers, 411, b'']
+        length = int(headers['content-length'])
+        if length > self.max_body_bytes:
+            return [method, target, headers, 413, b'']
+        if headers.get('expect', '').lower() == '100-continue':
+            writer.write(b'HTTP/1.1 100 Continue\r\n\r\n')
+            await writer.drain()
+        body = await reader.readexactly(length)
+        return [method, target, headers, 200, body]
+
+    async def answer(self, method, target, headers, body):
+        """
+        Answers a request. Returns [status, response headers, response body].
+        """
+        url = urlsplit(target)
+        if url.path == '/health':
+            return [200] + self.text_answer('ok\n')
+        if url.path != '/encode':
+            return [404] + self.text_answer(REASONS[404] + '\n')
+        if method != 'POST':
+            return [405] + self.text_answer(REASONS[405] + '\n')
+        try:
+            options = request_options(self.options, url.query)
+        except ValueError as err:
+            return [400] + self.text_answer('Wrong query parameter: ' + str(err) + '\n')
+        type_of_data = parse_qs(url.query).get('type', ['dat'])[-1]
+        if headers.get('content-type', '').startswith('text/csv'):
+            type_of_data = 'csv'
+
+        if self.semaphore.locked() and self.waiting >= self.max_pending:
+            response_headers, text = self.text_answer('Too many requests waiting.\n')
+            return [503, response_headers + [['Retry-After', '1']], text]
+        status, name, messages, quarantined, error = await self.encode(body, type_of_data,
+                                                                       options)
+        if status != 200:
+            return [status] + self.text_answer(error)
+        return [200, [['Content-Type', 'application/x-bufr'],
+                      ['Content-Disposition', 'attachment; filename="' + name + '"'],
+                      ['X-Quarantined-Rows', str(quarantined)]], messages]
+
+    # 2.
+    async def encode(self, payload, type_of_data, options):
+        """
+        Encodes a request body (payload) by encode_payload in the worker pool. The
+        requests which wait for a free worker are counted in waiting. If the worker
+        pool fails (for example a worker process is killed), the answer is 500 and a
+        new pool is started.
+        """
+        self.waiting += 1
+        try:
+            await self.semaphore.acquire()
+        finally:
+            self.waiting -= 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.executor, encode_payload, payload,
+                                              type_of_data, options)
+        except Exception as err:
+            if isinstance(err, BrokenProcessPool):
+                self.executor.shutdown(wait=False)
+                self.executor = ProcessPoolExecutor(max_workers=self.workers)
+            return [500, '', b'', 0, type(err).__name__ + ': ' + str(err) + '\n']
+        finally:
+            self.semaphore.release()
+
+    # 3.
+    async def send(self, writer, status, headers, body, keep_alive):
+        """
+        Sends an answer with status, headers ([name, value] pairs) and body (bytes).
+        """
+        head = 'HTTP/1.1 ' + str(status) + ' ' + REASONS[status] + '\r\n'
+        for name, value in headers + [['Content-Length', str(len(body))],
+                                      ['Connection', 'keep-alive' if keep_alive else 'close']]:
+            head = head + name + ': ' + value + '\r\n'
+        writer.write((head + '\r\n').encode('latin-1'))
+        for start in range(0, len(body), CHUNK_SIZE):
+            writer.write(body[start:start + CHUNK_SIZE])
+            await writer.drain()
+        await writer.drain()
+
+    def text_answer(self, text):
+        """
+        Returns [headers, body] of a plain text answer.
+        """
+        return [[['Content-Type', 'text/plain; charset=utf-8']], text.encode('utf8')]
+
+    async def serve(self, host='127.0.0.1', port=8080, unix_path=None):
+        """
+        Serves the requests on host:port, or on the local socket unix_path if it is
+        given, until SIGTERM or SIGINT. The requests which are already being encoded
+        are finished before the worker pool is closed.
+        """
+        self.semaphore = asyncio.Semaphore(self.workers)
+        self.executor = ProcessPoolExecutor(max_workers=self.workers)
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(signum, stop.set)
+        if unix_path is not None:
+            server = await asyncio.start_unix_server(self.handle, unix_path,
+                                                     limit=MAX_HEADER_BYTES)
+        else:
+            server = await asyncio.start_server(self.handle, host, port,
+                                                limit=MAX_HEADER_BYTES)
+        print('encoding server listening on', unix_path or host + ':' + str(port), flush=True)
+        async with server:
+            await stop.wait()
+        self.executor.shutdown(wait=True)
+        if unix_path is not None and os.path.exists(unix_path):
+            os.remove(unix_path)
+
+def main():
+    """
+    Main function gets the address and the other settings from command line and runs
+    the server.
+    """
+    parser = argparse.ArgumentParser(description='Encodes data sent over HTTP to bufr.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--unix', metavar='PATH', help='listen on a local socket instead')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                        help='number of worker processes')
+    parser.add_argument('--max-pending', type=int, default=100,
+                        help='maximum number of requests waiting for a worker')
+    parser.add_argument('--max-body-bytes', type=int, default=64 * 1024 * 1024,
+                        help='maximum size of a request body')
+    rain2bufr.add_encoding_arguments(parser)
+    args = parser.parse_args()
+
+    server = EncodingServer(rain2bufr.options_from_arguments(args), args.workers,
+                            args.max_pending, args.max_body_bytes)
+    asyncio.run(server.serve(args.host, args.port, args.unix))
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,76 @@
+"""
+errors.py has the exceptions of the encoding and the quarantine of the bad data rows.
+The modules raise these exceptions instead of stopping the program, so that a batch
+run or the daemon can go on with the other files. The text of an exception is the
+error message which is shown to the user.
+
+What happens to a bad data row depends on options['on_error'] (see rain2bufr.OPTIONS):
+    'reject':     the whole input file is rejected (RowError is raised).
+    'quarantine': the bad rows are dropped to a Quarantine and the good rows are encoded.
+"""
+
+class RainToBufrError(Exception):
+    """
+    Base class of the errors of the encoding.
+    """
+
+class InputError(RainToBufrError):
+    """
+    Error in the input file as a whole: the file name row, the key names, an unknown data
+    type or no data at all. The file can not be encoded.
+    """
+
+class RowError(RainToBufrError):
+    """
+    Error in data rows. rows is a list of the rows with the error: row numbers of the
+    input file when raised by the readers, and indices of the values when raised by
+    rain_values. reason is a short form of the message for the quarantine report.
+    """
+    def __init__(self, message, rows, reason=None):
+        super().__init__(message)
+        self.rows = rows
+        self.reason = reason or message
+
+    def __reduce__(self):
+        # The error is sent from the worker processes, so it must be picklable
+        # with all its arguments.
+        return (self.__class__, (self.args[0], self.rows, self.reason))
+
+class OptionError(RainToBufrError):
+    """
+    Error in the encoding options, for example an unknown bufr sequence.
+    """
+
+class EncodingError(RainToBufrError):
+    """
+    Error in making the bufr message by eccodes.
+    """
+
+class Quarantine:
+    """
+    This class collects the data rows of an input (input_name) which are dropped
+    because of an error.
+        row_numbers: row numbers of the input file of the accepted data rows, in the
+                     same order as the data rows. It is filled by the readers.
+        entries:     [row number, error message] of each dropped row.
+    """
+    def __init__(self, input_name=''):
+        self.input_name = input_name
+        self.row_numbers = []
+        self.entries = []
+
+    def add(self, row_number, message):
+        """
+        Adds a dropped row (row_number) with its error message to the quarantine.
+        """
+        self.entries.append([int(row_number), message.strip()])
+
+    def report(self):
+        """
+        Returns the quarantine report: one line for each dropped row in the order of
+        the row numbers.
+        """
+        lines = ['Quarantined rows of ' + self.input_name + ': ' + str(len(self.entries))]
+        for row_number, message in sorted(self.entries, key=lambda entry: entry[0]):
+            lines.append('row ' + str(row_number) + ': ' + message.replace('\n', ' '))
+        return '\n'.join(lines) + '\n'
@@ -0,0 +1,79 @@
+"""
+key_schema.py tells how each key of the input data is converted to a column of a Subset
+object (see rain_values). Each key has one entry in SCHEMA:
+    attribute:  name of the Subset attribute (for WSI a list of four attributes)
+    kind:       'int', 'float', 'text', 'wigos' (WIGOS identifier) or 'raw' (kept as it is)
+    conversion: unit conversion of the float values (a key of CONVERSIONS) or None
+    valid:      [minAllowed, maxAllowed] after the conversion, or None. Values out of
+                the range are set to be missing.
+    bufr_key:   the bufr key which the values end up in, directly or through the values
+                made of them (see rain_values), or None if the key is not encoded.
+                The columns of the bufr sequences are checked against it (see
+                bufr_sequences.check_columns).
+A new key needs only a new entry here. Keys which are not in SCHEMA are not encoded.
+The keys of an input are compiled to a conversion plan (conversion_plan), which is
+cached, so the schema is looked through only once for each set of input keys.
+"""
+import collections
+import functools
+
+KeySpec = collections.namedtuple('KeySpec', ['attribute', 'kind', 'conversion', 'valid', 'bufr_key'])
+
+CONVERSIONS = {
+    'cm_to_m': lambda values: values * 0.010,
+    'celsius_to_kelvin': lambda values: values + 273.15,
+}
+
+SCHEMA = {
+    'TTAAII': KeySpec('TTAAII', 'raw', None, None, None),
+    'ELGROUND': KeySpec('ELGROUND', 'float', None, None, None),
+    'ELSNOW': KeySpec('ELSNOW', 'float', None, [0.0, 655.35],
+                      'heightOfSensorAboveLocalGroundOrDeckOfMarinePlatform'),
+    'ELSTAT': KeySpec('ELSTAT', 'float', None, [-400.0, 12707.1],
+                      'heightOfStationGroundAboveMeanSeaLevel'),
+    'ELTERM': KeySpec('ELTERM', 'float', None, [0.0, 655.35], None),
+    'ELRAIN': KeySpec('ELRAIN', 'float', None, [0.0, 655.35],
+                      'heightOfSensorAboveLocalGroundOrDeckOfMarinePlatform'),
+    'LAT': KeySpec('LAT', 'float', None, [-90.0, 245.544], 'latitude'),
+    'LON': KeySpec('LON', 'float', None, [-180.0, 491.089], 'longitude'),
+    'NSI': KeySpec('NSI', 'int', None, [0, 1073740000], 'nationalStationNumber'),
+    'STATION_NAME': KeySpec('LONG_STATION_NAME', 'text', None, None, 'longStationName'),
+    'STATION_TYPE': KeySpec('STATION_TYPE', 'int', None, [0, 3], 'stationType'),
+    'DD': KeySpec('DD', 'int', None, [1, 31], 'day'),
+    'GROUND': KeySpec('GROUND', 'int', None, [0, 31], 'stateOfGround'),
+    'GROUND06': KeySpec('GROUND06', 'int', None, [0, 31], 'stateOfGround'),
+    'HH24': KeySpec('HH24', 'int', None, [0, 23], 'hour'),
+    'MI': KeySpec('MI', 'int', None, [0, 60], 'minute'),
+    'MM': KeySpec('MM', 'int', None, [1, 12], 'month'),
+    'METHODSNOW': KeySpec('METHODSNOW', 'int', None, [0, 15], 'methodOfSnowDepthMeasurement'),
+    'MSWE': KeySpec('MSWE', 'int', None, [0, 63], 'methodOfSnowWaterEquivalentMeasurement'),
+    'SNOW06': KeySpec('SNOW06', 'float', 'cm_to_m', [-0.01, 655.33], 'totalSnowDepth'),
+    'SNOW18': KeySpec('SNOW18', 'float', 'cm_to_m', [-0.01, 655.33], 'totalSnowDepth'),
+    'SNOW_MAN': KeySpec('SNOW_MAN', 'float', 'cm_to_m', [-0.01, 655.33], 'totalSnowDepth'),
+    'SNOW_AWS': KeySpec('SNOW_AWS', 'float', 'cm_to_m', [-0.01, 655.33], 'totalSnowDepth'),
+    'SNOW': KeySpec('SNOW', 'float', 'cm_to_m', [-0.01, 655.33], 'totalSnowDepth'),
+    'RR': KeySpec('RR', 'float', None, [-0.1, 1638.2], 'totalPrecipitationOrTotalWaterEquivalent'),
+    'RR_PERIOD': KeySpec('RR_PERIOD', 'int', None, [-2048, 2047], 'timePeriod'),
+    'SWE': KeySpec('SWE', 'float', None, None, 'snowWaterEquivalent'),
+    'T': KeySpec('T', 'float', 'celsius_to_kelvin', [0.0, 655.35], 'airTemperature'),
+    'WMO': KeySpec('WMO', 'int', None, None, None),
+    'WSI': KeySpec(['WSI_IDS', 'WSI_IDI', 'WSI_INR', 'WSI_LID'], 'wigos', None, None,
+                   ['wigosIdentifierSeries', 'wigosIssuerOfIdentifier', 'wigosIssueNumber',
+                    'wigosLocalIdentifierCharacter']),
+    'YYYY': KeySpec('YYYY', 'int', None, [0, 4095], 'year'),
+}
+
+@functools.lru_cache(maxsize=64)
+def conversion_plan(keys):
+    """
+    Compiles the keys of an input (keys, a tuple) to a conversion plan: a tuple of
+    [column index, KeySpec] for each key which is in SCHEMA. If a key is given
+    several times, its first column is used.
+    """
+    plan = []
+    seen = set()
+    for index, key in enumerate(keys):
+        if key in SCHEMA and key not in seen:
+            seen.add(key)
+            plan.append((index, SCHEMA[key]))
+    return tuple(plan)
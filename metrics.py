@@ -0,0 +1,134 @@
+"""
+metrics.py measures the wall time and the peak memory of each stage of the encoding.
+The measurements of one input are kept in a record (dictionary):
+    {'input': name of the input, 'stages': {stage: {'seconds', 'peak_bytes', 'calls'}},
+     'subsets': number of subsets, 'messages': number of messages,
+     'output_bytes': size of the messages, 'cache_hit': True if the result was taken
+     from the encoding cache, 'total_seconds', 'max_rss_kb'}
+Peak memory is measured by tracemalloc, so it covers the memory allocated by Python.
+Memory allocated by eccodes is seen only in max_rss_kb, which is the peak resident
+memory of the whole process.
+The functions accept None as a record and then measure nothing.
+"""
+import contextlib
+import json
+import resource
+import sys
+import time
+import tracemalloc
+
+STAGES = ['cache', 'parse', 'key_check', 'pivot', 'group', 'subset', 'encode', 'verify', 'write']
+
+def new_record(input_name):
+    """
+    Makes a new record for input_name and starts tracing the memory allocations.
+    """
+    if not tracemalloc.is_tracing():
+        tracemalloc.start()
+    return {'input': input_name, 'stages': {}, 'subsets': 0, 'messages': 0,
+            'output_bytes': 0, 'cache_hit': False, 'total_seconds': 0.0, 'max_rss_kb': 0}
+
+@contextlib.contextmanager
+def stage(record, name):
+    """
+    Measures the code in the with block as the stage name of record. If the same
+    stage is measured several times (for example once per message), the times are
+    added together and the biggest peak is kept.
+    If the memory is not traced in this process (the record was made in a worker
+    process, for example the 'write' stage of batch_encoding), it is traced during
+    the stage.
+    """
+    if record is None:
+        yield
+        return
+    started = not tracemalloc.is_tracing()
+    if started:
+        tracemalloc.start()
+    tracemalloc.reset_peak()
+    start_memory = tracemalloc.get_traced_memory()[0]
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1] - start_memory
+        entry = record['stages'].setdefault(name, {'seconds': 0.0, 'peak_bytes': 0, 'calls': 0})
+        entry['seconds'] += seconds
+        entry['peak_bytes'] = max(entry['peak_bytes'], peak)
+        entry['calls'] += 1
+        if started:
+            tracemalloc.stop()
+
+def add_stages(record, stages):
+    """
+    Adds the stages measured in another process (stages, see record['stages']) to
+    record. The times of parallel workers are added together, so the total time is
+    the time used by all the processes, not the wall time.
+    """
+    if record is None or stages is None:
+        return
+    for name, other in stages.items():
+        entry = record['stages'].setdefault(name, {'seconds': 0.0, 'peak_bytes': 0, 'calls': 0})
+        entry['seconds'] += other['seconds']
+        entry['peak_bytes'] = max(entry['peak_bytes'], other['peak_bytes'])
+        entry['calls'] += other['calls']
+
+def finish(record):
+    """
+    Sets the total time and the peak memory of the process to record. It can be called
+    again when more stages have been measured, for example in another process.
+    """
+    if record is None:
+        return
+    record['total_seconds'] = sum(entry['seconds'] for entry in record['stages'].values())
+    record['max_rss_kb'] = max(record['max_rss_kb'],
+                               resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+
+def print_summary(records, file=sys.stderr):
+    """
+    Prints the time and the peak memory of each stage of each record.
+    """
+    for record in records:
+        print('profile:', record['input'], '-', record['subsets'], 'subsets,',
+              record['messages'], 'messages,', record['output_bytes'], 'bytes,',
+              format(record['total_seconds'], '.4f'), 's,',
+              record['max_rss_kb'], 'kB max RSS', '(cache hit)' if record['cache_hit'] else '',
+              file=file)
+        for name in STAGES:
+            if name in record['stages']:
+                entry = record['stages'][name]
+                print('   ', name.ljust(10), format(entry['seconds'], '.4f').rjust(10), 's',
+                      str(entry['peak_bytes'] // 1024).rjust(10), 'kB peak', file=file)
+
+def write_json(records, filename):
+    """
+    Writes the records to a JSON file (filename).
+    """
+    with open(filename, 'w', encoding='utf8') as fout:
+        json.dump(records, fout, indent=1)
+
+def add_profile_arguments(parser):
+    """
+    Adds the command line arguments of the measurements to parser
+    (argparse.ArgumentParser).
+    """
+    parser.add_argument('--profile', action='store_true',
+                        help='print the time and the peak memory of each stage')
+    parser.add_argument('--metrics-json', metavar='PATH',
+                        help='write the time and the peak memory of each stage to PATH')
+
+def profiling(args):
+    """
+    Returns True if the parsed command line arguments (args) ask for measurements.
+    """
+    return args.profile or args.metrics_json is not None
+
+def report(records, args):
+    """
+    Prints the records and/or writes them to a JSON file as the parsed command line
+    arguments (args) ask.
+    """
+    if args.profile:
+        print_summary(records)
+    if args.metrics_json is not None:
+        write_json(records, args.metrics_json)
@@ -0,0 +1,10 @@
+"""
+missing_values.py has the missing values of eccodes as constants, so that the modules
+which only read and check the data do not need to import eccodes. The values are the
+same as eccodes.CODES_MISSING_LONG and eccodes.CODES_MISSING_DOUBLE.
+"""
+
+# Missing value of integer keys.
+CODES_MISSING_LONG = 2147483647
+# Missing value of float keys.
+CODES_MISSING_DOUBLE = -1e+100
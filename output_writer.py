@@ -0,0 +1,226 @@
+"""
+output_writer.py writes the output files so that a reader never sees half of a file:
+each file is written to a temporary file in the same directory
+(".name.process.number.tmp") and renamed to its final name when it is complete.
+Renaming is atomic, so the file appears at once.
+
+How much is done to keep the files over a crash of the machine is set by the
+durability level (DURABILITY_LEVELS):
+    none:  the files are renamed right after writing, without fsync. A crash can leave
+           an empty or a partial file, but a running reader never sees one.
+    batch: group commit. The written files wait (closed) until commit is called,
+           usually when commit_files of them have been collected (full). Then all of
+           them are synced with fsync at the same time in SYNC_THREADS threads,
+           renamed, and each of their directories is synced once. A file appears only
+           when its group is committed. The files can be given an owner (for example
+           the input file they were encoded from, see start): commit returns the
+           owners whose files could not be committed, and the files of such an owner
+           are removed, so the owners are not mixed up with each other.
+    file:  each file is synced, renamed and its directory synced before the next file
+           is written. This is the safest and the slowest level.
+The temporary files of a process which crashed before the commit are left in the
+directory and can be removed.
+"""
+import os
+from concurrent.futures import ThreadPoolExecutor
+import errors
+
+DURABILITY_LEVELS = ('none', 'batch', 'file')
+# Number of threads which run the fsyncs of a group commit. On network storage the
+# fsyncs wait mostly for the server, so several of them can be waited at once.
+SYNC_THREADS = 8
+
+def from_options(options):
+    """
+    Returns an OutputWriter with the durability level and the group size of the
+    encoding options (options['durability'], options['commit_files']).
+    """
+    return OutputWriter(options['durability'], options['commit_files'])
+
+def directory_of(filename):
+    """
+    Returns the absolute path of the directory of filename.
+    """
+    return os.path.dirname(os.path.abspath(filename))
+
+def sync_path(path):
+    """
+    Syncs the file or directory path with fsync.
+    """
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+def sync_file(path):
+    """
+    Syncs the file path. Returns None, or the error (OSError) if the sync fails.
+    """
+    try:
+        sync_path(path)
+    except OSError as err:
+        return OSError(err.errno, err.strerror, path)
+    return None
+
+def sync_directories(filenames):
+    """
+    Syncs the directories of the files (filenames) once each, so that the renames are
+    kept over a crash.
+    """
+    for directory in sorted(set(directory_of(name) for name in filenames)):
+        sync_path(directory)
+
+def remove_file(path):
+    """
+    Removes the file path if it exists.
+    """
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+class OutputWriter:
+    """
+    This class writes output files with the durability level (durability, see the
+    beginning of the module). On level 'batch', the files wait for commit, which
+    should be called when full returns True (commit_files files are waiting).
+        start sets the owner of the next files.
+        write writes one file.
+        commit renames the files which are waiting (level 'batch').
+        discard removes the waiting files of an owner or all of them.
+    The writer should be closed after the last file, which commits the rest of the
+    files and raises the error if some of them could not be committed. It can also be
+    used in a with statement.
+    """
+    def __init__(self, durability='none', commit_files=64):
+        if durability not in DURABILITY_LEVELS:
+            raise errors.OptionError('durability should be "none", "batch" or "file".\n')
+        self.durability = durability
+        self.commit_files = max(1, commit_files)
+        self.waiting = []
+        self.written = 0
+        self.owner = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        self.close()
+
+    def temporary_name(self, filename):
+        """
+        Returns a name for the temporary file of filename. The name is unique in this
+        writer and starts with a dot, so it is not taken for an input or output file.
+        """
+        self.written += 1
+        directory, name = os.path.split(filename)
+        return os.path.join(directory, '.' + name + '.' + str(os.getpid()) + '.' +
+                            str(self.written) + '.tmp')
+
+    def start(self, owner):
+        """
+        Sets the owner of the files written after this (for example the name of the
+        input file).
+        """
+        self.owner = owner
+
+    def full(self):
+        """
+        Returns True if commit_files files are waiting for commit.
+        """
+        return len(self.waiting) >= self.commit_files
+
+    def write(self, filename, content):
+        """
+        Writes content (bytes) to the file filename by the durability level.
+        """
+        temp_filename = self.temporary_name(filename)
+        fd = os.open(temp_filename, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666)
+        try:
+            view = memoryview(content)
+            while len(view) > 0:
+                view = view[os.write(fd, view):]
+            if self.durability == 'file':
+                os.fsync(fd)
+        except OSError:
+            os.close(fd)
+            os.remove(temp_filename)
+            raise
+        os.close(fd)
+        if self.durability == 'batch':
+            self.waiting.append([temp_filename, filename, self.owner])
+            return
+        os.replace(temp_filename, filename)
+        if self.durability == 'file':
+            sync_directories([filename])
+
+    def commit(self):
+        """
+        Syncs all the waiting files, renames them to their final names in the order
+        they were written and syncs their directories.
+            1. The files are synced by their names in SYNC_THREADS threads, so no file
+               is kept open while it waits.
+            2. The files of the owners whose files all were synced are renamed. The
+               files of the other owners are removed.
+            3. The directories of the renamed files are synced.
+        Returns {owner: error (OSError)} of the owners whose files were not committed.
+        """
+        failed = {}
+        if len(self.waiting) == 0:
+            return failed
+        waiting = self.waiting
+        self.waiting = []
+
+        # 1.
+        with ThreadPoolExecutor(max_workers=min(SYNC_THREADS, len(waiting))) as executor:
+            sync_errors = list(executor.map(sync_file, [temp for temp, _, _ in waiting]))
+        for [_, _, owner], error in zip(waiting, sync_errors):
+            if error is not None and owner not in failed:
+                failed[owner] = error
+
+        # 2.
+        renamed = []
+        for temp_filename, filename, owner in waiting:
+            if owner in failed:
+                remove_file(temp_filename)
+                continue
+            try:
+                os.replace(temp_filename, filename)
+            except OSError as err:
+                failed.setdefault(owner, err)
+                remove_file(temp_filename)
+                continue
+            renamed.append([filename, owner])
+
+        # 3.
+        for directory in sorted(set(directory_of(filename) for filename, _ in renamed)):
+            try:
+                sync_path(directory)
+            except OSError as err:
+                for filename, owner in renamed:
+                    if directory_of(filename) == directory:
+                        failed.setdefault(owner, err)
+        return failed
+
+    def discard(self, owner=None):
+        """
+        Removes the waiting files of owner, or all of them if owner is None, without
+        renaming them.
+        """
+        kept = []
+        for entry in self.waiting:
+            if owner is None or entry[2] == owner:
+                remove_file(entry[0])
+            else:
+                kept.append(entry)
+        self.waiting = kept
+
+    def close(self):
+        """
+        Commits the waiting files. Raises the first error if some of them could not
+        be committed.
+        """
+        failed = self.commit()
+        if len(failed) > 0:
+            raise list(failed.values())[0]
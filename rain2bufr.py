@@ -3,251 +3,912 @@
 """
 rain2bufr.py is the main program which converts rain observation data to a bufr message (edition 4).
 Run program by command: python3 rain2bufr.py name_of_the_data_file
+Several files are encoded by: python3 rain2bufr.py --batch directory_of_the_data_files
+Data is read from stdin and bufr is written to stdout by: python3 rain2bufr.py - < data_file
 """
+import argparse
+import contextlib
+import io
+import math
+import os
 import sys
 import traceback
-from eccodes import *
+import numpy as np
 import rain_values as subA
 import separate_keys_and_values
 import read_inputfile
+import read_dat_file
+import batch_encoding
+import bufr_templates
+import bufr_sequences
+import bulletin_writer
+import encoding_cache
+import errors
+import key_schema
+import metrics
+import output_writer
+import verify_messages
+import station_registry
 
 VERBOSE = 1
 
-def message_encoding(input_file, type_of_data):
+# Keys of the observation time by which the rows are grouped (see group_rows).
+GROUP_TIME_KEYS = ('YYYY', 'MM', 'DD', 'HH24', 'MI')
+
+# Default encoding options. They can be changed by giving message_encoding
+# a dictionary with some of these keys.
+OPTIONS = {
+    'output_dir': '',         # directory of the output files
+    'max_subsets': 0,         # maximum number of subsets in a message, 0 = no limit
+    'max_bytes': 0,           # maximum size of a message in bytes, 0 = no limit
+    'numbered_output': False, # write each message to its own numbered file
+    'compressed': False,      # encode compressed data (compressedData = 1)
+    'sort_by_station': False, # order the subsets by national station number
+    'sequence': 'auto',       # bufr sequence (see bufr_sequences), 'auto' = by the input keys
+    'on_error': 'reject',     # bad data rows: 'reject' the file or 'quarantine' the rows
+    'cache_dir': '',          # directory of the encoding cache, '' = no cache
+    'cache_max_bytes': 256 * 1024 * 1024, # maximum size of the cache, 0 = no limit
+    'stations': '',           # station registry (see station_registry), '' = no registry
+    'mmap': False,            # read .dat files by memory mapping them straight to columns
+    'verify': 0.0,            # part of the messages which are decoded and verified (0.0 - 1.0)
+    'row_workers': 1,         # worker processes which encode the chunks of one input
+    'durability': 'none',     # syncing of the output files (see output_writer)
+    'commit_files': 64,       # output files in one group commit of durability 'batch'
+    'group_by_time': False,   # encode the rows of each TTAAII and observation time separately
+}
+
+def get_options(options):
+    """
+    Returns the encoding options: OPTIONS updated with the given options (a dictionary
+    or None).
+    """
+    all_options = dict(OPTIONS)
+    if options is not None:
+        all_options.update(options)
+    return all_options
+
+def message_encoding(input_file, type_of_data, options=None, writer=None, record=None):
+    """
+    Main function sends input file (input_file) and its type (type_of_data) here.
+    The data is encoded to bufr messages by encode_groups and the messages of each
+    group are written by write_encoded. Errors are raised as exceptions of errors
+    module. If a bulletin writer (writer, see bulletin_writer) is given, the
+    messages are appended to its bulletin instead of the output file.
+    If a metrics record (record, see metrics) is given, each stage is measured to it.
+    Returns the names of the written files.
+    """
+    options = get_options(options)
+    groups = encode_groups(input_file, type_of_data, options, record)
+    return write_groups(groups, options, writer, record)
+
+def encode_messages(input_file, type_of_data, options=None, record=None):
+    """
+    Encodes the input file (input_file) of type type_of_data by encode_groups and
+    returns the messages of all the groups together, for the callers which do not
+    write the groups to their own files (for example encode_bytes).
+    Returns [output filename, abbreviated heading, encoded messages (list of bytes),
+    quarantine (None if options['on_error'] is 'reject')]. The output filename and
+    the heading are those of the first group.
+    """
+    groups = encode_groups(input_file, type_of_data, options, record)
+    messages = [message for encoded in groups for message in encoded[2]]
+    return [groups[0][0], groups[0][1], messages, groups[0][3]]
+
+def encode_groups(input_file, type_of_data, options=None, record=None):
     """
     1. Main function sends input file (input_file) and its type (type_of_data) here.
        Input_file and its type is send to read_inputfile module which returns the data
        in key-value-pair format. After this the first part of data
        (output file naming information) is separated from key name and value data.
-    2. Values are separated from the data's key-value -pairs by separate_keys_and_values
-       module's "get_keys" -function.
-       "separate_keys_and_values" -module's "are_all_the_rows_similar" -function is used to
-       check that in all the measurements the key names are the same, and in same order.
-       Values are separated by separate_keys_and_values module's "get_values" -function.
-    3. Values are separated from the data's key-value -pairs by separate_keys_and_values
-       module's "get_values" -function. Values are put to the sub_array in the way where
-       all the values with the same key name are in the same array.
-    4. Subset objects are made and out to subset_array by the rain_values module's class Subset.
-       subset_array includes objects which can be called by the key names.
-    5. The bufr message skeleton is made from a sample (edition 4).
-    6. Sends the bufr skeleton and subset_array to bufr_encode to fill the bufr message.
-    7. Output filename is named by the first row of the data (output) and
-       the name of the centre.
-    8. Output file is opened, bufr message is written to it and output filename is
-       returned to main function.
+       If options['on_error'] is 'quarantine', wrongly written rows are dropped to a
+       quarantine (errors.Quarantine) instead of rejecting the whole file.
+    2. Keys are separated from the data's key-value -pairs by separate_keys_and_values
+       module's "check_keys" -function. It checks that in all the measurements
+       the key names are the same, and in same order. In quarantine, the rows with
+       other key names than the most common ones are dropped. The bufr sequence is
+       selected by options['sequence'] or, if it is 'auto', by the keys (see
+       bufr_sequences).
+       If options['mmap'] is True and the input is a .dat file on disk, steps 1-3 are
+       done at once by read_dat_file.read_columns, which reads the file straight to
+       columns without keeping the rows in memory.
+    3. Values are separated from the data's key-value -pairs by the same function.
+       Values are put to the sub_array in the way where all the values with the same
+       key name are in the same array. In quarantine, the row numbers of the input
+       file are added to sub_array as the last column, so they go along with the rows.
+       If a station registry is given (options['stations'], see station_registry),
+       the station keys which are not in the input are filled in from it.
+       Steps 1-3 are done by read_input, which is also used by validate_input.
+    4. If options['sort_by_station'] is True, the rows are ordered by the national station
+       number (NSI). Similar stations next to each other compress better.
+       If options['group_by_time'] is True, the rows are partitioned to groups by
+       their TTAAII and observation time (see group_rows). The rows whose time
+       can not name a group are dropped to the quarantine or rejected. Otherwise
+       all the rows are one group. Then the rows of each group are split to chunks
+       of options['max_subsets'] rows (0 = all the rows in one chunk).
+       If options['row_workers'] > 1, the chunks of all the groups are encoded in
+       one pool of worker processes by batch_encoding.encode_chunks. The chunks do
+       not depend on the number of workers, so the messages are the same as with
+       one process.
+    5. Each chunk is encoded to a bufr message by encode_rows, compressed if
+       options['compressed'] is True. If a message is bigger than
+       options['max_bytes'] (0 = no limit), its chunk is split in two. In quarantine,
+       the rows with wrong values are dropped from the chunk. The part
+       options['verify'] of the messages are decoded again and compared to the
+       values by verify_messages.
+    6. Output filename of each group is named by the first row of the data (output),
+       or by the TTAAII and the time of the group, and the name of the centre. The
+       file is put to options['output_dir'] (default: working directory). The
+       abbreviated heading (TTAAii CCCC YYGGgg) of a bulletin is made of the same parts.
+       The name has no year or month, so the groups which get the same name (for
+       example the same day of two months) are written to the same file, each in its
+       own messages.
+    If options['cache_dir'] is given, the rows read in steps 1-3 are looked up from
+    the cache (see encoding_cache). Rows which have been encoded before with the same
+    options are not encoded again: the stored result is returned. A new result is
+    stored to the cache. The cache is optional: if the result can not be stored, a warning
+    is printed to stderr and the result is returned as usual.
+    Options which are not given are taken from OPTIONS. The stages are measured to the
+    metrics record (record) if it is not None.
+    Returns [output filename, abbreviated heading, encoded messages (list of bytes),
+    quarantine] of each group. The quarantine (None if options['on_error'] is
+    'reject') is given with the first group and the other groups have None.
     """
+    options = get_options(options)
+    quarantine = new_quarantine(options['on_error'], getattr(input_file, 'name', ''))
+    registry = station_registry.open_registry(options)
+    cache = encoding_cache.open_cache(options)
+
+    # 1.-3.
+    output, keys, sub_array, sequence = read_input(input_file, type_of_data, options,
+                                                   quarantine, registry, record)
+    number_of_rows = len(sub_array[0])
+    if quarantine is not None:
+        dropped = len(quarantine.entries)
+    if cache is not None:
+        with metrics.stage(record, 'cache'):
+            key = encoding_cache.cache_key(output, keys, sub_array, options, quarantine)
+            entry = cache.get(key)
+        if entry is not None:
+            return cached_result(entry, options, quarantine, record)
 
-    # 1.
-    data_in = read_inputfile.get_data(input_file, read_inputfile.check_data_type(type_of_data))
-    output = data_in[0]
-    data = data_in[1]
+    # 4.
+    if options['sort_by_station'] and 'NSI' in keys:
+        order = np.argsort(np.asarray(sub_array[keys.index('NSI')], dtype=float), kind='stable')
+        sub_array = separate_keys_and_values.select_rows(sub_array, order)
+
+    if options['group_by_time']:
+        with metrics.stage(record, 'group'):
+            groups = group_rows(keys, sub_array, output, quarantine)
+    else:
+        groups = [[output, None]]
+    group_chunks = []
+    for _, rows in groups:
+        if rows is not None and len(rows) == number_of_rows:
+            rows = None
+        size = number_of_rows if rows is None else len(rows)
+        group_chunks.append([rows, split_rows(size, options['max_subsets'])])
 
-    # 2.
-    keys_in_each_row = []
-    sub_array = []
-    for i in range(0, len(data[0])):
-        sub_array.append([])
+    # 5.
+    if options['row_workers'] > 1 and sum(len(chunks) for _, chunks in group_chunks) > 1:
+        group_messages = batch_encoding.encode_chunks(keys, sub_array, group_chunks, options,
+                                                      record, sequence, quarantine)
+    else:
+        group_messages = []
+        for rows, chunks in group_chunks:
+            messages = []
+            for start, stop in chunks:
+                chunk = chunk_columns(sub_array, rows, start, stop)
+                messages.extend(encode_rows(keys, chunk, options['max_bytes'],
+                                            options['compressed'], record, sequence,
+                                            quarantine, options['verify']))
+            group_messages.append(messages)
+
+    groups_encoded = []
+    by_filename = {}
+    all_messages = []
+    for [group_output, _], messages in zip(groups, group_messages):
+        # 6.
+        if len(messages) > 0:
+            output_filename, heading = name_output(group_output, messages[0], options)
+            if output_filename in by_filename:
+                by_filename[output_filename][2].extend(messages)
+            else:
+                by_filename[output_filename] = [output_filename, heading, messages, None]
+                groups_encoded.append(by_filename[output_filename])
+            all_messages.extend(messages)
+
+    if len(groups_encoded) == 0:
+        raise errors.InputError('All the data rows were quarantined.\n')
+    groups_encoded[0][3] = quarantine
+    subsets = number_of_rows
+    if quarantine is not None:
+        subsets -= len(quarantine.entries) - dropped
+    if cache is not None:
+        with metrics.stage(record, 'cache'):
+            try:
+                cache.put(key, groups_encoded, subsets)
+            except OSError as err:
+                print('Warning: the result was not stored to the cache: ' + str(err),
+                      file=sys.stderr)
+    count_result(record, subsets, all_messages)
+
+    return groups_encoded
+
+def chunk_columns(columns, rows, start, stop):
+    """
+    Returns the columns of the rows start:stop of a group. rows are the row indices of
+    the group in columns, or None if the group has all the rows.
+    """
+    if rows is None:
+        return [column[start:stop] for column in columns]
+    return separate_keys_and_values.select_rows(columns, rows[start:stop])
+
+def wrong_group_time(group):
+    """
+    Returns the first of GROUP_TIME_KEYS whose value in group ([TTAAII, time
+    values]) is missing, not an integer or out of its range (see key_schema), or None
+    if the time is right. The keys which are not in the input (None) are not checked.
+    """
+    for key, value in zip(GROUP_TIME_KEYS, group[1:]):
+        if value is None:
+            continue
+        low, high = key_schema.SCHEMA[key].valid
+        if not isinstance(value, (int, float)) or not math.isfinite(value) or \
+                value != int(value) or not low <= value <= high:
+            return key
+    return None
+
+def group_rows(keys, columns, output, quarantine=None):
+    """
+    Partitions the rows of an input (keys, columns) by their TTAAII and observation
+    time (GROUP_TIME_KEYS). The rows are collected to a dictionary by these values in
+    one pass, so a big input with many groups is grouped in linear time. The groups
+    are in the order of their first rows and the rows of a group in the input order.
+    The output file of a group is named by its TTAAII, day, hour and minute. The parts
+    which are not in the keys are taken from the input (output).
+    A row whose time is missing or wrong (see wrong_group_time) would make a group
+    with the name of another group, so it is dropped to the quarantine if it is given
+    (then the last column has the row numbers). Otherwise errors.RowError is raised.
+    Returns [naming parts (like output), row indices] of each group.
+    """
+    number_of_rows = len(columns[0])
+    parts = []
+    for key in ('TTAAII',) + GROUP_TIME_KEYS:
+        if key not in keys:
+            parts.append([None] * number_of_rows)
+        elif isinstance(columns[keys.index(key)], np.ndarray):
+            parts.append(columns[keys.index(key)].tolist())
+        else:
+            parts.append(columns[keys.index(key)])
+    groups = {}
+    wrong = {}
+    for row, group in enumerate(zip(*parts)):
+        key = wrong_group_time(group)
+        if key is not None:
+            wrong.setdefault(key, []).append(row)
+            continue
+        rows = groups.get(group)
+        if rows is None:
+            groups[group] = [row]
+        else:
+            rows.append(row)
+    for key, rows in sorted(wrong.items(), key=lambda item: item[1][0]):
+        low, high = key_schema.SCHEMA[key].valid
+        reason = ('Value of "' + key + '" to group the rows by time should be an '
+                  'integer from ' + str(low) + ' to ' + str(high) + '.')
+        if quarantine is None:
+            raise errors.RowError(reason + '\n', rows, reason)
+        for row in rows:
+            quarantine.add(columns[-1][row], reason)
+
+    named = []
+    for group, rows in groups.items():
+        ttaaii = group[0]
+        group_output = [ttaaii if isinstance(ttaaii, str) and ttaaii not in ('', '/')
+                        else output[0]]
+        for value, default in zip(group[3:], output[1:]):
+            if value is None:
+                group_output.append(default)
+            else:
+                group_output.append(str(int(value)).zfill(2))
+        named.append([group_output, rows])
+    return named
 
-    for i in range(0, len(data)):
-        keys_in_each_row.append(separate_keys_and_values.get_keys(data[i]))
+def name_output(output, message, options):
+    """
+    Returns [output filename, abbreviated heading] of the messages whose naming parts
+    are output ([TTAAII, day, hour, minute]). The name of the centre is taken from
+    the first message (message).
+    """
+    centre = get_centre(message)
+    output_filename = output[0] + '_' + str(centre.upper()) + '_' + output[1] + output[2]
+    output_filename = output_filename + output[3] + '.bufr'
+    output_filename = os.path.join(options['output_dir'], output_filename)
+    heading = output[0] + ' ' + str(centre.upper()) + ' ' + output[1] + output[2] + output[3]
+    return [output_filename, heading]
 
-    if separate_keys_and_values.are_all_the_rows_similar(keys_in_each_row) is False:
-        print('Error in data structure:\n')
-        print('Key names in each measurement should be the same and in the same order.\n')
-        sys.exit(1)
+def read_input(input_file, type_of_data, options, quarantine=None, registry=None,
+               record=None):
+    """
+    Reads and checks the input file (input_file) of type type_of_data and returns its
+    values as columns: steps 1-3 of encode_groups. The wrong rows are dropped to the
+    quarantine if it is given. The station keys are filled in from the station registry
+    (registry) if it is given.
+    Returns [output (naming information), keys, columns, bufr sequence]. In quarantine,
+    the last column has the row numbers of the input file.
+    """
+    # 1.
+    data_type = read_inputfile.check_data_type(type_of_data)
+    mapped = options['mmap'] and read_inputfile.can_map(input_file, data_type)
+    with metrics.stage(record, 'parse'):
+        if mapped:
+            output, keys, sub_array = read_dat_file.read_columns(input_file, quarantine)
+        else:
+            output, data = read_inputfile.get_data(input_file, data_type, quarantine)
 
-    keys = keys_in_each_row[0]
+    # 2.
+    if not mapped:
+        with metrics.stage(record, 'key_check'):
+            if quarantine is not None:
+                data = separate_keys_and_values.drop_rows_with_other_keys(data, quarantine)
+            keys = separate_keys_and_values.check_keys(data)
+    sequence = bufr_sequences.select(keys, options['sequence'])
 
     # 3.
-    for i in range(0, len(data)):
-        values = separate_keys_and_values.get_values(data[i])
-        for j in range(0, len(values)):
-            sub_array[j].append(values[j])
-    # 4.
-    subset_array = subA.Subset(keys, sub_array)
+    with metrics.stage(record, 'pivot'):
+        if not mapped:
+            sub_array = separate_keys_and_values.get_value_columns(data)
+        if registry is not None:
+            keys, sub_array = registry.fill(keys, sub_array)
+        if quarantine is not None:
+            sub_array.append(quarantine.row_numbers)
+    return [output, keys, sub_array, sequence]
+
+def validate_input(input_file, type_of_data, options=None):
+    """
+    Checks the input file (input_file) of type type_of_data without encoding it, so
+    eccodes is not loaded. The name and the rows are checked by read_input and the
+    values by making the Subset objects (see rain_values) of the chunks of
+    options['max_subsets'] rows, like encode_groups does. If options['group_by_time']
+    is True, the time of the rows is checked by group_rows. The errors are raised in
+    the same way as by encode_groups.
+    Returns [number of valid rows, quarantine (None if options['on_error'] is
+    'reject')].
+    """
+    options = get_options(options)
+    quarantine = new_quarantine(options['on_error'], getattr(input_file, 'name', ''))
+    registry = station_registry.open_registry(options)
+    output, keys, sub_array, sequence = read_input(input_file, type_of_data, options,
+                                                   quarantine, registry)
+    number_of_rows = len(sub_array[0])
+    dropped = 0 if quarantine is None else len(quarantine.entries)
+    if options['group_by_time']:
+        kept = sorted(row for _, rows in group_rows(keys, sub_array, output, quarantine)
+                      for row in rows)
+        if len(kept) < number_of_rows:
+            sub_array = separate_keys_and_values.select_rows(sub_array, kept)
+    for start, stop in split_rows(number_of_rows, options['max_subsets']):
+        make_subset(keys, [column[start:stop] for column in sub_array], quarantine, sequence)
+    valid_rows = number_of_rows
+    if quarantine is not None:
+        valid_rows -= len(quarantine.entries) - dropped
+    if valid_rows == 0:
+        raise errors.InputError('All the data rows were quarantined.\n')
+    return [valid_rows, quarantine]
+
+def cached_result(entry, options, quarantine, record=None):
+    """
+    Returns the result of encode_groups from a cache entry (see encoding_cache). The
+    output files are put to options['output_dir'] and the quarantine gets the name of
+    this input (quarantine).
+    """
+    cached_quarantine = entry['quarantine']
+    if cached_quarantine is not None and quarantine is not None:
+        cached_quarantine.input_name = quarantine.input_name
+    if record is not None:
+        record['cache_hit'] = True
+    groups = []
+    for output_name, heading, messages in entry['groups']:
+        groups.append([os.path.join(options['output_dir'], output_name), heading, messages,
+                       None])
+    groups[0][3] = cached_quarantine
+    count_result(record, entry['subsets'],
+                 [message for group in groups for message in group[2]])
+    return groups
+
+def count_result(record, subsets, messages):
+    """
+    Sets the number of subsets, the number of messages and their size to the metrics
+    record (record) if it is not None.
+    """
+    if record is not None:
+        record['subsets'] = subsets
+        record['messages'] = len(messages)
+        record['output_bytes'] = sum(len(message) for message in messages)
 
-    # 5.
-    bufr = codes_bufr_new_from_samples('BUFR4')
+def new_quarantine(on_error, input_name=''):
+    """
+    Returns a new quarantine (errors.Quarantine) of the input (input_name) if on_error
+    is 'quarantine', or None if it is 'reject'.
+    """
+    if on_error == 'quarantine':
+        return errors.Quarantine(input_name)
+    if on_error != 'reject':
+        raise errors.OptionError('on_error should be "reject" or "quarantine".\n')
+    return None
 
-    # 6.
+def write_groups(groups, options=None, writer=None, record=None, files=None):
+    """
+    Writes the groups made by encode_groups (groups) by write_encoded. The files of
+    all the groups are written by the same output writer (files, see output_writer),
+    or if it is not given, by a writer with options['durability'] which is closed at
+    the end. Returns the names of the written files.
+    """
+    options = get_options(options)
+    own_files = files is None
+    if own_files:
+        files = output_writer.from_options(options)
+    filenames = []
+    for encoded in groups:
+        filenames.extend(write_encoded(encoded, options, writer, record, files))
+    if own_files:
+        with metrics.stage(record, 'write'):
+            files.close()
+    return filenames
+
+def write_encoded(encoded, options=None, writer=None, record=None, files=None):
+    """
+    Writes the messages of one group made by encode_groups or by encode_messages
+    (encoded) to the bulletin writer (writer), or if it is None, to the output file
+    by write_messages.
+    If rows were quarantined, the quarantine report is written next to the output
+    file (name.quarantine).
+    The files are written by the output writer (files, see output_writer). If it is
+    not given, a writer with options['durability'] is made for this input and
+    closed at the end, so the files of the input are committed together.
+    Writing is measured to the metrics record (record) if it is not None.
+    Returns the names of the written files.
+    """
+    output_filename, heading, messages, quarantine = encoded
+    options = get_options(options)
+    own_files = files is None
+    if own_files:
+        files = output_writer.from_options(options)
+    with metrics.stage(record, 'write'):
+        if writer is not None:
+            filenames = writer.write_messages(messages, heading)
+        else:
+            filenames = write_messages(output_filename, messages, options['numbered_output'],
+                                       files)
+        if quarantine is not None and len(quarantine.entries) > 0:
+            report_filename = output_filename[:-len('.bufr')] + '.quarantine'
+            files.write(report_filename, quarantine.report().encode('utf8'))
+            filenames.append(report_filename)
+        if own_files:
+            files.close()
+    return filenames
+
+def split_rows(number_of_rows, max_subsets):
+    """
+    Splits number_of_rows rows to chunks of max_subsets rows. Returns [start, stop]
+    of each chunk. If max_subsets is 0, all the rows are in one chunk.
+    """
+    if max_subsets <= 0:
+        max_subsets = max(number_of_rows, 1)
+    chunks = []
+    for start in range(0, number_of_rows, max_subsets):
+        chunks.append([start, min(start + max_subsets, number_of_rows)])
+    return chunks
+
+def encode_rows(keys, columns, max_bytes, compressed=False, record=None, sequence=None,
+                quarantine=None, verify=0.0):
+    """
+    Makes a Subset object of the values (columns) by make_subset and encodes it to a
+    bufr message of the sequence (see bufr_sequences, default: bufr_sequences.DEFAULT),
+    compressed if compressed is True.
+    If the message is bigger than max_bytes (0 = no limit) and it has more than one
+    subset, the rows are split in two halves which are encoded separately.
+    The part verify (0.0 - 1.0) of the messages are decoded and compared to the
+    Subset object by verify_messages, which raises errors.EncodingError if they differ.
+    The stages are measured to the metrics record (record) if it is not None.
+    Returns a list of the encoded messages (bytes).
+    """
+    with metrics.stage(record, 'subset'):
+        subset_array, columns = make_subset(keys, columns, quarantine, sequence)
+    if subset_array is None:
+        return []
+    with metrics.stage(record, 'encode'):
+        message = encode_subset(subset_array, compressed, sequence)
+    nsub = subset_array.NSUB
+    if 0 < max_bytes < len(message) and nsub > 1:
+        half = nsub // 2
+        messages = encode_rows(keys, [column[:half] for column in columns], max_bytes,
+                               compressed, record, sequence, quarantine, verify)
+        messages.extend(encode_rows(keys, [column[half:] for column in columns], max_bytes,
+                                    compressed, record, sequence, quarantine, verify))
+        return messages
+    if verify_messages.sampled(message, verify):
+        with metrics.stage(record, 'verify'):
+            verify_messages.verify(message, subset_array, sequence)
+    return [message]
+
+def make_subset(keys, columns, quarantine=None, sequence=None):
+    """
+    Makes a Subset object of the values (columns) for the bufr sequence (sequence, see
+    bufr_sequences; None = all the objects are made). If the values of some rows are
+    wrong (errors.RowError) and a quarantine (errors.Quarantine) is given, the rows are
+    dropped to the quarantine and the Subset object is made of the rest of the rows.
+    Then the last column has the row numbers of the input file.
+    Returns [Subset object, columns of its rows], or [None, columns] if all the rows
+    were dropped.
+    """
+    while True:
+        try:
+            return [subA.Subset(keys, columns, sequence), columns]
+        except errors.RowError as err:
+            if quarantine is None:
+                raise
+            row_numbers = columns[-1]
+            wrong = set(err.rows)
+            for index in wrong:
+                quarantine.add(row_numbers[index], err.reason)
+            kept = [i for i in range(0, len(row_numbers)) if i not in wrong]
+            if len(kept) == 0:
+                return [None, columns]
+            columns = separate_keys_and_values.select_rows(columns, kept)
+
+def encode_subset(subset_array, compressed=False, sequence=None):
+    """
+    Clones a bufr message skeleton of the sequence (see bufr_sequences, default:
+    bufr_sequences.DEFAULT) from a cached template (bufr_templates) and sends it
+    with subset_array to bufr_encode to fill the bufr message. If compressed is True,
+    the message has compressed data. Returns the encoded message (bytes).
+    If eccodes fails, errors.EncodingError is raised.
+    """
+    from eccodes import CodesInternalError, codes_get_message, codes_release
+    if sequence is None:
+        sequence = bufr_sequences.SEQUENCES[bufr_sequences.DEFAULT]
+    bufr = bufr_templates.new_message(sequence.descriptors, subset_array.NSUB, int(compressed))
     try:
-        bufr = bufr_encode(bufr, subset_array)
+        bufr = bufr_encode(bufr, subset_array, sequence)
+        message = codes_get_message(bufr)
     except CodesInternalError as err:
-        if VERBOSE:
-            traceback.print_exc(file=sys.stderr)
-        else:
-            print(err)
         codes_release(bufr)
-        sys.exit(1)
+        raise errors.EncodingError('Encoding the bufr message failed: ' + str(err) + '\n') from err
+    codes_release(bufr)
+    return message
 
-    # 7.
+def get_centre(message):
+    """
+    Returns the name of the centre (for example "efkl") of a bufr message (bytes).
+    """
+    from eccodes import codes_get_string, codes_new_from_message, codes_release
+    bufr = codes_new_from_message(message)
     centre = codes_get_string(bufr, 'bufrHeaderCentre')
-    output_filename = output[0] + '_' + str(centre.upper()) + '_' + output[1] + output[2]
-    output_filename = output_filename + output[3] + '.bufr'
-
-    # 8.
-    with open(output_filename, 'wb') as fout:
-        codes_write(bufr, fout)
-        fout.close()
-
     codes_release(bufr)
-    return output_filename
+    return centre
 
-def bufr_encode(ibufr, subs):
+def write_messages(output_filename, messages, numbered_output, files=None):
+    """
+    Writes the bufr messages to the output file (output_filename) one after another.
+    If numbered_output is True and there are more than one message, each message is
+    written to its own file, which is numbered: name_001.bufr, name_002.bufr, ...
+    The files are written by the output writer (files, see output_writer), by default
+    to a temporary file which is renamed when it is complete.
+    Returns a list of the output filenames.
+    """
+    if numbered_output and len(messages) > 1:
+        filenames = []
+        name = output_filename[:-len('.bufr')]
+        for i in range(0, len(messages)):
+            filenames.append(name + '_' + str(i + 1).zfill(3) + '.bufr')
+    else:
+        filenames = [output_filename]
+        messages = [b''.join(messages)]
+
+    if files is None:
+        with output_writer.OutputWriter() as own_files:
+            for filename, message in zip(filenames, messages):
+                own_files.write(filename, message)
+        return filenames
+    for filename, message in zip(filenames, messages):
+        files.write(filename, message)
+    return filenames
+
+def bufr_encode(ibufr, subs, sequence=None):
     """
     Encodes a bufr message (ibufr) by subset_array object (subs).
     Subser_array object is used to get all the values in each subset.
+    The message is made by bufr_templates.new_message, so the header and the
+    descriptors of the sequence (see bufr_sequences, default: bufr_sequences.DEFAULT)
+    are already set in it. The values are set by the encoding plan of the sequence.
+    Both uncompressed and compressed (compressedData = 1) messages can be encoded.
     """
-    codes_set(ibufr, 'edition', 4)
-    codes_set(ibufr, 'masterTableNumber', 0)
-    codes_set(ibufr, 'bufrHeaderCentre', 86)
-    codes_set(ibufr, 'bufrHeaderSubCentre', 0)
-    codes_set(ibufr, 'updateSequenceNumber', 1)
-    codes_set(ibufr, 'dataCategory', 0)
-    codes_set(ibufr, 'internationalDataSubCategory', 0)
-    codes_set(ibufr, 'dataSubCategory', 1)
-    codes_set(ibufr, 'masterTablesVersionNumber', 35)
-    codes_set(ibufr, 'localTablesVersionNumber', 0)
-    codes_set(ibufr, 'observedData', 1)
-    codes_set(ibufr, 'numberOfSubsets', subs.NSUB)
-    codes_set(ibufr, 'compressedData', 0)
-    codes_set(ibufr, 'typicalYear', max(set(subs.YYYY), key = subs.YYYY.count))
-    codes_set(ibufr, 'typicalMonth', max(set(subs.MM), key = subs.MM.count))
-    codes_set(ibufr, 'typicalDay', max(set(subs.DD), key = subs.DD.count))
-    codes_set(ibufr, 'typicalHour', max(set(subs.HH24), key = subs.HH24.count))
-    codes_set(ibufr, 'typicalMinute', max(set(subs.MI), key = subs.MI.count))
+    from eccodes import codes_get, codes_set, codes_set_array
+    if sequence is None:
+        sequence = bufr_sequences.SEQUENCES[bufr_sequences.DEFAULT]
+    codes_set(ibufr, 'typicalYear', most_common(subs.YYYY))
+    codes_set(ibufr, 'typicalMonth', most_common(subs.MM))
+    codes_set(ibufr, 'typicalDay', most_common(subs.DD))
+    codes_set(ibufr, 'typicalHour', most_common(subs.HH24))
+    codes_set(ibufr, 'typicalMinute', most_common(subs.MI))
     codes_set(ibufr, 'typicalSecond', 0)
-    codes_set(ibufr, 'unexpandedDescriptors', 307103)
-
-    # Snow observation, snow density, snow water equivalent.
-    # 307103: 301150, 307101, 013117, 003028, 013163
-
-    # WIGOS identyfier:
-    # 301150:
-        # 001125: WIGOS identifier series
-        # 001126: WIGOS issuer of identifier
-        # 001127: WIGOS issue number
-        # 001128: WIGOS local identifier (character)
-
-    codes_set_array(ibufr, 'wigosIdentifierSeries', subs.WSI_IDS)
-    codes_set_array(ibufr, 'wigosIssuerOfIdentifier', subs.WSI_IDI)
-    codes_set_array(ibufr, 'wigosIssueNumber', subs.WSI_INR)
-
-    for i in range(0, len(subs.WSI_LID)):
-        key = '#'+str(i+1)+'#wigosLocalIdentifierCharacter'
-        codes_set(ibufr, key, subs.WSI_LID[i])
-        # codes_set_string_array, codes_get_string_array do not work
-
-    # Snow observation:
-    # 307101: 301089, 001019, 002001, 301011, 301012, 301021,
-    #         007030, 007032, 002177, 020062, 013013
-        # National station identification:
-        # 301089:
-            # 001101: State identifier  0-1022 ja 1023 on missing value
-            #         Finland =  613
-            # 001102: National station number (Surface station
-            #         identification; time, horizontal and vertical coordinates)
-            #         FMISID is used in Finland
-
-    codes_set_array(ibufr, 'stateIdentifier', subs.STATEID)
-    codes_set_array(ibufr, 'nationalStationNumber', subs.NSI)
-
-        # 001019: Long station or site name
-        # 002001: Type of station
-
-    for i in range(0, len(subs.LONG_STATION_NAME)):
-        key = '#'+str(i+1)+'#longStationName'
-        codes_set(ibufr, key, subs.LONG_STATION_NAME[i])
-        # codes_set_string_array and codes_get_string_array do not work
-
-    codes_set_array(ibufr, 'stationType', subs.STATION_TYPE)
-
-        # 301011:
-            # 004001: Year
-            # 004002: Month
-            # 004003: Day
-        # 301012:
-            # 004004: Hour
-            # 004005: Minute
-        # 301021:
-            # 005001: Latitude (high accuracy)
-            # 006001: Longitude (high accuracy)
-
-    codes_set_array(ibufr, 'year', subs.YYYY)
-    codes_set_array(ibufr, 'month', subs.MM)
-    codes_set_array(ibufr, 'day', subs.DD)
-    codes_set_array(ibufr, 'hour', subs.HH24)
-    codes_set_array(ibufr, 'minute', subs.MI)
-    codes_set_array(ibufr, 'latitude', subs.LAT)
-    codes_set_array(ibufr, 'longitude', subs.LON)
-
-        # 007030: Height of station ground above mean sea level [m]
-        # 007032: Height of sensor above local ground (or deck of marine platform) [m]
-            # Manual rain observation stations typically do not measure temperature.
-        # 012101: Temperature/air temperature [K]
-            # Manual rain observation stations typically do not measure temperature.
-        # 007032: Height of sensor above local ground (or deck of marine platform) [m]
-        # 002177: Method of snow depth measurement
-        # 020062: State of the ground
-        # 013013: Total snow depth [m]
-
-    codes_set_array(ibufr, 'heightOfStationGroundAboveMeanSeaLevel', subs.ELSTAT)
-    codes_set_array(ibufr, 'heightOfSensorAboveLocalGroundOrDeckOfMarinePlatform', subs.SENSOR)
-    codes_set_array(ibufr, 'airTemperature', subs.T)
-    codes_set_array(ibufr, 'methodOfSnowDepthMeasurement', subs.METHODSNOW)
-    codes_set_array(ibufr, 'stateOfGround', subs.GR)
-    codes_set_array(ibufr, 'totalSnowDepth', subs.SNOW_TOTAL)
-
-    # 013117: Snow density (liquid water content) [kg/m³]
-        # This is SYKE-data and not (yet) included in inputdata
-    # 003028: Method of snow water equivalent measurement
-        # This is SYKE-data and not (yet) included in inputdata
-    # 013163: Snow water equivalent [kg/m²]
-        # This is SYKE-data and not (yet) included in inputdata
-
-    codes_set_array(ibufr, 'snowDensityLiquidWaterContent', subs.SDLWC)
-    codes_set_array(ibufr, 'methodOfSnowWaterEquivalentMeasurement', subs.MSWE)
-    codes_set_array(ibufr, 'snowWaterEquivalent', subs.SWE)
+
+    compressed = codes_get(ibufr, 'compressedData') == 1
+    for kind, key, attribute, start, step in bufr_sequences.encoding_plan(sequence.name,
+                                                                          compressed):
+        values = getattr(subs, attribute)
+        if step > 1:
+            values = values[start::step]
+        if kind == 'string':
+            set_string_array(ibufr, key, values)
+        else:
+            codes_set_array(ibufr, key, values)
 
     codes_set(ibufr, 'pack', 1)  # Required to encode the keys back in the data section
     return ibufr
 
+def set_string_array(ibufr, key, values):
+    """
+    Sets the text values of key for all the subsets of the bufr message (ibufr) with one
+    codes_set_string_array call. Older eccodes versions can not set string arrays of
+    uncompressed data. With them, the values are set one subset at a time with
+    rank-qualified keys (#1#key, #2#key, ...), which gets slow with many subsets.
+    """
+    from eccodes import CodesInternalError, codes_set, codes_set_string_array
+    try:
+        codes_set_string_array(ibufr, key, values)
+    except CodesInternalError:
+        for i in range(0, len(values)):
+            codes_set(ibufr, '#' + str(i + 1) + '#' + key, values[i])
+
+def most_common(values):
+    """
+    Returns the most common value in the integer array values. If there are several
+    equally common values, the smallest of them is returned.
+    """
+    unique_values, counts = np.unique(values, return_counts=True)
+    return int(unique_values[np.argmax(counts)])
+
+def encode_bytes(data, type_of_data='dat', options=None):
+    """
+    Encodes data which is already in memory, without reading or writing files.
+    data is the text of an input file (str or bytes in UTF-8) or a list of its rows.
+    type_of_data is the type of the data ('dat' or 'csv').
+    Returns [suggested output filename, bufr messages (bytes)]. The messages are one
+    after another, in the same way as they are written to the output file.
+    """
+    if isinstance(data, bytes):
+        data = data.decode('utf8')
+    if not isinstance(data, str):
+        data = ''.join(row if row.endswith('\n') else row + '\n' for row in data)
+    encoded = encode_messages(io.StringIO(data), type_of_data, options)
+    return [os.path.basename(encoded[0]), b''.join(encoded[2])]
+
+def encode_stream(in_file, out_file, type_of_data='dat', options=None, record=None):
+    """
+    Encodes the data read from a text stream (in_file, for example stdin) and writes
+    the bufr messages to a binary stream (out_file, for example stdout). If rows were
+    quarantined, the quarantine report is printed to stderr.
+    Returns the suggested output filename.
+    """
+    encoded = encode_messages(in_file, type_of_data, options, record)
+    with metrics.stage(record, 'write'):
+        for message in encoded[2]:
+            out_file.write(message)
+        out_file.flush()
+    quarantine = encoded[3]
+    if quarantine is not None and len(quarantine.entries) > 0:
+        sys.stderr.write(quarantine.report())
+    return os.path.basename(encoded[0])
+
+def encode_file(input_filename, options=None, writer=None, record=None):
+    """
+    Opens the input file (input_filename) and sends it to message_encoding with its
+    data type, which is the ending of the file name, the encoding options, the
+    bulletin writer (writer) and the metrics record (record). Returns the output filenames.
+    """
+    data_type = input_filename.split('.')
+    data_type = data_type[len(data_type) - 1]
+    with open(input_filename, 'r', encoding="utf8") as in_file:
+        return message_encoding(in_file, data_type, options, writer, record)
+
+def validate_file(input_filename, options=None):
+    """
+    Opens the input file (input_filename) and checks it by validate_input.
+    """
+    data_type = input_filename.split('.')
+    data_type = data_type[len(data_type) - 1]
+    with open(input_filename, 'r', encoding="utf8") as in_file:
+        return validate_input(in_file, data_type, options)
+
+def encode_file_messages(input_filename, options=None, record=None):
+    """
+    Opens the input file (input_filename) and encodes it by encode_groups without
+    writing the messages.
+    """
+    data_type = input_filename.split('.')
+    data_type = data_type[len(data_type) - 1]
+    with open(input_filename, 'r', encoding="utf8") as in_file:
+        return encode_groups(in_file, data_type, options, record)
+
+def add_encoding_arguments(parser):
+    """
+    Adds the command line arguments of the encoding options to parser
+    (argparse.ArgumentParser).
+    """
+    parser.add_argument('--output-dir', default='',
+                        help='directory of the output files (default: working directory)')
+    parser.add_argument('--max-subsets', type=int, default=0,
+                        help='maximum number of subsets in one message (default: no limit)')
+    parser.add_argument('--max-bytes', type=int, default=0,
+                        help='maximum size of one message in bytes (default: no limit)')
+    parser.add_argument('--numbered-output', action='store_true',
+                        help='write each message to its own numbered file')
+    parser.add_argument('--compressed', action='store_true',
+                        help='encode compressed data')
+    parser.add_argument('--sort-by-station', action='store_true',
+                        help='order the subsets by national station number')
+    parser.add_argument('--sequence', default='auto',
+                        choices=['auto'] + list(bufr_sequences.SEQUENCES),
+                        help='bufr sequence (default: selected by the input keys)')
+    parser.add_argument('--on-error', default='reject', choices=['reject', 'quarantine'],
+                        help='reject the whole file (default) or quarantine the bad rows')
+    parser.add_argument('--cache-dir', default='',
+                        help='directory of the encoding cache (default: no cache)')
+    parser.add_argument('--cache-max-bytes', type=int, default=OPTIONS['cache_max_bytes'],
+                        help='maximum size of the encoding cache in bytes (0 = no limit)')
+    parser.add_argument('--stations', default='', metavar='FILE',
+                        help='station registry which fills in the station keys missing '
+                             'from the input')
+    parser.add_argument('--verify', type=float, nargs='?', const=1.0, default=0.0,
+                        metavar='RATE',
+                        help='decode the messages again and compare them to the data; '
+                             'RATE is the part of the messages verified (default: 1.0)')
+    parser.add_argument('--row-workers', type=int, default=1, metavar='N',
+                        help='encode the chunks of --max-subsets rows of one input in N '
+                             'worker processes')
+    parser.add_argument('--mmap', action='store_true',
+                        help='read .dat files by memory mapping them straight to columns '
+                             '(less memory for big files)')
+    parser.add_argument('--durability', default='none', choices=output_writer.DURABILITY_LEVELS,
+                        help='sync the output files: none (default), batch = fsync them in '
+                             'group commits, file = fsync each file')
+    parser.add_argument('--commit-files', type=int, default=OPTIONS['commit_files'],
+                        metavar='N',
+                        help='number of output files in one group commit of --durability batch')
+    parser.add_argument('--group-by-time', action='store_true',
+                        help='encode the rows of each TTAAII and observation time to their '
+                             'own messages and output files')
+
+def options_from_arguments(args):
+    """
+    Returns the encoding options from the parsed command line arguments (args).
+    """
+    return {
+        'output_dir': args.output_dir,
+        'max_subsets': args.max_subsets,
+        'max_bytes': args.max_bytes,
+        'numbered_output': args.numbered_output,
+        'compressed': args.compressed,
+        'sort_by_station': args.sort_by_station,
+        'sequence': args.sequence,
+        'on_error': args.on_error,
+        'cache_dir': args.cache_dir,
+        'cache_max_bytes': args.cache_max_bytes,
+        'stations': args.stations,
+        'mmap': args.mmap,
+        'verify': args.verify,
+        'row_workers': args.row_workers,
+        'durability': args.durability,
+        'commit_files': args.commit_files,
+        'group_by_time': args.group_by_time,
+    }
+
 def main():
     """
     Main function gets input file from command line and sends it to message_encode
     function.
     message_encode writes the bufr message into the output file.
     The output file is named by input file information.
+    If there are several input files or the --batch option is used, the files are
+    encoded in a pool of worker processes by batch_encoding module.
+    With --profile and --metrics-json the stages of each input are measured by
+    metrics module.
+    With --validate-only the input files are only checked by validate_input, and
+    eccodes is not loaded.
+    The output directory (--output-dir) is made if it does not exist.
     """
-    if len(sys.argv) < 2:
-        print('Usage: ', sys.argv[0], ' input_filename', file=sys.stderr)
+    parser = argparse.ArgumentParser(description='Encodes rain observation data to bufr.')
+    parser.add_argument('input_filenames', nargs='*', metavar='input_filename',
+                        help='input files, or "-" to read stdin and write bufr to stdout')
+    parser.add_argument('--input-type', default='dat', choices=['dat', 'csv'],
+                        help='type of the data read from stdin (default: dat)')
+    parser.add_argument('--batch', metavar='DIR',
+                        help='encode all the input files in directory DIR')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                        help='number of worker processes in batch mode')
+    parser.add_argument('--validate-only', action='store_true',
+                        help='only check the input files, without encoding them')
+    add_encoding_arguments(parser)
+    bulletin_writer.add_bulletin_arguments(parser)
+    metrics.add_profile_arguments(parser)
+    args = parser.parse_args()
+    options = options_from_arguments(args)
+    records = [] if metrics.profiling(args) else None
+    if len(args.input_filenames) == 0 and args.batch is None:
+        parser.print_usage(sys.stderr)
         sys.exit(1)
-    input_filename = sys.argv[1]
 
-    with open(input_filename, 'r', encoding="utf8") as in_file:
-        print('input data from file: ', input_filename)
-        data_type = input_filename.split('.')
-        data_type = data_type[len(data_type) - 1]
-        try:
-            bufr_filename = message_encoding(in_file, data_type)
-        except CodesInternalError as err:
-            if VERBOSE:
-                traceback.print_exc(file=sys.stderr)
-            else:
-                print(err)
-            in_file.close()
-            sys.exit(1)
-        except Exception as err:
-            if VERBOSE:
-                traceback.print_exc(file=sys.stderr)
-            else:
-                print(err)
-            in_file.close()
+    if args.validate_only:
+        if '-' in args.input_filenames:
+            parser.error('"-" (stdin) can not be used with --validate-only')
+        input_filenames = list(args.input_filenames)
+        if args.batch is not None:
+            input_filenames.extend(batch_encoding.list_input_files(args.batch))
+        if batch_encoding.validate_files(input_filenames, args.workers, options) > 0:
             sys.exit(1)
-        finally:
-            in_file.close()
+        return
 
-    print('bufr data in file: ', bufr_filename)
+    if options['output_dir'] != '' and args.input_filenames != ['-']:
+        try:
+            os.makedirs(options['output_dir'], exist_ok=True)
+        except OSError as err:
+            parser.error('can not make the output directory: ' + str(err))
+
+    if args.batch is not None or len(args.input_filenames) > 1:
+        if '-' in args.input_filenames:
+            parser.error('"-" (stdin) can only be used alone')
+        input_filenames = list(args.input_filenames)
+        if args.batch is not None:
+            input_filenames.extend(batch_encoding.list_input_files(args.batch))
+        with bulletin_writer.from_arguments(args) or contextlib.nullcontext() as writer:
+            failed = batch_encoding.encode_files(input_filenames, args.workers, options, writer,
+                                                 records)
+        if records is not None:
+            metrics.report(records, args)
+        if failed > 0:
+            sys.exit(1)
+        return
+
+    input_filename = args.input_filenames[0]
+    pipe = input_filename == '-'
+    if pipe and args.bulletin is not None:
+        parser.error('"-" writes bufr to stdout, so it can not be used with --bulletin')
+    # In the pipe mode stdout has the bufr data, so the other messages go to stderr.
+    log = sys.stderr if pipe else sys.stdout
+    print('input data from file: ', 'stdin' if pipe else input_filename, file=log)
+    writer = bulletin_writer.from_arguments(args)
+    record = None
+    if records is not None:
+        record = metrics.new_record(input_filename)
+        records.append(record)
+    try:
+        if pipe:
+            stdin = io.TextIOWrapper(sys.stdin.buffer, encoding='utf8')
+            name = encode_stream(stdin, sys.stdout.buffer, args.input_type, options, record)
+            bufr_filenames = ['stdout (' + name + ')']
+        else:
+            bufr_filenames = encode_file(input_filename, options, writer, record)
+    except errors.RainToBufrError as err:
+        if VERBOSE and isinstance(err, errors.EncodingError):
+            traceback.print_exc(file=sys.stderr)
+        print(err, file=log)
+        sys.exit(1)
+    except Exception as err:
+        if VERBOSE:
+            traceback.print_exc(file=sys.stderr)
+        else:
+            print(err, file=log)
+        sys.exit(1)
+    finally:
+        if writer is not None:
+            writer.close()
+        if records is not None:
+            metrics.finish(record)
+            metrics.report(records, args)
+
+    print('bufr data in file: ', ', '.join(bufr_filenames), file=log)
 
 if __name__ == '__main__':
     sys.exit(main())
@@ -1,205 +1,202 @@
 """
 This module makes subset objects by different functions and Subset class.
+The values are kept in NumPy arrays, one array for each key, and they are converted
+and checked a whole column at a time.
 """
-import sys
-from eccodes import CODES_MISSING_LONG as miss
-from eccodes import CODES_MISSING_DOUBLE as missD
+import functools
+import numpy as np
+import bufr_sequences
+import errors
+import key_schema
+from missing_values import CODES_MISSING_LONG as miss
+from missing_values import CODES_MISSING_DOUBLE as missD
 
 class Subset:
     """
     This class makes objects of key names that are used in rain observation data.
-    All the values with the same key name are placed into the same object as an array.
+    All the values with the same key name are placed into the same object as a NumPy array
+    (integer or float) in which the missing values are set to CODES_MISSING_LONG or
+    CODES_MISSING_DOUBLE. Text values are kept in lists.
     The values are modified in different functions according to Codes manual (Vol. 1.2).
         1. At first Subset class gives a missing value for all the objects, which are not
            dependent on any other object. Only the number of subsets (NSUB)is set. The key
            names are read from the input array called key_array and they are set to another
            array called k_a. The values are read from the input array called value_array and
            they are set to another array called v_a.
-        2. Next a for loop goes through all the keys in the k_a array. If it finds a match
-           for a name typical key name, it makes an object named by the key name. The values
-           to the object are found from the v_a array according to key's position in the key
-           k_a array. Values are modified in different functions.
-        3. The last object which depend on other objects are set.
+        2. Next a for loop goes through the conversion plan of the keys in the k_a array
+           (see key_schema). For each key which is in the schema, it makes an object named
+           by the schema. The values to the object are found from the v_a array according
+           to key's position in the k_a array. Values are converted by the kind of the key.
+           If the bufr sequence (sequence, see bufr_sequences) is given, only the
+           objects which its encoding plan needs (see needed_attributes) are made, so
+           a wrong value which is not encoded does not reject the row.
+        3. The last object which depend on other objects are set, also only if the
+           sequence needs them.
         4. Functions which gives the right values to bufr message, are placed below.
     """
     # 1.
-    def __init__(self, key_array, value_array):
+    def __init__(self, key_array, value_array, sequence=None):
         k_a = key_array
         v_a = value_array
         self.NSUB = len(v_a[0])
-        miss_list = []
-        miss_char_list = []
-        while len(miss_list) < self.NSUB:
-            miss_list.append('-1e+100')
-            miss_char_list.append('')
-        self.TTAAII = miss_list
-        self.ELGROUND = str2float(miss_list, 0)
-        self.ELSNOW = str2float(miss_list, 11)
-        self.ELSTAT = str2float(miss_list, 12)
-        self.ELTERM = str2float(miss_list, 13)
-        self.LAT = str2float(miss_list, 14)
-        self.LON = str2float(miss_list, 15)
-        self.LONG_STATION_NAME = miss_char_list
-        self.SENSOR = str2float(miss_list, 0)
-        self.STATION_TYPE = str2int(miss_list, 1)
-        self.NSI = str2int(miss_list, 2)
-        self.DD = str2int(miss_list, 3)
-        self.GROUND = str2int(miss_list, 4)
-        self.GROUND06 = str2int(miss_list, 4)
-        self.HH24 = str2int(miss_list, 5)
-        self.MI = str2int(miss_list, 6)
-        self.MM = str2int(miss_list, 7)
-        self.METHODSNOW = str2int(miss_list, 8)
-        self.MSWE = str2int(miss_list, 9)
-        self.SDLWC = str2float(miss_list, 0)
-        self.SNOW06 = str2float(miss_list, 16)
-        self.SNOW18 = str2float(miss_list, 16)
-        self.SNOW_AWS = str2float(miss_list, 16)
-        self.SNOW_MAN = str2float(miss_list, 16)
-        self.SNOW = str2float(miss_list, 16)
-        self.SNOW_ARRAY = [self.SNOW06, self.SNOW18, self.SNOW_MAN, self.SNOW_AWS, self.SNOW]
-        self.SWE = str2float(miss_list, 0)
-        self.T = str2float(miss_list, 17)
-        self.WMO = str2int(miss_list, 0)
-        self.WSI_IDS = str2int(miss_list, 0)
-        self.WSI_IDI = str2int(miss_list, 0)
-        self.WSI_INR = str2int(miss_list, 0)
-        self.WSI_LID = miss_char_list
-        self.YYYY = str2int(miss_list, 10)
+        needed = None
+        if sequence is not None:
+            needed = needed_attributes(bufr_sequences.encoding_plan(sequence.name, False))
+        for spec in key_schema.SCHEMA.values():
+            if spec.kind == 'wigos':
+                for attribute, kind in zip(spec.attribute, ['int', 'int', 'int', 'text']):
+                    setattr(self, attribute, missing_column(kind, self.NSUB))
+            else:
+                setattr(self, spec.attribute, missing_column(spec.kind, self.NSUB))
+        self.SENSOR = missing_column('float', self.NSUB)
+        self.SDLWC = missing_column('float', self.NSUB)
 
     # 2.
-        for key in k_a:
-            if key == 'TTAAII':
-                self.TTAAII = v_a[k_a.index(key)]
-            elif key == 'ELGROUND':
-                self.ELGROUND = str2float(v_a[k_a.index(key)], 0)
-            elif key == 'ELSNOW':
-                self.ELSNOW = str2float(v_a[k_a.index(key)], 11)
-            elif key == 'ELSTAT':
-                self.ELSTAT = str2float(v_a[k_a.index(key)], 12)
-            elif key == 'ELTERM':
-                self.ELTERM = str2float(v_a[k_a.index(key)], 13)
-            elif key in ('LAT'):
-                self.LAT = str2float(v_a[k_a.index(key)], 14)
-            elif key in ('LON'):
-                self.LON = str2float(v_a[k_a.index(key)], 15)
-            elif key == 'NSI':
-                self.NSI = str2int(v_a[k_a.index(key)], 2)
-            elif key == 'STATION_NAME':
-                self.LONG_STATION_NAME = str2str(v_a[k_a.index(key)])
-            elif key == 'STATION_TYPE':
-                self.STATION_TYPE = str2int(v_a[k_a.index(key)], 1)
-            elif key in ('DD'):
-                self.DD = str2int(v_a[k_a.index(key)], 3)
-            elif key == 'GROUND':
-                self.GROUND = str2int(v_a[k_a.index(key)], 4)
-            elif key == 'GROUND06':
-                self.GROUND06 = str2int(v_a[k_a.index(key)], 4)
-            elif key in ('HH24'):
-                self.HH24 = str2int(v_a[k_a.index(key)], 5)
-            elif key in ('MI'):
-                self.MI = str2int(v_a[k_a.index(key)], 6)
-            elif key in ('MM'):
-                self.MM = str2int(v_a[k_a.index(key)], 7)
-            elif key == 'METHODSNOW':
-                self.METHODSNOW = str2int(v_a[k_a.index(key)], 8)
-            elif key == 'MSWE':
-                self.MSWE = str2int(v_a[k_a.index(key)], 9)
-            elif key == 'SNOW06':
-                self.SNOW06 = str2float(v_a[k_a.index(key)], 16)
-                self.SNOW_ARRAY[0] = self.SNOW06
-            elif key == 'SNOW18':
-                self.SNOW18 = str2float(v_a[k_a.index(key)], 16)
-                self.SNOW_ARRAY[1] = self.SNOW18
-            elif key == 'SNOW_MAN':
-                self.SNOW_MAN = str2float(v_a[k_a.index(key)], 16)
-                self.SNOW_ARRAY[2] = self.SNOW_MAN
-            elif key == 'SNOW_AWS':
-                self.SNOW_AWS = str2float(v_a[k_a.index(key)], 16)
-                self.SNOW_ARRAY[3] = self.SNOW_AWS
-            elif key == 'SNOW':
-                self.SNOW = str2float(v_a[k_a.index(key)], 16)
-                self.SNOW_ARRAY[4] = self.SNOW
-            elif key == 'SWE':
-                self.SWE = str2float(v_a[k_a.index(key)], 0)
-            elif key == 'T':
-                self.T = str2float(v_a[k_a.index(key)], 17)
-            elif key == 'WMO':
-                self.WMO = str2int(v_a[k_a.index(key)], 0)
-            elif key == 'WSI':
-                self.WSI_IDS = get_wigos(v_a[k_a.index(key)], 0)
-                self.WSI_IDI = get_wigos(v_a[k_a.index(key)], 1)
-                self.WSI_INR = get_wigos(v_a[k_a.index(key)], 2)
-                self.WSI_LID = get_wigos(v_a[k_a.index(key)], 3)
-            elif key in ('YYYY'):
-                self.YYYY = str2int(v_a[k_a.index(key)], 10)
+        for index, spec in key_schema.conversion_plan(tuple(k_a)):
+            attributes = spec.attribute
+            if not isinstance(attributes, list):
+                attributes = [attributes]
+            if needed is not None and needed.isdisjoint(attributes):
+                continue
+            values = v_a[index]
+            if spec.kind == 'int':
+                setattr(self, spec.attribute, str2int(values, spec.valid))
+            elif spec.kind == 'float':
+                setattr(self, spec.attribute, str2float(values, spec.conversion, spec.valid))
+            elif spec.kind == 'text':
+                setattr(self, spec.attribute, str2str(values))
+            elif spec.kind == 'wigos':
+                for attribute, column in zip(spec.attribute, get_wigos(values)):
+                    setattr(self, attribute, column)
+            else:
+                setattr(self, spec.attribute, values)
 
     # 3.
+        self.SNOW_ARRAY = [self.SNOW06, self.SNOW18, self.SNOW_MAN, self.SNOW_AWS, self.SNOW]
         self.STATEID = make_stateid(self.NSUB)
-        self.GR = ground_data(k_a, self.HH24, self.GROUND, self.GROUND06)
-        self.SNOW_TOTAL = snow_depth_total(self.HH24, k_a, self.GR, self.SNOW_ARRAY)
-        self.SDLWC = get_snow_density(self.SNOW_TOTAL, self.SWE)
-        self.SENSOR = height_of_sensor(self.ELSNOW)
+        self.GR = missing_column('int', self.NSUB)
+        self.SNOW_TOTAL = missing_column('float', self.NSUB)
+        if needed is None or 'GR' in needed:
+            self.GR = ground_data(k_a, self.HH24, self.GROUND, self.GROUND06)
+        if needed is None or 'SNOW_TOTAL' in needed:
+            self.SNOW_TOTAL = snow_depth_total(self.HH24, k_a, self.GR, self.SNOW_ARRAY)
+        if needed is None or 'SDLWC' in needed:
+            self.SDLWC = get_snow_density(self.SNOW_TOTAL, self.SWE)
+        if needed is None or 'SENSOR' in needed:
+            self.SENSOR = height_of_sensor(self.ELSNOW)
 
 # 4.
 
+# Objects which are made of other objects in step 3 of Subset, and the objects they
+# are made of.
+DERIVED = {
+    'GR': ('HH24', 'GROUND', 'GROUND06'),
+    'SNOW_TOTAL': ('HH24', 'GR', 'SNOW06', 'SNOW18', 'SNOW_MAN', 'SNOW_AWS', 'SNOW'),
+    'SDLWC': ('SNOW_TOTAL', 'SWE'),
+    'SENSOR': ('ELSNOW',),
+}
+
+@functools.lru_cache(maxsize=None)
+def needed_attributes(plan):
+    """
+    This function returns the Subset objects which the encoding plan (plan, see
+    bufr_sequences.encoding_plan) sets to the bufr keys, together with the objects
+    they are made of (DERIVED).
+    """
+    needed = set(step[2] for step in plan)
+    added = set(needed)
+    while len(added) > 0:
+        added = set(part for name in added for part in DERIVED.get(name, ())) - needed
+        needed.update(added)
+    return frozenset(needed)
+
 def make_stateid(nsub):
     """
     This function gives State identifier for each subset.
     In Finland, state identifier is 613. If this code is used to encode other
     countries data, this function needs to be modified.
     """
-    int_list =  []
-    while len(int_list) < nsub:
-        int_list.append(613)
-    return int_list
+    return np.full(nsub, 613, dtype=np.int64)
 
-def get_wigos(wigos_id, key_id):
+# Parts of a missing or wrongly written WIGOS identifier.
+MISSING_WIGOS = (miss, miss, miss, '')
+
+def get_wigos(wigos_id):
     """
-    This function splits WIGOS identifier (wigos_id)from "-" to get a wigos_array with:
-        wigos_array[0] = WIGOS identifier series = WSI_IDS  (value between 0-14)
-        wigos_array[1] = WIGOS issuer of identifier = WSI_IDI
+    This function splits WIGOS identifiers (wigos_id) by parse_wigos to get four columns:
+        [0] = WIGOS identifier series = WSI_IDS  (value between 0-14)
+        [1] = WIGOS issuer of identifier = WSI_IDI
             Value between 1 and 9 999 when no WMO number.
             Value between 10 000 and 99 999 otherwise.
-        wigos_array[2] = WIGOS issue number = WSI_INR
-        wigos_array[3] = WIGOS local identifier (character) = WSI_LID
+        [2] = WIGOS issue number = WSI_INR
+        [3] = WIGOS local identifier (character) = WSI_LID
             NSI number is used if WMO number is missing provided.
     https://wiki.fmi.fi/pages/viewpage.action?pageId=107195152
+    The first three columns are integer arrays and the last one is a list.
+    If identifiers are wrongly written, errors.RowError is raised for the rows
+    which have the same error as the first wrongly written identifier.
     """
-    wigos_term = []
+    wigos_terms = []
+    wrong_rows = []
+    first_error = ''
     for i in range(0, len(wigos_id)):
-        if wigos_id[i] != '-1e+100':
-            wigos_array = wigos_id[i].split('-')
-
-            if len(wigos_array)!= 4:
-                print('WIGOS identifier is wrongly written!\n')
-                sys.exit(1)
-            try:
-                wigos_array[0] = int(wigos_array[0])
-                wigos_array[1] = int(wigos_array[1])
-                wigos_array[2] = int(wigos_array[2])
-                if wigos_array[0] not in range(0, 15):
-                    print('WIGOS identifier series number should be in range (0, 14).\n')
-                    sys.exit(1)
-                elif wigos_array[1] not in range(1, 100000):
-                    print('WIGOS issuer of identifier number should be in range (1, 99 999).\n')
-                    sys.exit(1)
-                elif wigos_array[2] not in range(0, 100000):
-                    print('WIGOS issue number should be in range (0, 99 999.\n')
-                    sys.exit(1)
-                elif len(wigos_array[3])> 16:
-                    print('WIGOS local identifier should be 16 characters max.\n')
-                    sys.exit(1)
-                wigos_term.append(wigos_array[key_id])
-            except ValueError:
-                print('WIGOS identifier series, WIGOS issuer of identifier')
-                print('and WIGOS issuer number should be positive integers.\n')
-                sys.exit(1)
+        if wigos_id[i] != missD:
+            wigos_array, error = parse_wigos(wigos_id[i])
+            if error != '':
+                if first_error == '':
+                    first_error = error
+                if error == first_error:
+                    wrong_rows.append(i)
         else:
-            wigos_array = [miss, miss, miss, '']
-            wigos_term.append(wigos_array[key_id])
+            wigos_array = MISSING_WIGOS
+        wigos_terms.append(wigos_array)
+    if len(wrong_rows) > 0:
+        raise errors.RowError(first_error, wrong_rows, first_error.replace('\n', ' ').strip())
 
-    return wigos_term
+    columns = [np.array([term[key_id] for term in wigos_terms], dtype=np.int64)
+               for key_id in range(0, 3)]
+    columns.append([term[3] for term in wigos_terms])
+    return columns
+
+@functools.lru_cache(maxsize=65536)
+def parse_wigos(wigos_id):
+    """
+    This function splits one WIGOS identifier (wigos_id) from "-" and checks it by
+    wigos_error. Returns ((series, issuer, number, local identifier), error message).
+    If the identifier is wrongly written, the parts are missing and the error message
+    is not empty. The results are cached, because the same stations come again in
+    every input.
+    """
+    wigos_array = wigos_id.split('-')
+    error = wigos_error(wigos_array)
+    if error != '':
+        return (MISSING_WIGOS, error)
+    return ((int(wigos_array[0]), int(wigos_array[1]), int(wigos_array[2]), wigos_array[3]),
+            '')
+
+def wigos_error(wigos_array):
+    """
+    This function checks the parts of a WIGOS identifier (wigos_array) and returns an
+    error message, or an empty string if the identifier is written correctly.
+    """
+    if len(wigos_array)!= 4:
+        return 'WIGOS identifier is wrongly written!\n'
+    try:
+        series = int(wigos_array[0])
+        issuer = int(wigos_array[1])
+        number = int(wigos_array[2])
+    except ValueError:
+        return ('WIGOS identifier series, WIGOS issuer of identifier\n'
+                'and WIGOS issuer number should be positive integers.\n')
+    if series not in range(0, 15):
+        return 'WIGOS identifier series number should be in range (0, 14).\n'
+    elif issuer not in range(1, 100000):
+        return 'WIGOS issuer of identifier number should be in range (1, 99 999).\n'
+    elif number not in range(0, 100000):
+        return 'WIGOS issue number should be in range (0, 99 999.\n'
+    elif len(wigos_array[3])> 16:
+        return 'WIGOS local identifier should be 16 characters max.\n'
+    return ''
 
 def get_snow_density(depth, water_equivalent):
     """
@@ -207,22 +204,19 @@ def get_snow_density(depth, water_equivalent):
     and the snow water equivalent [kg/m²]:
         snow density [kg/m³] = snow water equivalent [kg/m²] / snow depth [m]
     Maximum value for snow density is 1023 kg/m³ and minimum value is 0 kg/m³.
+    If a density is out of the range, errors.RowError is raised for all the rows
+    with a wrong density.
     """
-    density = []
-    for i in range(0, len(depth)):
-        if missD in (depth[i], water_equivalent[i]):
-            density.append(missD)
-        elif depth[i] <= 0.0:
-            density.append(missD)
-        else:
-            s_d = water_equivalent[i]/depth[i]
-            if s_d > 1023 or s_d < 0:
-                message = str(s_d) + ' kg is a wrong value for snow density.'
-                message = message + '\nSnow density should be in range (0, 1023).\n'
-                print(message)
-                sys.exit(1)
-            else:
-                density.append(s_d)
+    missing = (depth == missD) | (water_equivalent == missD) | (depth <= 0.0)
+    density = np.full(len(depth), missD)
+    density[~missing] = water_equivalent[~missing] / depth[~missing]
+    wrong = ~missing & ((density > 1023) | (density < 0))
+    if wrong.any():
+        s_d = float(density[wrong][0])
+        message = str(s_d) + ' kg is a wrong value for snow density.'
+        message = message + '\nSnow density should be in range (0, 1023).\n'
+        raise errors.RowError(message, list(np.flatnonzero(wrong)),
+                              'Snow density should be in range (0, 1023).')
     return density
 
 def height_of_sensor(snow_sensor):
@@ -235,10 +229,9 @@ def height_of_sensor(snow_sensor):
         reported to be missing.
         The second value is the height of snow measurement sensor (snow_sensor).
     """
-    float_list = []
-    for i in range (0, len(snow_sensor)):
-        float_list.append(missD)
-        float_list.append(snow_sensor[i])
+    float_list = np.empty(2 * len(snow_sensor))
+    float_list[0::2] = missD
+    float_list[1::2] = snow_sensor
     return float_list
 
 def ground_data(key_list, hh_list, list1, list2):
@@ -248,30 +241,23 @@ def ground_data(key_list, hh_list, list1, list2):
     GROUND06 (list2) are used. If not, then values of GROUND (list1) are used.
     g_bufr array is used to map state of ground values from FMI data to global values used
     in bufr data. Source: https://wiki.fmi.fi/pages/viewpage.action?pageId=29868373.
-    The value 31 stands for a missing value.
+    Unknown and missing values are set to be missing (CODES_MISSING_LONG). In uncompressed
+    data it is encoded as 31, which is the missing value of the code table. In compressed
+    data the value 31 would not be recognized as missing.
     """
-    g_bufr = [0, 1, 2, 4, 11, 15, 12, 13, 16, 17]
-    int_list = []
-    for i in range (0, len(hh_list)):
-        if hh_list[i] == 6 and 'GROUND06' in key_list:
-            ind = list2[i]
-            if 0 <= ind <= 9:
-                int_list.append(g_bufr[ind])
-            else:
-                int_list.append(31)
-        else:
-            ind = list1[i]
-            if 0 <= ind <= 9:
-                int_list.append(g_bufr[ind])
-            else:
-                int_list.append(31)
-    return int_list
+    g_bufr = np.array([0, 1, 2, 4, 11, 15, 12, 13, 16, 17])
+    if 'GROUND06' in key_list:
+        ind = np.where(hh_list == 6, list2, list1)
+    else:
+        ind = list1
+    known = (ind >= 0) & (ind <= 9)
+    return np.where(known, g_bufr[np.where(known, ind, 0)], miss)
 
 def snow_depth(snow_value, gr_value):
     """
     This function chooses a right value of snow depth. It depends on:
-        snow_value = snow depth in data
-        gr_value = state of ground value in data
+        snow_value = snow depth values in data
+        gr_value = state of ground values in data
     Input data gives value -1 (-1 cm = -0.01 m) if there is no snow. This value is
     changed to 0.0 m.
     Input data gives value 0 (0 cm = 0.00 m) if there is little
@@ -281,13 +267,11 @@ def snow_depth(snow_value, gr_value):
     values are 11, 12, 15 or 16.
 
     """
-    value = snow_value
-    if snow_value == 0:
-        value = -0.01
-        if gr_value in (11, 12, 15, 16):
-            value = -0.02
-    elif snow_value == -0.01:
-        value = 0.0
+    value = snow_value.copy()
+    little_snow = snow_value == 0
+    value[little_snow] = -0.01
+    value[little_snow & np.isin(gr_value, (11, 12, 15, 16))] = -0.02
+    value[snow_value == -0.01] = 0.0
     return value
 
 def snow_depth_total(hh_list, key_list, gr_list, snow_list):
@@ -297,141 +281,80 @@ def snow_depth_total(hh_list, key_list, gr_list, snow_list):
         key_list = to see if it includes SNOW06, SNOW18, SNOW_MAN or SNOW_AWS key names
         gr_list = GR = state of ground data
         snow_list = SNOW = [SNOW06, SNOW18, SNOW_MAN, SNOW_AWS, SNOW] = values of snow depth.
+    SNOW06 is used at 5 o'clock and SNOW18 at 17 o'clock, otherwise the first one of
+    SNOW_MAN, SNOW_AWS and SNOW found in key_list.
     """
-    float_list = []
-    snow06_values = snow_list[0]
-    snow18_values = snow_list[1]
-    snow_man_values = snow_list[2]
-    snow_aws_values = snow_list[3]
-    snow_values = snow_list[4]
-    for i in range(0, len(hh_list)):
-        if 'SNOW06' in key_list and hh_list[i] == 5:
-            float_list.append(snow_depth(snow06_values[i], gr_list[i]))
-        elif 'SNOW18' in key_list and hh_list[i] == 17:
-            float_list.append(snow_depth(snow18_values[i], gr_list[i]))
-        elif 'SNOW_MAN' in key_list:
-            float_list.append(snow_depth(snow_man_values[i], gr_list[i]))
-        elif 'SNOW_AWS' in key_list:
-            float_list.append(snow_depth(snow_aws_values[i], gr_list[i]))
-        else:
-            float_list.append(snow_depth(snow_values[i], gr_list[i]))
-    return float_list
-
-def check_range(key_id):
-    """
-    This function returns a right range according to key_id.
-    Range for:
-        key_id = 1:  STATION_TYPE   minAllowed=0, maxAllowed=3
-        key_id = 2:  NSI            minAllowed=0, maxAllowed=1.07374e+09
-        key_id = 3:  DD             minAllowed=1, maxAllowed=31
-        key_id = 4:  GR             minAllowed=0, maxAllowed=31
-        key_id = 5:  HH24           minAllowed=0, maxAllowed=23
-        key_id = 6:  MI             minAllowed=0, maxAllowed=60
-        key_id = 7:  MM             minAllowed=1, maxAllowed=12
-        key_id = 8:  METHODSNOW     minAllowed=0, maxAllowed=15
-        key_id = 9:  MSWE           minAllowed=0, maxAllowed=63
-        key_id = 10: YYYY           minAllowed=0, maxAllowed=4095
-        key_id something else: wrong key_id -> unreachable range.
-    """
-    if key_id in range(1, 11):
-        value_ranges = [
-            range(0, 4), range(0, 1073740001), range(1, 32), range(0, 32),
-            range(0, 24), range(0, 61), range(1, 13), range(0, 16),
-            range(0, 64), range(0, 4096)
-            ]
-        value_range = value_ranges[key_id - 1]
+    if 'SNOW_MAN' in key_list:
+        snow_values = snow_list[2]
+    elif 'SNOW_AWS' in key_list:
+        snow_values = snow_list[3]
     else:
-        value_range = range(0, 0)
-    return value_range
+        snow_values = snow_list[4]
+    if 'SNOW18' in key_list:
+        snow_values = np.where(hh_list == 17, snow_list[1], snow_values)
+    if 'SNOW06' in key_list:
+        snow_values = np.where(hh_list == 5, snow_list[0], snow_values)
+    return snow_depth(snow_values, gr_list)
 
-def check_float_range(key_id):
+def missing_column(kind, nsub):
     """
-    This function returns an array with minAllowed and maxAllowed
-    values according to key_id.
-    Minimum and maximum values for:
-        key_id = 11:  ELSNOW   minAllowed=0,     maxAllowed=655.35
-        key_id = 12:  ELSTAT   minAllowed=-400,  maxAllowed=12707.1
-        key_id = 13:  ELTERM   minAllowed=1,     maxAllowed=655.35
-        key_id = 14:  LAT      minAllowed=-90,   maxAllowed=245.544
-        key_id = 15:  LON      minAllowed=-180,  maxAllowed=491.089
-        key_id = 16:  SNOW     minAllowed=-0.01, maxAllowed=655.33
-        key_id = 17:  T        minAllowed=0,     maxAllowed=655.35
-        key_id something else: wrong key_id -> unreachable range.
+    This function makes a column of nsub missing values for a key of kind (see key_schema):
+    CODES_MISSING_LONG for integers, CODES_MISSING_DOUBLE for floats and raw values and
+    '' for texts.
     """
-    value_ranges = [
-        [0.0, 655.35], [-400.0, 12707.1], [0.0, 655.35], [-90.0, 245.544],
-        [-180.0, 491.089], [-0.01, 655.33], [0.0, 655.35],
-    ]
-    if key_id in range(11, 18):
-        value_range = value_ranges[key_id - 11]
-    else:
-        value_range = [0.0, 0.0]
-    return value_range
+    if kind == 'int':
+        return np.full(nsub, miss, dtype=np.int64)
+    if kind == 'float':
+        return np.full(nsub, missD)
+    if kind == 'text':
+        return [''] * nsub
+    return [missD] * nsub
 
-
-def str2int(str_list, key_id):
+def str2int(str_list, valid=None):
     """
-    This function makes a string list (str_list) to an integer list (int_list).
-        key_id represents the id of different keys. Values are converted from string to
-        integer depending on key_id. Before this function, missing values = '/' are changed
-        to be '-1e+100', which in eccodes is the missing value of float type value.
+    This function makes a value list (str_list) to an integer array.
+        Before this function, missing values = '/' are changed to be -1e+100,
+        which in eccodes is the missing value of float type value.
         It is changed to be a missing value of integer type.
-    This function uses check_range function, to check if the value is in a right range.
-    If the value is not in the right range, the value is set to be missing.
+    If the value is not in the valid range ([minAllowed, maxAllowed], see key_schema),
+    the value is set to be missing.
     """
-    int_list = []
-    for i in range (0, len(str_list)):
-        if str_list[i] == '-1e+100':
-            int_list.append(miss)
-        elif key_id != 0 and int(float(str_list[i])) not in check_range(key_id):
-            int_list.append(miss)
-        else:
-            int_list.append(int(float(str_list[i])))
-    return int_list
+    values = np.asarray(str_list, dtype=float)
+    missing = (values == missD) | ~(np.abs(values) < 2.0**62)
+    int_array = np.where(missing, 0.0, values).astype(np.int64)
+    if valid is not None:
+        missing |= (int_array < valid[0]) | (int_array > valid[1])
+    int_array[missing] = miss
+    return int_array
 
-def str2float(str_list, key_id):
+def str2float(str_list, conversion=None, valid=None):
     """
-    This function makes a string list (str_list) to a float list (float_list).
-        key_id represents the id of different keys. Values are converted from string to
-        float depending on key_id. Before this function, missing values = '/' are changed
-        to be '-1e+100' which in eccodes is the missing value of float type value.
-    This function uses check_float_range function, to check if the value is in a right range.
-    If the value is not in the right range, the value is set to be missing.
+    This function makes a value list (str_list) to a float array.
+        Before this function, missing values = '/' are changed to be -1e+100
+        which in eccodes is the missing value of float type value.
+        conversion is a unit conversion of key_schema.CONVERSIONS, for example
+        centimeters to meters ('cm_to_m') or degrees Celsius to kelvins
+        ('celsius_to_kelvin').
+    If the converted value is not in the valid range ([minAllowed, maxAllowed], see
+    key_schema), the value is set to be missing.
     """
-    float_list = []
-    float_range = check_float_range(key_id)
-    for i in range (0, len(str_list)):
-        if str_list[i] == '-1e+100':
-            float_list.append(float(str_list[i]))
-        elif key_id in (11, 12, 13, 14, 15):
-            if float_range[0] <= float(str_list[i]) <= float_range[1]:
-                float_list.append(float(str_list[i]))
-            else:
-                float_list.append(missD)
-        elif key_id == 16:
-            cm_to_m = float(str_list[i])* 0.010
-            if float_range[0] <= cm_to_m <= float_range[1]:
-                float_list.append(cm_to_m)
-            else:
-                float_list.append(missD)
-        elif key_id == 17:
-            c_to_k = float(str_list[i])+ 273.15
-            if float_range[0] <= c_to_k <= float_range[1]:
-                float_list.append(c_to_k)
-            else:
-                float_list.append(missD)
-        else:
-            float_list.append(float(str_list[i]))
-    return float_list
+    float_array = np.array(str_list, dtype=float)
+    missing = float_array == missD
+    if conversion is not None:
+        float_array = key_schema.CONVERSIONS[conversion](float_array)
+    if valid is not None:
+        missing |= ~((valid[0] <= float_array) & (float_array <= valid[1]))
+    float_array[missing] = missD
+    return float_array
 
 def str2str(str_list):
     """
     This function makes string list (str_list) to string list with considering the missing values:
-        It changes '-1e+100' to MISS_CHAR = ''.
+        It changes -1e+100 to MISS_CHAR = ''.
     """
     char_list = []
     for i in range (0, len(str_list)):
-        if str_list[i] == '-1e+100':
+        if str_list[i] == missD:
             char_list.append('')
         else:
             char_list.append(str_list[i])
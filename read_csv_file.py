@@ -1,96 +1,179 @@
 """
-read_csv_file.py transfers csv data to a form which can be converted to bufr message.
+read_csv_file.py transfers csv data to a form which can be converted to bufr message:
+[[array to name the output file], [[ [key, value], [key, value], ...]]],
+which is the same form as read_dat_file makes.
+The first row of csv data has the key names and the other rows have the values,
+separated by "|":
+    key1|key2|key3|...|keyn
+    value1|value2|value3|...|valuen
+Key names of the database export (for example "ttaaii", "wsi", "stationName", "day")
+are changed to the key names of the dat files (CSV_KEYS). Other key names are
+used as they are, so a csv file can also have the key names of the dat files.
+The numeric values are converted to floats while the file is read. Empty values
+and "/" are missing values.
+Errors are raised as errors.InputError (the file can not be read) and errors.RowError
+(a data row is wrongly written).
 """
-import sys
+import math
+import errors
+import key_schema
+import read_dat_file
 
-def read(csv_file):
+# Csv key names which differ from the key names of the dat files.
+CSV_KEYS = {
+    'ttaaii': 'TTAAII',
+    'wsi': 'WSI',
+    'wmon': 'WMO',
+    'nsi': 'NSI',
+    'stationName': 'STATION_NAME',
+    'longStationName': 'STATION_NAME',
+    'stationType': 'STATION_TYPE',
+    'lat': 'LAT',
+    'lon': 'LON',
+    'elstat': 'ELSTAT',
+    'elground': 'ELGROUND',
+    'elsnow': 'ELSNOW',
+    'year': 'YYYY',
+    'month': 'MM',
+    'day': 'DD',
+    'hour': 'HH24',
+    'minute': 'MI',
+    'obstime': 'OBSTIME',
+    'ground': 'GROUND',
+    'ground06': 'GROUND06',
+    'methodSnow': 'METHODSNOW',
+    'snow': 'SNOW',
+    'snow06': 'SNOW06',
+    'snow18': 'SNOW18',
+    'snowMan': 'SNOW_MAN',
+    'snowAws': 'SNOW_AWS',
+    'swe': 'SWE',
+    't': 'T',
+}
+MISSING_VALUES = frozenset(['', '/'])
+
+def read(csv_file, quarantine=None):
     """
-    This function reads lines from csv_file and checks (check_data) if the csv data
-    contains the right parts for fetching the data. Then it sends the rows of
-    data to read_filename function to get the name for the output file. After that
-    it calls read_csv to get keys and values from input file.
+    1. Reads the first row (key names) from csv_file and checks (read_keys) it.
+    2. Reads the data rows one by one. Each row is checked and separated to key-value
+       pairs by read_row in the same pass, so the file is gone through only once.
+       If a quarantine (errors.Quarantine) is given, wrongly written rows are added to
+       it and left out. Otherwise the first wrongly written row raises errors.RowError.
+    3. The name for the output file is taken from the first data row (read_filename).
     """
-    rows_in_input_file = csv_file.readlines()
-    check_data(rows_in_input_file)
-    output = read_filename(rows_in_input_file)
-    data_in = read_csv(rows_in_input_file)
-    return [output, data_in]
 
-def print_error_message(head_message, text):
+    # 1.
+    keys = read_keys(csv_file.readline())
+
+    # 2.
+    data = []
+    row_number = 1
+    for row in csv_file:
+        row_number += 1
+        if row.strip() == '':
+            continue
+        try:
+            data.append(read_row(keys, row, row_number))
+        except errors.RowError as err:
+            if quarantine is None:
+                raise
+            quarantine.add(row_number, err.reason)
+            continue
+        if quarantine is not None:
+            quarantine.row_numbers.append(row_number)
+    if len(data) == 0:
+        raise errors.InputError(error_message(1, 'Csv file seems not to have any data.\n'))
+
+    # 3.
+    output = read_filename(data[0])
+    return [output, data]
+
+def error_message(head_message, text):
     """
-    This function prints out error message and stops the program.
+    This function returns an error message.
         If head_message = 0: Error is in the first row of data file which includes key names.
         If head_message = 1: Error is in the data structure in csv file.
         Function gets argument text, which adds information to the error text.
     """
-    print('\nError in csv data:\n')
+    lines = ['\nError in csv data:\n']
     if head_message == 0:
-        print('The first row in csv file with n key names should be:')
-        print('key1|key2|key3|...|keyn')
-        print(text)
+        lines.append('The first row in csv file with n key names should be:')
+        lines.append('key1|key2|key3|...|keyn')
     elif head_message == 1:
-        print('The data rows in csv data with n data values should be: ')
-        print('value1|value2|value3|...|valuen')
-        print(text)
-    sys.exit(1)
+        lines.append('The data rows in csv data with n data values should be: ')
+        lines.append('value1|value2|value3|...|valuen')
+    lines.append(text)
+    return '\n'.join(lines)
 
-def check_data(data):
+def read_keys(row):
     """
-    This function checks if the data section in csv file is written correctly.
+    This function checks the first row (row) of csv data and returns its key names
+    changed to the key names of the dat files.
     """
-    try:
-        data[0]
-    except IndexError:
-        print_error_message(1, 'Csv file seems not to have any data.\n')
-
-    number_of_data_points = data[0].count('|')
-    if len(data[0].split('|')) < 1:
-        message = 'The first row does not seem to have any key names.\n'
-        print_error_message(0, message)
-    for i in range(1, len(data)):
-        if '|' not in data[i]:
-            message = 'Csv file has wrongly written data in row ' + str(i+1) + '.\n'
-            print_error_message(1, message)
-        elif number_of_data_points != data[i].count('|'):
-            message = 'Number of values differ from number of key names in row ' + str(i+1) + '.\n'
-            print_error_message(1, message)
+    if row == '':
+        raise errors.InputError(error_message(0, 'Csv file is empty!\n'))
+    names = row.rstrip('\r\n').split('|')
+    keys = []
+    for name in names:
+        name = name.strip()
+        if name == '':
+            raise errors.InputError(error_message(0, 'The first row has an empty key name.\n'))
+        keys.append(CSV_KEYS.get(name, name))
+    for key in ['DD', 'HH24', 'MI']:
+        if key not in keys:
+            message = 'Key "' + key + '" is needed to name the output file.\n'
+            raise errors.InputError(error_message(0, message))
+    return keys
 
-    message_start = 'Csv file has wrongly written data in row '
-    no_number_in_value_list = ['wsi', 'longStationName', 'ttaaii', 'stationName']
-    keys = data[0].split('|')
-    for i in range(1, len(data)):
-        values = data[i].split('|')
-        for j in range(0, len(values)):
-            if keys[j] not in no_number_in_value_list:
-                try:
-                    float(values[j])
-                except ValueError:
-                    message =  message_start + str(i+1) + '.\n' 'Values should be numbers.\n'
-                    print_error_message(1, message)
-
-def read_filename(row):
+def read_row(keys, row, row_number):
     """
-    This function chooses right parts from csv data to name the output file.
+    This function checks if a data row (row) is written correctly and separates it
+    to key-value pairs: [[key, value], [key, value], ...].
+    Values of the keys which are not in read_dat_file.NO_NUMBER_KEYS are converted
+    to floats. Missing values (empty or "/") are changed to "/".
+    row_number is the number of the row in the csv file, it is used in the error messages.
     """
-    key_name_row = row[0].split('|')
-    first_data_row = row[1].split('|')
-    day = first_data_row[key_name_row.index('day')]
-    hour = first_data_row[key_name_row.index('hour')]
-    minute = first_data_row[key_name_row.index('minute')]
-    output = ['TTAAII', day, hour, minute]
-    return output
+    values = row.rstrip('\r\n').split('|')
+    if len(values) != len(keys):
+        message = 'Number of values differ from number of key names in row ' + str(row_number)
+        raise errors.RowError(error_message(1, message + '.\n'), [row_number],
+                              'Number of values differ from number of key names.')
+
+    row_with_key_value_pairs = []
+    for key, value in zip(keys, values):
+        value = value.strip()
+        if value in MISSING_VALUES:
+            value = '/'
+        elif key not in read_dat_file.NO_NUMBER_KEYS:
+            try:
+                value = float(value)
+            except ValueError:
+                message = ('Csv file has wrongly written data in row ' + str(row_number)
+                           + '.\nValues should be numbers.\n')
+                raise errors.RowError(error_message(1, message), [row_number],
+                                      'Value of "' + key + '" should be a number.')
+        row_with_key_value_pairs.append([key, value])
+    return row_with_key_value_pairs
 
-def read_csv(rows):
+def read_filename(row):
     """
-    This function transforms csv data to a form:
-    [[key, value], [key, value], ...]
+    This function chooses right parts from the first data row (row) to name the
+    output file: [TTAAII, day, hour, minute].
     """
-    key_name_row = rows[0].split('|')
-    data = []
-    for i in range(1, len(rows)):
-        row = rows[i].split('|')
-        data_row = []
-        for j in range(0, len(row)):
-            data_row.append([key_name_row[j], row[j]])
-        data.append(data_row)
-    return data
+    values = dict(row)
+    ttaaii = values.get('TTAAII', '/')
+    if ttaaii == '/':
+        ttaaii = 'TTAAII'
+    parts = [ttaaii]
+    for key in ['DD', 'HH24', 'MI']:
+        value = values[key]
+        if value == '/':
+            message = 'Value of "' + key + '" is needed to name the output file.\n'
+            raise errors.InputError(error_message(1, message))
+        low, high = key_schema.SCHEMA[key].valid
+        if not math.isfinite(value) or value != int(value) or not low <= value <= high:
+            message = ('Value of "' + key + '" to name the output file should be an integer '
+                       'from ' + str(low) + ' to ' + str(high) + '!\n')
+            raise errors.InputError(error_message(1, message))
+        parts.append(str(int(value)).zfill(2))
+    return parts
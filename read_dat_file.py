@@ -1,86 +1,335 @@
 """
 read_dat_file.py reads data from dat file and converts it to a form:
-[[array to name the output file], [[ [key=value], [key=value], ...]]].
+[[array to name the output file], [[ [key, value], [key, value], ...]]].
+The numeric values are converted to floats while the file is read.
+Errors are raised as errors.InputError (the file can not be read) and errors.RowError
+(a data row is wrongly written).
+read_columns reads a big file with less memory: it memory maps the file and parses
+the values from its bytes straight to NumPy columns.
 """
-import sys
+import mmap
+import os
+import numpy as np
+from missing_values import CODES_MISSING_DOUBLE
+import errors
+import separate_keys_and_values
 
-def read(dat_file):
+# Keys which have a text value. Values of all the other keys should be numbers or "/".
+NO_NUMBER_KEYS = frozenset([
+    'WSI', 'LONG_STATION_NAME', 'TTAAII',
+    'STATION_NAME', 'OBSTIME', 'WS_MAX_3H_T'
+])
+END_ERROR = 'Data row does not end to sign "*".\n'
+# Number of bytes of a memory mapped file which are counted for rows at a time.
+COUNT_BLOCK = 1 << 20
+
+def read(dat_file, quarantine=None):
     """
-    1. Reads lines from input_file (dat_file) and checks (check_name) if the file's first row
-       contains right parts to give a name to the output file. After that it checks (check_data)
-       if the data in input_file contains right parts for fetching the data.
+    1. Reads the first row from input_file (dat_file) and checks (check_name) if it
+       contains right parts to give a name to the output file.
     2. Sends the first row of input file to read_filename to get the name for the
        output file. After that it checks if output has a right number of values for naming
        the file.
-    3. Calls read_dat to get the keys and the values from input file.
+    3. Reads the rest of the rows one by one. Each row is checked and separated to key-value
+       pairs by read_row in the same pass, so the file is gone through only once.
+       If a quarantine (errors.Quarantine) is given, wrongly written rows are added to
+       it and left out. Otherwise the first wrongly written row raises errors.RowError.
+       The errors are reported in the same order as when the rows were checked in
+       two passes: a row without the ";", "=" or "*" signs (check_structure) is
+       reported before a wrong value in an earlier row. So after the first wrong
+       value, the rest of the rows are only checked by check_structure.
     """
 
     # 1.
-    rows_in_input_file = dat_file.readlines()
-    check_name(rows_in_input_file)
-    check_data(rows_in_input_file)
+    first_row = dat_file.readline()
+    check_name(first_row)
 
     # 2.
-    output = read_filename(rows_in_input_file[0])
+    output = read_filename(first_row)
     if len(output) != 4:
-        print_error_message(0, '\n')
+        raise errors.InputError(error_message(0, '\n'))
+
     # 3.
-    data = read_dat(rows_in_input_file[1:])
+    data = []
+    row_number = 1
+    wrong_value = None
+    for row in dat_file:
+        row_number += 1
+        if wrong_value is not None:
+            check_structure(row, row_number)
+            continue
+        try:
+            data.append(read_row(row, row_number))
+        except errors.RowError as err:
+            if quarantine is None:
+                check_structure(row, row_number)
+                wrong_value = err
+                continue
+            quarantine.add(row_number, err.reason)
+            continue
+        if quarantine is not None:
+            quarantine.row_numbers.append(row_number)
+    if wrong_value is not None:
+        raise wrong_value
+    if len(data) == 0:
+        raise errors.InputError(error_message(1, 'Input file seems to not have any data.\n'))
     data_in = [output, data]
 
     return data_in
 
-def print_error_message(head_message, text):
+def read_columns(dat_file, quarantine=None):
+    """
+    Reads a .dat file (dat_file, an open file on disk) like read, but straight to
+    columns: all the values of a key are in the same column, as
+    separate_keys_and_values.get_columns makes them of the data of read. The rows
+    are not kept, so the memory needed is about the size of the columns.
+        1. The file is memory mapped, so it is never in memory as a whole. The first
+           row is checked and read as in read. The rows are counted (count_rows), so
+           the number columns can be made once in their full length.
+        2. The rest of the rows are read one by one. A row with the same key names as
+           an earlier row is parsed from the bytes of the file by split_row and
+           Columns.add_bytes: the numbers are written straight to preallocated NumPy
+           columns (8 bytes for each value) and the texts to lists in which the same
+           texts are shared. The first row of each key names, and any row which is
+           not plainly written, is checked and read by read_row and added by
+           Columns.add, so the values and the errors (in the same order as in read)
+           are the same as without memory mapping. Rows with other key names than
+           the earlier rows get their own Columns.
+        3. The key names are checked as in separate_keys_and_values.check_keys. In
+           quarantine (errors.Quarantine), the wrongly written rows and the rows
+           with other key names than the most common ones are dropped to it as in
+           read and separate_keys_and_values.drop_rows_with_other_keys.
+        4. The filled part of the columns is returned.
+    Missing values ("/") are CODES_MISSING_DOUBLE as in separate_keys_and_values.
+    Returns [array to name the output file, keys, columns].
+    """
+    # 1.
+    if os.fstat(dat_file.fileno()).st_size == 0:
+        check_name('')
+    with mmap.mmap(dat_file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        first_row = decode_row(mapped.readline())
+        check_name(first_row)
+        output = read_filename(first_row)
+        if len(output) != 4:
+            raise errors.InputError(error_message(0, '\n'))
+        capacity = count_rows(mapped, mapped.tell())
+
+        # 2.
+        groups = {}
+        groups_of_bytes = {}
+        texts = {}
+        row_number = 1
+        wrong_value = None
+        for line in iter(mapped.readline, b''):
+            row_number += 1
+            if wrong_value is not None:
+                check_structure(decode_row(line), row_number)
+                continue
+            pairs = split_row(line)
+            if pairs is not None:
+                byte_keys = tuple(pair[0] for pair in pairs)
+                group = groups_of_bytes.get(byte_keys)
+                if group is not None and group.add_bytes(pairs, row_number, texts):
+                    continue
+            try:
+                row_with_key_value_pairs = read_row(decode_row(line), row_number)
+            except errors.RowError as err:
+                if quarantine is None:
+                    check_structure(decode_row(line), row_number)
+                    wrong_value = err
+                    continue
+                quarantine.add(row_number, err.reason)
+                continue
+            keys = tuple(key_value[0] for key_value in row_with_key_value_pairs)
+            if keys not in groups:
+                groups[keys] = Columns(keys, capacity)
+            groups[keys].add(row_with_key_value_pairs, row_number, texts)
+            if pairs is not None:
+                groups_of_bytes[byte_keys] = groups[keys]
+    if wrong_value is not None:
+        raise wrong_value
+    if len(groups) == 0:
+        raise errors.InputError(error_message(1, 'Input file seems to not have any data.\n'))
+
+    # 3.
+    keys = max(groups, key=lambda group_keys: groups[group_keys].count)
+    if len(groups) > 1:
+        if quarantine is None:
+            raise errors.InputError(separate_keys_and_values.KEY_ERROR)
+        for other_keys, group in groups.items():
+            if other_keys != keys:
+                for row_number in group.row_numbers[:group.count].tolist():
+                    quarantine.add(row_number, separate_keys_and_values.OTHER_KEYS_REASON)
+    group = groups[keys]
+    if quarantine is not None:
+        quarantine.row_numbers = group.row_numbers[:group.count].tolist()
+
+    # 4.
+    columns = [column[:group.count] if isinstance(column, np.ndarray) else column
+               for column in group.columns]
+    return [output, list(keys), columns]
+
+class Columns:
+    """
+    Columns of the rows which have the same key names (keys) in read_columns.
+    The number columns and the row numbers are NumPy arrays of capacity values,
+    of which the first count are filled. The text columns are lists.
+    """
+    def __init__(self, keys, capacity):
+        self.numbers = [key not in NO_NUMBER_KEYS for key in keys]
+        self.columns = [np.empty(capacity) if number else [] for number in self.numbers]
+        self.row_numbers = np.empty(capacity, dtype=np.int64)
+        self.count = 0
+
+    def add(self, row_with_key_value_pairs, row_number, texts):
+        """
+        Adds a row read by read_row (row_with_key_value_pairs). Missing values ("/")
+        are CODES_MISSING_DOUBLE and the same texts are shared through texts.
+        """
+        for column, key_value in zip(self.columns, row_with_key_value_pairs):
+            value = key_value[1]
+            if value == '/':
+                value = CODES_MISSING_DOUBLE
+            elif isinstance(value, str):
+                value = texts.setdefault(value, value)
+            if isinstance(column, list):
+                column.append(value)
+            else:
+                column[self.count] = value
+        self.row_numbers[self.count] = row_number
+        self.count += 1
+
+    def add_bytes(self, pairs, row_number, texts):
+        """
+        Adds a row split by split_row (pairs of key and value bytes). Returns False,
+        without adding anything, if a value is not what read_row would read from it
+        without a question: a number which float does not read or a text which is
+        not UTF-8. The row is then read by read_row.
+        """
+        row_texts = []
+        for number, column, pair in zip(self.numbers, self.columns, pairs):
+            value = pair[1]
+            if value == b'/':
+                value = CODES_MISSING_DOUBLE
+            elif number:
+                try:
+                    value = float(value)
+                except ValueError:
+                    return False
+            else:
+                try:
+                    value = value.decode('utf8')
+                except UnicodeDecodeError:
+                    return False
+                value = texts.setdefault(value, value)
+            if number:
+                column[self.count] = value
+            else:
+                row_texts.append([column, value])
+        for column, value in row_texts:
+            column.append(value)
+        self.row_numbers[self.count] = row_number
+        self.count += 1
+        return True
+
+def count_rows(mapped, position):
+    """
+    This function counts the rows of a memory mapped file (mapped) from position on,
+    a part of the file at a time.
+    """
+    rows = 0
+    size = len(mapped)
+    if position < size and mapped[size - 1:] != b'\n':
+        rows += 1
+    while position < size:
+        rows += mapped[position:position + COUNT_BLOCK].count(b'\n')
+        position += COUNT_BLOCK
+    return rows
+
+def split_row(line):
+    """
+    This function splits a plainly written data row (line, bytes of a memory mapped
+    file) to pairs of key and value bytes: [[key, value], [key, value], ...]. A row
+    which is not plainly written (it has no ";", a pair without one "=", other "*"
+    signs than the last one or it does not end to "*") gives None, so it is read by
+    read_row, which finds out what is wrong in it.
+    """
+    if line.endswith(b'*\n'):
+        line = line[:-2]
+    elif line.endswith(b'*\r\n'):
+        line = line[:-3]
+    elif line.endswith(b'*'):
+        line = line[:-1]
+    else:
+        return None
+    if b'*' in line:
+        return None
+    pairs = [pair.split(b'=') for pair in line.split(b';')]
+    if len(pairs) < 2:
+        return None
+    for pair in pairs:
+        if len(pair) != 2:
+            return None
+    return pairs
+
+def decode_row(line):
+    """
+    This function decodes a row (line, bytes) of a memory mapped file to a string with
+    "\\n" line ending, as it is read from a file opened as text.
+    """
+    row = line.decode('utf8')
+    if row.endswith('\r\n'):
+        row = row[:-2] + '\n'
+    return row
+
+def error_message(head_message, text):
     """
-    This function prints out error message and stops program.
+    This function returns an error message.
         If head_message = 0: Error is in the first row, which is used to name the bufr file.
         If head_message = 1: Error is in the data structure.
         Function gets argument text, which adds information to the error text.
     """
-    print('\nError in the data:\n')
+    lines = ['\nError in the data:\n']
     if head_message == 0:
-        print('Error with naming the bufr file.')
-        print('The first data row in the input file should be: ')
-        print('FILENAME: /path/to/file/TTAAII_year-month-day_hour:minute_something.dat')
-        print(text)
+        lines.append('Error with naming the bufr file.')
+        lines.append('The first data row in the input file should be: ')
+        lines.append('FILENAME: /path/to/file/TTAAII_year-month-day_hour:minute_something.dat')
     elif head_message == 1:
-        print('Data row in input file with n data values should be: ')
-        print('keyname1=value1;keyname2=value2;keyname3=value3;...;keynamen=valuen*')
-        print(text)
-    sys.exit(1)
+        lines.append('Data row in input file with n data values should be: ')
+        lines.append('keyname1=value1;keyname2=value2;keyname3=value3;...;keynamen=valuen*')
+    lines.append(text)
+    return '\n'.join(lines)
 
-def check_name(data):
+def check_name(row):
     """
-    This function checks if the first row in data (data) is written correctly.
+    This function checks if the first row (row) of the input file is written correctly.
     """
-    try:
-        test = data[0]
-    except IndexError:
-        print_error_message(0, 'Input file is empty!\n')
-
-    if 'FILENAME: ' not in data[0]:
-        print_error_message(0, '"FILENAME:  " is missing!\n')
-    elif '.dat' not in data[0]:
-        print_error_message(0, '".dat" is missing!\n')
-    elif '_' not in data[0]:
-        print_error_message(0, '"_" are missing!\n')
-
-    test = data[0].split('/')
+    if row == '':
+        raise errors.InputError(error_message(0, 'Input file is empty!\n'))
+
+    if 'FILENAME: ' not in row:
+        raise errors.InputError(error_message(0, '"FILENAME:  " is missing!\n'))
+    elif '.dat' not in row:
+        raise errors.InputError(error_message(0, '".dat" is missing!\n'))
+    elif '_' not in row:
+        raise errors.InputError(error_message(0, '"_" are missing!\n'))
+
+    test = row.split('/')
     test = test[len(test) - 1].split('_')
     if len(test) < 4:
-        print_error_message(0, 'Amount of "_" is less than 3!\n')
+        raise errors.InputError(error_message(0, 'Amount of "_" is less than 3!\n'))
     elif '-' not in test[1]:
-        print_error_message(0, '"-" or "_" in wrong place!\n')
+        raise errors.InputError(error_message(0, '"-" or "_" in wrong place!\n'))
     elif ':' not in test[2]:
-        print_error_message(0, '":" not in right place!\n')
+        raise errors.InputError(error_message(0, '":" not in right place!\n'))
 
     day = test[1].split('-')
     time = test[2].split(':')
 
     if len(day) != 3:
-        print_error_message(0, '"year-month-day" is wrongly written!\n')
+        raise errors.InputError(error_message(0, '"year-month-day" is wrongly written!\n'))
     elif len(time) !=2:
-        print_error_message(0, '"hour:minute" is wrongly written!\n')
+        raise errors.InputError(error_message(0, '"hour:minute" is wrongly written!\n'))
     try:
         int(day[0])
         int(day[1])
@@ -88,65 +337,74 @@ def check_name(data):
         int(time[0])
         int(time[1])
     except ValueError:
-        print_error_message(0, 'year, month, day, hour and minute should be integers!\n')
+        message = 'year, month, day, hour and minute should be integers!\n'
+        raise errors.InputError(error_message(0, message))
 
-def check_value(value, row_index, key_value_index, array_lenght):
+def row_error_message(row_number, text):
     """
-    This function check if the data values are either numbers or "/". Also the
-    last value is checked to contain "*" sign.
+    This function makes an error message text for the data row number row_number.
     """
-    message_start = 'Input file has wrongly written data in row '
-    try:
-        if value != '/*\n' and key_value_index == array_lenght - 1:
-            last_value = value.split('*')
-            float(last_value[0])
-        elif value != '/' and key_value_index != array_lenght - 1:
-            float(value)
-    except IndexError:
-        message = message_start + str(row_index + 1) + '.\n'
-        print_error_message(1, message)
-    except ValueError:
-        message = message_start + str(row_index + 1) + '.\n' + 'No number or / after = sign.\n'
-        print_error_message(1, message)
+    return 'Input file has wrongly written data in row ' + str(row_number) + '.\n' + text
 
-def check_data(data):
+def row_error(row_number, text):
     """
-    This function checks if the data section in input file is written correctly.
+    This function makes an errors.RowError for the data row number row_number.
+    text tells what is wrong in the row.
     """
-    message_start = 'Input file has wrongly written data in row '
-    try:
-        data[1]
-    except IndexError:
-        print_error_message(1, 'Input file seems to not have any data.\n')
-
-    for i in range(1, len(data)):
-        row = data[i]
-        if ';' not in data[i] or '=' not in data[i] or '*' not in data[i]:
-            message = message_start + str(i+1) + '.\n'
-            print_error_message(1, message)
-        elif row[-1] in ('\n', '*'):
-            if row[-1] == '\n' and row[-2] != '*':
-                message = message_start + str(i+1) + '.\n' + 'Data row does not end to sign "*".\n'
-                print_error_message(1, message)
-        else:
-            message = message_start + str(i+1) + '.\n' + 'Data row does not end to sign "*".\n'
-            print_error_message(1, message)
-
-    no_number_in_value_list = [
-        'WSI', 'LONG_STATION_NAME', 'TTAAII',
-        'STATION_NAME', 'OBSTIME', 'WS_MAX_3H_T'
-    ]
-    for i in range(1, len(data)):
-        row = data[i]
-        key_value_pair = row.split(';')
-        for j in range(0, len(key_value_pair)):
-            if '=' in key_value_pair[j]:
-                key_value = key_value_pair[j].split('=')
-                if key_value[0] not in no_number_in_value_list:
-                    check_value(key_value[1], i, j, len(key_value_pair))
-            else:
-                message = message_start + str(i+1) + '.\n' + 'No "=" sign between key and value.\n'
-                print_error_message(1, message)
+    reason = (text or 'Data row is wrongly written.').strip()
+    return errors.RowError(error_message(1, row_error_message(row_number, text)),
+                           [row_number], reason)
+
+def check_structure(row, row_number):
+    """
+    This function checks that a data row (row) has ";", "=" and "*" signs and that it
+    ends to "*". If not, errors.RowError is raised.
+    """
+    if ';' not in row or '=' not in row or '*' not in row:
+        raise row_error(row_number, '')
+    elif row[-1] == '\n':
+        if row[-2] != '*':
+            raise row_error(row_number, END_ERROR)
+    elif row[-1] != '*':
+        raise row_error(row_number, END_ERROR)
+
+def read_row(row, row_number):
+    """
+    This function checks if a data row (row) is written correctly and separates it
+    to key-value pairs: [[key, value], [key, value], ...].
+        1. Checks that the row has ";", "=" and "*" signs and that it ends to "*".
+        2. Splits the row from ";" and each key=value pair from "=". The "*" is removed
+           from the last value.
+        3. Values of the keys which are not in NO_NUMBER_KEYS are converted to floats.
+           Missing values ("/") are left as they are.
+    row_number is the number of the row in the input file, it is used in the error messages.
+    """
+    # 1.
+    check_structure(row, row_number)
+
+    # 2.
+    key_value_pairs = row.split(';')
+    last = len(key_value_pairs) - 1
+    row_with_key_value_pairs = []
+    for j in range(0, len(key_value_pairs)):
+        key_value_pair = key_value_pairs[j]
+        if '=' not in key_value_pair:
+            raise row_error(row_number, 'No "=" sign between key and value.\n')
+        key_value = key_value_pair.split('=')
+        key = key_value[0]
+        value = key_value[1]
+        if j == last:
+            value = value.split('*')[0]
+
+        # 3.
+        if value != '/' and key not in NO_NUMBER_KEYS:
+            try:
+                value = float(value)
+            except ValueError:
+                raise row_error(row_number, 'No number or / after = sign.\n')
+        row_with_key_value_pairs.append([key, value])
+
+    return row_with_key_value_pairs
 
 def read_filename(row):
     """
@@ -175,30 +433,3 @@ def read_filename(row):
     output.append(time[1])
 
     return output
-
-def read_dat(rows):
-    """
-    Separates data to key and value arrays:
-        1. Splits rows from ";", -> [ [key=value], [key=value], ...]
-        2. Splits: [key=value] in each row to [key, value] and the last value from "*".
-    """
-    # 1.
-    split_rows = []
-    for row in rows:
-        split_rows.append(row.split(';'))
-
-    # 2.
-    rows_with_key_value_pairs = []
-    for i in range(0, len(split_rows)):
-        key_value_array = []
-        row = split_rows[i]
-        for j in range(0, len(row)):
-            key_value_pair = row[j]
-            split_key_value = key_value_pair.split('=')
-            if j == len(row) - 1:
-                last_value = split_key_value[1]
-                only_value = last_value.split('*')
-                split_key_value[1] = only_value[0]
-            key_value_array.append(split_key_value)
-        rows_with_key_value_pairs.append(key_value_array)
-    return rows_with_key_value_pairs
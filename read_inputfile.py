@@ -1,27 +1,29 @@
 """
 read_inputfile.py checks input file format (.dat or .csv) and
 sends it to a right function according to data type.
-However, right now only the ".dat"-ending files are accepted.
 """
-import sys
+import os
+import stat
+import errors
 import read_dat_file
-# import read_csv_file
+import read_csv_file
 
-def get_data(data_file, data_type):
+UNKNOWN_TYPE_ERROR = ('Unknown data type.\n\n'
+                      'This program can only encode files which end with: ".dat" or ".csv".\n')
+
+def get_data(data_file, data_type, quarantine=None):
     """
     This function sends data_file to a right function according to the data_type.
     "read_dat_file.read" and "read_csv_file.read" functions converts ".dat"
-    (and ".csv") -data to a form, which is easier to convert to a bufr message.
-    Csv-format has not been implemented.
+    and ".csv" -data to a form, which is easier to convert to a bufr message.
+    If a quarantine (errors.Quarantine) is given, wrongly written rows are dropped to it.
     """
     if data_type == 0:
-        data = read_dat_file.read(data_file)
-    # elif data_type == 1:
-    #     data = read_csv_file.read(data_file)
+        data = read_dat_file.read(data_file, quarantine)
+    elif data_type == 1:
+        data = read_csv_file.read(data_file, quarantine)
     else:
-        print('Unknown data type.\n')
-        print('This program can only encode files which end with: ".dat".\n')
-        sys.exit(1)
+        raise errors.InputError(UNKNOWN_TYPE_ERROR)
     return data
 
 def check_data_type(name_of_data_type):
@@ -29,15 +31,25 @@ def check_data_type(name_of_data_type):
     This function checks weather the data file name ends to: ".dat" or ".csv".
         If dat -> 0
         If csv data -> 1
-        If something else -> program stops with error message.
-    Csv-format has not been implemented.
+        If something else -> errors.InputError is raised.
     """
     if name_of_data_type == 'dat':
         data_type = 0
-    # elif name_of_data_type == 'csv':
-    #     data_type = 1
+    elif name_of_data_type == 'csv':
+        data_type = 1
     else:
-        print('Unknown data type.\n')
-        print('This program can only encode files which end with: ".dat".\n')
-        sys.exit(1)
+        raise errors.InputError(UNKNOWN_TYPE_ERROR)
     return data_type
+
+def can_map(data_file, data_type):
+    """
+    This function checks if data_file can be read by read_dat_file.read_columns:
+    it should be ".dat" data (data_type = 0) in a regular file. Pipes and texts in
+    memory can not be memory mapped.
+    """
+    if data_type != 0:
+        return False
+    try:
+        return stat.S_ISREG(os.fstat(data_file.fileno()).st_mode)
+    except (AttributeError, OSError, ValueError):
+        return False
@@ -1,7 +1,14 @@
 """
 This module separates keys and values.
 """
-from eccodes import CODES_MISSING_DOUBLE
+from collections import Counter
+import numpy as np
+from missing_values import CODES_MISSING_DOUBLE
+import errors
+
+KEY_ERROR = ('Error in data structure:\n\n'
+             'Key names in each measurement should be the same and in the same order.\n')
+OTHER_KEYS_REASON = 'Key names differ from the other rows.'
 
 def get_keys(row_with_key_value_pairs):
     """
@@ -22,7 +29,8 @@ def get_values(row_with_key_value_pairs):
     """
     This function gets the values and sets them in an array.
     Input "row_with_key_value_pairs" is one observation,
-    which includes key/value pairs.
+    which includes key/value pairs. Missing values ("/") are changed to
+    CODES_MISSING_DOUBLE.
     """
     number_of_pairs = len(row_with_key_value_pairs)
     values = []
@@ -30,11 +38,66 @@ def get_values(row_with_key_value_pairs):
         key_value = row_with_key_value_pairs[i]
         value = key_value[1]
         if value == '/':
-            value = str(CODES_MISSING_DOUBLE)
+            value = CODES_MISSING_DOUBLE
         values.append(value)
 
     return values
 
+def get_columns(data):
+    """
+    This function separates the keys and the values of data, which is a list of
+    observations with key/value pairs. Returns [keys, columns], where columns has
+    an array of values for each key.
+    """
+    return [check_keys(data), get_value_columns(data)]
+
+def check_keys(data):
+    """
+    This function checks that all the observations in data have the same keys
+    in the same order and returns the keys. If not, errors.InputError is raised.
+    """
+    keys_in_each_row = []
+    for i in range(0, len(data)):
+        keys_in_each_row.append(get_keys(data[i]))
+
+    if are_all_the_rows_similar(keys_in_each_row) is False:
+        raise errors.InputError(KEY_ERROR)
+
+    return keys_in_each_row[0]
+
+def drop_rows_with_other_keys(data, quarantine):
+    """
+    This function finds the most common key names (in the same order) of the
+    observations in data. The observations with other key names are dropped to
+    the quarantine (errors.Quarantine). Returns the rest of the observations.
+    """
+    keys_in_each_row = [tuple(get_keys(row)) for row in data]
+    keys = Counter(keys_in_each_row).most_common(1)[0][0]
+    kept = []
+    row_numbers = []
+    for row, row_keys, row_number in zip(data, keys_in_each_row, quarantine.row_numbers):
+        if row_keys == keys:
+            kept.append(row)
+            row_numbers.append(row_number)
+        else:
+            quarantine.add(row_number, OTHER_KEYS_REASON)
+    quarantine.row_numbers = row_numbers
+    return kept
+
+def get_value_columns(data):
+    """
+    This function puts the values of data (observations with key/value pairs) to
+    columns: all the values with the same key are in the same array.
+    """
+    columns = []
+    for i in range(0, len(data[0])):
+        columns.append([])
+    for i in range(0, len(data)):
+        values = get_values(data[i])
+        for j in range(0, len(values)):
+            columns[j].append(values[j])
+    return columns
+
 def are_all_the_rows_similar(rows):
     """
     This function checks if all the rows are the same.
@@ -61,4 +124,17 @@ def longest_row(rows):
         if l_b > l_a:
             longest = i + 1
     return longest
-  
\ No newline at end of file
+
+def select_rows(columns, indices):
+    """
+    This function returns the rows (indices) of the data, which is in the columns
+    format: all the values of a key in the same array. The rows are returned in the
+    order of indices and in the same format. NumPy array columns are selected as arrays.
+    """
+    selected = []
+    for column in columns:
+        if isinstance(column, np.ndarray):
+            selected.append(column[np.asarray(indices, dtype=np.int64)])
+        else:
+            selected.append([column[i] for i in indices])
+    return selected
@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+
+"""
+spool_daemon.py is a long-running service which encodes the input files that appear
+in an incoming spool directory. The process stays alive between the files, so eccodes
+is loaded only once.
+Run program by command: python3 spool_daemon.py path/to/the/spool/directory
+
+A file is picked up only when its name ends to one of the input file endings (".dat", ".csv").
+A file should be written under another name (for example "name.dat.tmp") and renamed
+to its final name when it is complete. Renaming is atomic, so the daemon never sees
+a half written file.
+After encoding, the input file is moved to the done directory, or to the failed
+directory together with a ".error" file which contains the error message.
+SIGTERM and SIGINT stop the daemon after the files already in the work queue
+have been encoded.
+"""
+import argparse
+import os
+import queue
+import signal
+import sys
+import threading
+import time
+import batch_encoding
+import bulletin_writer
+import output_writer
+import rain2bufr
+
+class SpoolDaemon:
+    """
+    This class watches the spool directory (spool_dir) and encodes the files in it.
+        1. run scans the spool directory every poll_interval seconds and puts the new
+           files to a work queue, which holds queue_size files at most. When the queue
+           is full, the rest of the files are left for the next scan.
+        2. The worker thread takes the files from the queue and encodes them with the
+           encoding options (see rain2bufr.OPTIONS). The messages are written to the
+           output files, or appended to the bulletin of writer (see bulletin_writer)
+           if it is given. The input files are moved to done_dir or failed_dir.
+           The output files are written by an output writer (see output_writer).
+           With options['durability'] 'batch', they are committed when the queue is
+           empty or options['commit_files'] files are waiting, and each input file
+           is moved only after its own output files have been committed. The
+           bulletin is synced in the same way before the input files are moved.
+        3. stop is called by the signal handlers. Scanning ends and run waits until
+           the worker has encoded all the queued files.
+    """
+    def __init__(self, spool_dir, options, done_dir, failed_dir,
+                 queue_size=100, poll_interval=1.0, writer=None):
+        self.spool_dir = spool_dir
+        self.options = options
+        self.writer = writer
+        self.done_dir = done_dir
+        self.failed_dir = failed_dir
+        self.poll_interval = poll_interval
+        self.work_queue = queue.Queue(maxsize=queue_size)
+        self.queued = set()
+        self.files = output_writer.from_options(rain2bufr.get_options(options))
+        self.uncommitted = []
+        self.stopping = threading.Event()
+        for directory in (options['output_dir'], done_dir, failed_dir):
+            os.makedirs(directory, exist_ok=True)
+
+    # 1.
+    def run(self):
+        """
+        Runs the daemon until stop is called.
+        """
+        worker = threading.Thread(target=self.work, name='encoder')
+        worker.start()
+        while not self.stopping.is_set():
+            self.scan()
+            self.stopping.wait(self.poll_interval)
+
+        # 3.
+        while worker.is_alive():
+            try:
+                self.work_queue.put(None, timeout=self.poll_interval)
+                break
+            except queue.Full:
+                continue
+        worker.join()
+        if self.writer is not None:
+            self.writer.close()
+
+    def scan(self):
+        """
+        Puts the complete input files in the spool directory to the work queue.
+        """
+        for input_filename in batch_encoding.list_input_files(self.spool_dir):
+            if input_filename in self.queued:
+                continue
+            try:
+                self.work_queue.put_nowait(input_filename)
+            except queue.Full:
+                break
+            self.queued.add(input_filename)
+
+    # 2.
+    def work(self):
+        """
+        Encodes the files from the work queue until it gets None. An error with one
+        file is printed and the file is moved to the failed directory, so the worker
+        keeps encoding the next files.
+        """
+        while True:
+            input_filename = self.work_queue.get()
+            if input_filename is None:
+                break
+            try:
+                self.encode(input_filename)
+            except Exception as err:
+                self.log('ERROR ', os.path.basename(input_filename),
+                         type(err).__name__ + ': ' + str(err))
+                if self.finish([input_filename, [], type(err).__name__ + ': ' + str(err)]):
+                    self.queued.discard(input_filename)
+        self.commit()
+
+    def encode(self, input_filename):
+        """
+        Encodes one input file and writes its output files.
+        """
+        result = batch_encoding.encode_one(input_filename, self.options, True)
+        if result[2] == '':
+            self.files.start(input_filename)
+            try:
+                result[1] = rain2bufr.write_groups(result[1], self.options, self.writer,
+                                                   None, self.files)
+            except OSError as err:
+                self.files.discard(input_filename)
+                result = [input_filename, [], 'OSError: ' + str(err), None]
+        self.uncommitted.append(result)
+        if self.writer is not None and self.files.durability == 'batch':
+            ready = len(self.uncommitted) >= self.files.commit_files
+        else:
+            ready = len(self.files.waiting) == 0 or self.files.full()
+        if ready or self.work_queue.empty():
+            self.commit()
+
+    def commit(self):
+        """
+        Commits the waiting output files (and syncs the bulletin) and then finishes
+        their input files. The input files whose output could not be committed are
+        moved to the failed directory.
+        """
+        uncommitted = self.uncommitted
+        self.uncommitted = []
+        failed = self.files.commit()
+        if self.writer is not None and len(uncommitted) > 0:
+            try:
+                self.writer.sync()
+            except OSError as err:
+                failed = dict((result[0], err) for result in uncommitted)
+        for result in uncommitted:
+            if result[2] == '' and result[0] in failed:
+                result[1] = []
+                result[2] = 'OSError: ' + str(failed[result[0]])
+        for result in uncommitted:
+            if self.finish(result):
+                self.queued.discard(result[0])
+
+    def finish(self, result):
+        """
+        Moves the input file to the done or failed directory according to the
+        result of batch_encoding.encode_one. If the input file can not be moved (for
+        example it was removed while it was encoded), the error is printed.
+        Returns True if the input file was moved. A file which was not moved is kept
+        in the queued files, so it is not encoded again at every scan.
+        """
+        input_filename, bufr_filenames, message = result[:3]
+        name = os.path.basename(input_filename)
+        try:
+            if message == '' and len(bufr_filenames) > 0:
+                os.replace(input_filename, os.path.join(self.done_dir, name))
+                self.log('OK    ', name, '->', ', '.join(bufr_filenames))
+                return True
+            with open(os.path.join(self.failed_dir, name + '.error'), 'w',
+                      encoding='utf8') as error_file:
+                error_file.write(message + '\n')
+            os.replace(input_filename, os.path.join(self.failed_dir, name))
+        except OSError as err:
+            self.log('ERROR ', name, type(err).__name__ + ': ' + str(err))
+            return False
+        self.log('FAILED', name)
+        return True
+
+    def log(self, *parts):
+        """
+        Prints a line of the parts with the time.
+        """
+        print(time.strftime('%Y-%m-%d %H:%M:%S'), *parts, flush=True)
+
+    # 3.
+    def stop(self, signum=None, frame=None):
+        """
+        Stops scanning the spool directory. Queued files are still encoded.
+        """
+        self.stopping.set()
+
+def main():
+    """
+    Main function gets the spool directory and the other settings from command line
+    and runs the daemon. By default, output, done and failed directories are
+    made inside the spool directory.
+    """
+    parser = argparse.ArgumentParser(description='Encodes the files of a spool directory to bufr.')
+    parser.add_argument('spool_dir')
+    parser.add_argument('--done-dir', help='default: SPOOL_DIR/done')
+    parser.add_argument('--failed-dir', help='default: SPOOL_DIR/failed')
+    parser.add_argument('--queue-size', type=int, default=100,
+                        help='maximum number of files waiting in the work queue')
+    parser.add_argument('--poll-interval', type=float, default=1.0,
+                        help='seconds between the scans of the spool directory')
+    rain2bufr.add_encoding_arguments(parser)
+    bulletin_writer.add_bulletin_arguments(parser)
+    args = parser.parse_args()
+    options = rain2bufr.options_from_arguments(args)
+    if options['output_dir'] == '':
+        options['output_dir'] = os.path.join(args.spool_dir, 'output')
+
+    daemon = SpoolDaemon(
+        args.spool_dir, options,
+        args.done_dir or os.path.join(args.spool_dir, 'done'),
+        args.failed_dir or os.path.join(args.spool_dir, 'failed'),
+        args.queue_size, args.poll_interval, bulletin_writer.from_arguments(args)
+    )
+    signal.signal(signal.SIGTERM, daemon.stop)
+    signal.signal(signal.SIGINT, daemon.stop)
+    daemon.run()
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+
+"""
+station_registry.py keeps the static metadata of the stations, so that the input files
+do not need to repeat it on every row. The keys of STATION_KEYS which are not in an
+input are filled in from the registry by the national station number (NSI) of each
+row, or by the WIGOS identifier (WSI) if the row has no NSI.
+
+The registry is written as a text file with one row for each station, in the same
+format as the data rows of a .dat file (a key which is not known is left out or "/"):
+    NSI=101004;WSI=0-20000-0-02978;LAT=60.18;LON=24.94;ELSTAT=4;STATION_NAME=Helsinki;STATION_TYPE=1*
+The text file is compiled to an index file (name of the text file + ".idx"), which
+has a header (HEADER_DTYPE) and a record (RECORD_DTYPE) for each station in the order
+of NSI. The index is made again when the text file is newer than it. The index is
+memory mapped, so it is loaded only once in each process and the pages are shared by
+the processes. It can be compiled beforehand by command:
+    python3 station_registry.py stations.dat
+WSI can have 32 and STATION_NAME 64 bytes at most.
+"""
+import os
+import sys
+import tempfile
+import numpy as np
+from missing_values import CODES_MISSING_DOUBLE as missD
+import errors
+import read_dat_file
+
+STATION_KEYS = ('NSI', 'WSI', 'LAT', 'LON', 'ELSTAT', 'STATION_NAME', 'STATION_TYPE')
+TEXT_KEYS = ('WSI', 'STATION_NAME')
+MAGIC = b'R2BSTAT1'
+HEADER_DTYPE = np.dtype([('magic', 'S8'), ('count', '<i8')])
+RECORD_DTYPE = np.dtype([('NSI', '<i8'), ('LAT', '<f8'), ('LON', '<f8'), ('ELSTAT', '<f8'),
+                         ('STATION_TYPE', '<f8'), ('WSI', 'S32'), ('STATION_NAME', 'S64')])
+INDEX_ENDING = '.idx'
+
+# Open registries of this process by file name.
+REGISTRIES = {}
+
+def open_registry(options):
+    """
+    Returns the registry (StationRegistry) of options['stations'], or None if it is
+    not given. The registry is opened once in each process.
+    """
+    filename = options.get('stations', '')
+    if filename == '':
+        return None
+    if filename not in REGISTRIES:
+        REGISTRIES[filename] = StationRegistry(filename)
+    return REGISTRIES[filename]
+
+def registry_error(filename, text):
+    """
+    Returns errors.InputError with an error message about the registry file (filename).
+    """
+    return errors.InputError('\nError in the station registry ' + filename + ':\n' + text)
+
+def compile_registry(source_filename, index_filename):
+    """
+    Reads the station rows of the text file (source_filename) and writes them to
+    the index file (index_filename). If a station is in several rows, the last one
+    is used. The index is written to a temporary file which is renamed, so a process
+    which opens the index at the same time never sees half of it.
+    """
+    stations = {}
+    with open(source_filename, 'r', encoding='utf8') as fin:
+        for row_number, row in enumerate(fin, start=1):
+            if row.strip() == '':
+                continue
+            try:
+                values = dict(read_dat_file.read_row(row, row_number))
+            except errors.RowError as err:
+                raise registry_error(source_filename, str(err)) from err
+            if values.get('NSI', '/') == '/':
+                raise registry_error(source_filename,
+                                     'Row ' + str(row_number) + ' has no NSI.\n')
+            stations[int(values['NSI'])] = values
+
+    records = np.zeros(len(stations), dtype=RECORD_DTYPE)
+    for i, nsi in enumerate(sorted(stations)):
+        values = stations[nsi]
+        records['NSI'][i] = nsi
+        for key in STATION_KEYS[1:]:
+            value = values.get(key, '/')
+            if key in TEXT_KEYS:
+                value = b'' if value == '/' else value.encode('utf8')
+                if len(value) > RECORD_DTYPE[key].itemsize:
+                    raise registry_error(source_filename, key + ' of station ' + str(nsi) +
+                                         ' is too long.\n')
+            elif value == '/':
+                value = missD
+            records[key][i] = value
+
+    header = np.array([(MAGIC, len(records))], dtype=HEADER_DTYPE)
+    directory = os.path.dirname(os.path.abspath(index_filename))
+    fd, temp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as fout:
+            fout.write(header.tobytes())
+            fout.write(records.tobytes())
+        os.chmod(temp_path, 0o644)
+        os.replace(temp_path, index_filename)
+    except OSError:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+class StationRegistry:
+    """
+    This class is the station registry of a text file or of an index file (filename,
+    see the beginning of the module).
+        records:     the memory mapped records of the stations in the order of NSI.
+    fill adds the station keys which are not in an input to its columns.
+    """
+    def __init__(self, filename):
+        if filename.endswith(INDEX_ENDING):
+            index_filename = filename
+        else:
+            index_filename = filename + INDEX_ENDING
+            if (not os.path.exists(index_filename)
+                    or os.path.getmtime(index_filename) < os.path.getmtime(filename)):
+                compile_registry(filename, index_filename)
+        with open(index_filename, 'rb') as fin:
+            content = fin.read(HEADER_DTYPE.itemsize)
+            if len(content) < HEADER_DTYPE.itemsize or not content.startswith(MAGIC):
+                raise registry_error(index_filename, 'The file is not a station index.\n')
+        count = int(np.frombuffer(content, dtype=HEADER_DTYPE)[0]['count'])
+        if count == 0:
+            self.records = np.zeros(0, dtype=RECORD_DTYPE)
+        else:
+            self.records = np.memmap(index_filename, dtype=RECORD_DTYPE, mode='r',
+                                     offset=HEADER_DTYPE.itemsize, shape=(count,))
+        self.wsi_index = None
+
+    def lookup(self, keys, columns):
+        """
+        Finds the stations of the rows of an input (keys, columns, see
+        separate_keys_and_values.get_columns). Returns an array with the index of the
+        station record of each row, or -1 if the station is not in the registry.
+        """
+        found = np.full(len(columns[0]), -1, dtype=np.int64)
+        if len(self.records) == 0:
+            return found
+        if 'NSI' in keys:
+            nsi = np.asarray(columns[keys.index('NSI')], dtype=float)
+            position = np.minimum(np.searchsorted(self.records['NSI'], nsi),
+                                  len(self.records) - 1)
+            known = self.records['NSI'][position] == nsi
+            found[known] = position[known]
+        if 'WSI' in keys and (found < 0).any():
+            if self.wsi_index is None:
+                self.wsi_index = {}
+                for i, wsi in enumerate(self.records['WSI']):
+                    if wsi != b'':
+                        self.wsi_index.setdefault(wsi.decode('utf8'), i)
+            wsi = columns[keys.index('WSI')]
+            for i in np.flatnonzero(found < 0):
+                found[i] = self.wsi_index.get(wsi[i], -1)
+        return found
+
+    def fill(self, keys, columns):
+        """
+        Adds the keys of STATION_KEYS which are not in keys to the input (keys,
+        columns). Their values are taken from the registry. The values of the rows whose
+        station is not in the registry are missing. The input must have NSI or WSI.
+        Returns [keys, columns] as new lists.
+        """
+        missing_keys = [key for key in STATION_KEYS if key not in keys]
+        if len(missing_keys) == 0 or ('NSI' not in keys and 'WSI' not in keys):
+            return [keys, columns]
+        found = self.lookup(keys, columns)
+        known = found >= 0
+        rows = self.records[np.where(known, found, 0)] if len(self.records) > 0 else None
+        new_columns = []
+        for key in missing_keys:
+            if rows is None:
+                new_columns.append([missD] * len(found))
+            elif key in TEXT_KEYS:
+                new_columns.append([value.decode('utf8') if is_known and value != b'' else missD
+                                    for value, is_known in zip(rows[key], known)])
+            else:
+                new_columns.append(np.where(known, rows[key], missD).tolist())
+        return [list(keys) + missing_keys, list(columns) + new_columns]
+
+def main():
+    """
+    Compiles the index of each registry text file given on the command line.
+    """
+    if len(sys.argv) < 2:
+        print('usage: python3 station_registry.py stations.dat [...]', file=sys.stderr)
+        sys.exit(1)
+    for filename in sys.argv[1:]:
+        try:
+            compile_registry(filename, filename + INDEX_ENDING)
+        except errors.RainToBufrError as err:
+            print(err, file=sys.stderr)
+            sys.exit(1)
+        print('station index in file:', filename + INDEX_ENDING)
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,19 @@
+"""
+Settings of the tests: the modules of the program are imported from the directory
+above this one.
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# A small .dat input with two stations.
+DAT_TEXT = (
+    'FILENAME: /x/ISXD62_2022-04-04_06:00_SC_20220811080144.dat\n'
+    'TTAAII=ISXD62;ELSTAT=6;NSI=100908;LAT=59.77909;LON=21.37479;STATION_NAME=Parainen Uto;'
+    'STATION_TYPE=1;WSI=0-20000-0-02981;DD=04;HH24=06;MI=00;MM=04;ELRAIN=1.5;RR_PERIOD=-12;'
+    'RR=3.4;YYYY=2022*\n'
+    'TTAAII=ISXD62;ELSTAT=96;NSI=100963;LAT=60.49137;LON=23.76629;STATION_NAME=Lohja;'
+    'STATION_TYPE=1;WSI=0-246-0-100963;DD=04;HH24=06;MI=00;MM=04;ELRAIN=/;RR_PERIOD=-12;'
+    'RR=0.0;YYYY=2022*\n'
+)
@@ -0,0 +1,56 @@
+"""
+Tests of batch_encoding.py.
+"""
+import io
+import os
+from conftest import DAT_TEXT
+import batch_encoding
+import benchmark
+import rain2bufr
+
+def write_inputs(directory):
+    """
+    Writes two inputs, a wrongly written input and a file which is not an input
+    to directory.
+    """
+    directory.mkdir()
+    for hour in ('06', '07'):
+        (directory / (hour + '.dat')).write_text(DAT_TEXT.replace('06:00', hour + ':00'))
+    (directory / '08.dat').write_text(DAT_TEXT.replace('RR=3.4', 'RR=x'))
+    (directory / 'notes.txt').write_text('not an input\n')
+
+def test_files_are_encoded_as_one_at_a_time(tmp_path, capsys):
+    write_inputs(tmp_path / 'input')
+    input_filenames = batch_encoding.list_input_files(str(tmp_path / 'input'))
+    assert [os.path.basename(name) for name in input_filenames] == ['06.dat', '07.dat',
+                                                                    '08.dat']
+    for workers in (1, 2):
+        output_dir = tmp_path / ('output' + str(workers))
+        output_dir.mkdir()
+        failed = batch_encoding.encode_files(input_filenames, workers,
+                                             {'output_dir': str(output_dir)})
+        out, err = capsys.readouterr()
+        assert failed == 1
+        assert [line.split()[0] for line in out.splitlines()] == ['OK', 'OK', 'FAILED',
+                                                                  '2']
+        assert 'data in row 2.' in err
+        for hour in ('06', '07'):
+            messages = rain2bufr.encode_messages(
+                io.StringIO(DAT_TEXT.replace('06:00', hour + ':00')), 'dat')[2]
+            output = output_dir / ('ISXD62_EFKL_04' + hour + '00.bufr')
+            assert output.read_bytes() == b''.join(messages)
+        assert len(os.listdir(output_dir)) == 2
+
+def test_chunks_of_one_input_are_encoded_as_in_one_process(tmp_path):
+    filename = str(tmp_path / 'input.dat')
+    benchmark.generate_dat(filename, 300, 'snow06', ground06=True)
+    with open(filename, 'a', encoding='utf8') as fout:
+        fout.write(DAT_TEXT.split('\n')[1].replace('RR=3.4', 'RR=x') + '\n')
+    results = []
+    for row_workers in (1, 4):
+        options = {'max_subsets': 40, 'row_workers': row_workers, 'on_error': 'quarantine'}
+        groups = rain2bufr.encode_file_messages(filename, options)
+        results.append([[group[:3], group[3].entries] for group in groups])
+    assert results[1] == results[0]
+    assert sum(len(group[0][2]) for group in results[0]) == 8
+    assert results[0][0][1] == [[302, 'No number or / after = sign.']]
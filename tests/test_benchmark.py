@@ -0,0 +1,27 @@
+"""
+Tests of benchmark.py.
+"""
+import pytest
+import benchmark
+import rain2bufr
+
+@pytest.mark.parametrize('key_set', sorted(benchmark.KEY_SETS))
+def test_generated_data_is_encoded(tmp_path, key_set):
+    path = tmp_path / 'input.dat'
+    filename = str(path)
+    benchmark.generate_dat(filename, 50, key_set, ground06=True)
+    first = path.read_text()
+    benchmark.generate_dat(filename, 50, key_set, ground06=True)
+    assert path.read_text() == first
+    groups = rain2bufr.encode_file_messages(filename, rain2bufr.get_options(None))
+    assert sum(len(group[2]) for group in groups) == 1
+
+def test_run_measures_every_stage(capsys):
+    options = rain2bufr.get_options({'max_subsets': 20})
+    result = benchmark.run([50], ['snow'], False, 0.1, 2, options)
+    case = result['results'][0]
+    assert case['rows'] == 50
+    assert case['messages'] == 3
+    assert sorted(case['times']) == sorted(benchmark.STAGES)
+    assert case['total'] == sum(case['times'].values())
+    assert len(capsys.readouterr().out.splitlines()) == 1
@@ -0,0 +1,20 @@
+"""
+Tests of bufr_sequences.py.
+"""
+import pytest
+import bufr_sequences
+import errors
+
+def test_sequences_match_key_schema():
+    for sequence in bufr_sequences.SEQUENCES.values():
+        bufr_sequences.check_columns(sequence)
+    assert bufr_sequences.unused_bufr_keys() == []
+
+def test_column_with_other_bufr_key_is_refused():
+    sequence = bufr_sequences.Sequence('wrong', [307103], [], [
+        ['nationalStationNumber', 'NSI', 'array'],
+        ['airTemperature', 'RR', 'array'],
+    ])
+    with pytest.raises(errors.OptionError):
+        bufr_sequences.register(sequence)
+    assert 'wrong' not in bufr_sequences.SEQUENCES
@@ -0,0 +1,58 @@
+"""
+Tests of bulletin_writer.py.
+"""
+import os
+import bulletin_writer
+
+def test_restart_appends_to_the_bulletin(tmp_path):
+    filename = str(tmp_path / 'bulletin.bufr')
+    for message in (b'BUFR1', b'BUFR2'):
+        with bulletin_writer.BulletinWriter(filename) as writer:
+            writer.write(message)
+    assert (tmp_path / 'bulletin.bufr').read_bytes() == b'BUFR1BUFR2'
+
+def test_restart_continues_the_numbering(tmp_path):
+    filename = str(tmp_path / 'bulletin.bufr')
+    for messages in ([b'BUFR1', b'BUFR2'], [b'BUFR3']):
+        with bulletin_writer.BulletinWriter(filename, max_messages=1) as writer:
+            writer.write_messages(messages)
+    assert sorted(os.listdir(tmp_path)) == ['bulletin_0001.bufr', 'bulletin_0002.bufr',
+                                            'bulletin_0003.bufr']
+    assert (tmp_path / 'bulletin_0003.bufr').read_bytes() == b'BUFR3'
+
+def test_sync_uses_fsync_only_with_durability(tmp_path, monkeypatch):
+    synced = []
+    fsync = os.fsync
+    def counting_fsync(fd):
+        synced.append(fd)
+        fsync(fd)
+    monkeypatch.setattr(os, 'fsync', counting_fsync)
+    for durability, count in (('none', 0), ('batch', 2)):
+        synced.clear()
+        writer = bulletin_writer.BulletinWriter(str(tmp_path / (durability + '.bufr')),
+                                                durability=durability)
+        writer.write(b'BUFR1')
+        writer.sync()
+        # The file and its new directory entry are synced.
+        assert len(synced) == count
+        writer.close()
+
+def sequence_numbers(content):
+    """
+    Returns the channel sequence numbers of the WMO envelopes in content (bytes).
+    """
+    return [int(part[3:6]) for part in content.split(b'00' + bulletin_writer.SOH)[1:]]
+
+def test_restart_continues_the_sequence_numbers(tmp_path):
+    filename = str(tmp_path / 'bulletin.bufr')
+    for messages in ([b'BUFR1', b'BUFR2'], [b'BUFR3']):
+        with bulletin_writer.BulletinWriter(filename, wmo_envelope=True) as writer:
+            writer.write_messages(messages, 'ISXD62 EFKL 040600')
+    assert sequence_numbers((tmp_path / 'bulletin.bufr').read_bytes()) == [1, 2, 3]
+
+def test_restart_of_rotated_files_continues_the_sequence_numbers(tmp_path):
+    filename = str(tmp_path / 'bulletin.bufr')
+    for messages in ([b'BUFR1', b'BUFR2'], [b'BUFR3']):
+        with bulletin_writer.BulletinWriter(filename, True, max_messages=2) as writer:
+            writer.write_messages(messages, 'ISXD62 EFKL 040600')
+    assert sequence_numbers((tmp_path / 'bulletin_0002.bufr').read_bytes()) == [3]
@@ -0,0 +1,62 @@
+"""
+Tests of the command line of rain2bufr.py.
+"""
+import os
+import subprocess
+import sys
+from conftest import DAT_TEXT
+import rain2bufr
+
+PROGRAM = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                       'rain2bufr.py')
+
+def run(monkeypatch, *arguments):
+    """
+    Runs rain2bufr.main with the command line arguments.
+    """
+    monkeypatch.setattr(sys, 'argv', ['rain2bufr.py'] + list(arguments))
+    rain2bufr.main()
+
+def run_pipe(text, *arguments):
+    """
+    Runs rain2bufr.py in the pipe mode ("-") with text in stdin and returns the
+    finished process.
+    """
+    return subprocess.run([sys.executable, PROGRAM, '-'] + list(arguments),
+                          input=text.encode('utf8'), capture_output=True, check=False)
+
+def test_missing_output_directory_is_made(tmp_path, monkeypatch):
+    (tmp_path / 'in.dat').write_text(DAT_TEXT)
+    output_dir = tmp_path / 'new' / 'output'
+    run(monkeypatch, str(tmp_path / 'in.dat'), '--output-dir', str(output_dir))
+    assert os.listdir(output_dir) == ['ISXD62_EFKL_040600.bufr']
+
+def test_pipe_writes_only_bufr_to_stdout():
+    finished = run_pipe(DAT_TEXT)
+    assert finished.returncode == 0
+    assert finished.stdout == rain2bufr.encode_bytes(DAT_TEXT)[1]
+    assert b'ISXD62_EFKL_040600.bufr' in finished.stderr
+
+def test_pipe_error_goes_to_stderr():
+    finished = run_pipe(DAT_TEXT.replace('RR=3.4', 'RR=x'))
+    assert finished.returncode == 1
+    assert finished.stdout == b''
+    assert b'row 2.' in finished.stderr
+
+def test_validate_only_does_not_need_eccodes(tmp_path):
+    (tmp_path / 'good.dat').write_text(DAT_TEXT)
+    (tmp_path / 'bad.dat').write_text(DAT_TEXT.replace('RR=3.4', 'RR=x'))
+    # eccodes can not be imported in the program.
+    code = ('import os, runpy, sys; sys.modules["eccodes"] = None; sys.argv = sys.argv[1:]; '
+            'sys.path.insert(0, os.path.dirname(sys.argv[0])); '
+            'runpy.run_path(sys.argv[0], run_name="__main__")')
+    finished = subprocess.run(
+        [sys.executable, '-c', code, PROGRAM, '--validate-only', '--batch', str(tmp_path),
+         '--on-error', 'quarantine', str(tmp_path / 'good.dat')],
+        capture_output=True, check=False, text=True)
+    assert finished.returncode == 0, finished.stderr
+    lines = finished.stdout.splitlines()
+    assert [line.split(' -> ')[1] for line in lines[:3]] == [
+        '2 rows', '1 rows, 1 quarantined', '2 rows']
+    assert lines[3] == '3 of 3 files valid.'
+    assert not list(tmp_path.glob('*.bufr'))
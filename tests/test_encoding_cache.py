@@ -0,0 +1,119 @@
+"""
+Tests of encoding_cache.py.
+"""
+import io
+import os
+import pickle
+from conftest import DAT_TEXT
+import encoding_cache
+import metrics
+import rain2bufr
+
+def encode(cache_dir, on_error='quarantine'):
+    """
+    Encodes DAT_TEXT with the cache in cache_dir. Returns [groups, metrics record].
+    """
+    options = rain2bufr.get_options({'cache_dir': str(cache_dir), 'on_error': on_error})
+    record = metrics.new_record('in.dat')
+    input_file = io.StringIO(DAT_TEXT.replace('ELSTAT=96', 'ELSTAT=x'))
+    input_file.name = 'in.dat'
+    return [rain2bufr.encode_groups(input_file, 'dat', options, record), record]
+
+def test_entry_gives_the_same_result(tmp_path):
+    encoding_cache.CACHES.clear()
+    first, record = encode(tmp_path)
+    assert not record.get('cache_hit')
+    second, record = encode(tmp_path)
+    assert record['cache_hit']
+    assert [group[:3] for group in first] == [group[:3] for group in second]
+    assert first[0][3].entries == second[0][3].entries
+    assert first[0][3].row_numbers == second[0][3].row_numbers
+    assert second[0][3].input_name == 'in.dat'
+
+class Payload:
+    """
+    An object which writes a file when it is unpickled.
+    """
+    def __init__(self, path):
+        self.path = path
+
+    def __reduce__(self):
+        return (open, (self.path, 'w'))
+
+def test_pickled_entry_is_not_loaded(tmp_path):
+    encoding_cache.CACHES.clear()
+    encode(tmp_path)
+    entry_path, = [entry[0] for entry in encoding_cache.open_cache(
+        {'cache_dir': str(tmp_path)}).entries()]
+    with open(entry_path, 'wb') as fout:
+        pickle.dump(Payload(str(tmp_path / 'opened')), fout)
+    groups, record = encode(tmp_path)
+    assert not record.get('cache_hit')
+    assert not os.path.exists(tmp_path / 'opened')
+    assert groups[0][2][0].startswith(b'BUFR')
+
+def test_failed_put_does_not_fail_the_encoding(tmp_path, monkeypatch, capsys):
+    encoding_cache.CACHES.clear()
+    def fail(*args):
+        raise OSError(28, 'No space left on device')
+    monkeypatch.setattr(encoding_cache.EncodingCache, 'put', fail)
+    groups, _ = encode(tmp_path)
+    assert groups[0][2][0].startswith(b'BUFR')
+    assert 'No space left on device' in capsys.readouterr().err
+
+def delivery(text, type_of_data, cache_dir, **options):
+    """
+    Encodes text with the cache in cache_dir. Returns [messages, True if the result
+    was taken from the cache].
+    """
+    options = dict(options, cache_dir=str(cache_dir), on_error='reject')
+    record = metrics.new_record('in')
+    groups = rain2bufr.encode_groups(io.StringIO(text), type_of_data, options, record)
+    return [groups[0][2], record['cache_hit']]
+
+def swap_rows(text):
+    """
+    Returns the .dat text with its two data rows in the other order.
+    """
+    lines = text.splitlines(True)
+    return lines[0] + lines[2] + lines[1]
+
+def reverse_columns(text):
+    """
+    Returns the .dat text with the key=value pairs of each row in the reverse order.
+    """
+    lines = text.splitlines()
+    rows = [';'.join(reversed(line[:-1].split(';'))) + '*' for line in lines[1:]]
+    return '\n'.join([lines[0]] + rows)
+
+def to_csv(text):
+    """
+    Returns the .dat text as csv text.
+    """
+    rows = [[pair.split('=', 1) for pair in line[:-1].split(';')]
+            for line in text.splitlines()[1:]]
+    lines = ['|'.join(key for key, _ in rows[0])]
+    lines.extend('|'.join(value for _, value in row) for row in rows)
+    return '\n'.join(lines) + '\n'
+
+def test_same_rows_in_another_form_are_the_same_input(tmp_path):
+    encoding_cache.CACHES.clear()
+    messages, hit = delivery(DAT_TEXT, 'dat', tmp_path)
+    assert not hit
+    for text, type_of_data in [(DAT_TEXT.rstrip('\n'), 'dat'), (swap_rows(DAT_TEXT), 'dat'),
+                               (reverse_columns(DAT_TEXT), 'dat'),
+                               (to_csv(DAT_TEXT), 'csv')]:
+        assert delivery(text, type_of_data, tmp_path) == [messages, True]
+    assert not delivery(DAT_TEXT.replace('RR=3.4', 'RR=3.5'), 'dat', tmp_path)[1]
+
+def test_mapped_input_uses_the_entry_of_the_streamed_input(tmp_path):
+    encoding_cache.CACHES.clear()
+    (tmp_path / 'in.dat').write_text(DAT_TEXT)
+    options = {'cache_dir': str(tmp_path / 'cache')}
+    first = rain2bufr.encode_file_messages(str(tmp_path / 'in.dat'), options)
+    record = metrics.new_record('in.dat')
+    second = rain2bufr.encode_file_messages(str(tmp_path / 'in.dat'),
+                                            dict(options, mmap=True), record)
+    assert record['cache_hit']
+    assert 'parse' in record['stages']
+    assert [group[2] for group in first] == [group[2] for group in second]
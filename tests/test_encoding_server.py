@@ -0,0 +1,60 @@
+"""
+Tests of encoding_server.py.
+"""
+import asyncio
+import os
+import signal
+from concurrent.futures import ProcessPoolExecutor
+from conftest import DAT_TEXT
+import encoding_server
+import rain2bufr
+
+def answer(server, body, query=''):
+    """
+    Answers one POST /encode request with body in a new worker pool of server.
+    """
+    async def run():
+        server.semaphore = asyncio.Semaphore(server.workers)
+        server.executor = ProcessPoolExecutor(max_workers=server.workers)
+        try:
+            return await server.answer('POST', '/encode' + query, {}, body)
+        finally:
+            server.executor.shutdown()
+    return asyncio.run(run())
+
+def test_unexpected_error_is_500(monkeypatch):
+    def fail(*args):
+        raise KeyError('x')
+    monkeypatch.setattr(rain2bufr, 'encode_messages', fail)
+    status, _, _, _, error = encoding_server.encode_payload(
+        DAT_TEXT.encode('utf8'), 'dat', rain2bufr.get_options(None))
+    assert status == 500
+    assert error == "KeyError: 'x'\n"
+
+def test_broken_pool_is_500_and_replaced():
+    server = encoding_server.EncodingServer(None, 1)
+    async def run():
+        server.semaphore = asyncio.Semaphore(1)
+        server.executor = ProcessPoolExecutor(max_workers=1)
+        # Start the worker and kill it, so the pool is broken.
+        pid = await asyncio.get_running_loop().run_in_executor(server.executor, os.getpid)
+        os.kill(pid, signal.SIGKILL)
+        broken = server.executor
+        try:
+            first = await server.answer('POST', '/encode', {}, DAT_TEXT.encode('utf8'))
+            second = await server.answer('POST', '/encode', {}, DAT_TEXT.encode('utf8'))
+        finally:
+            server.executor.shutdown()
+        return broken, first, second
+    broken, first, second = asyncio.run(run())
+    assert first[0] == 500
+    assert first[2].startswith(b'BrokenProcessPool')
+    assert server.executor is not broken
+    assert second[0] == 200
+
+def test_free_worker_is_used_without_waiting_places():
+    server = encoding_server.EncodingServer(None, 1, max_pending=0)
+    status, _, body = answer(server, DAT_TEXT.encode('utf8'))
+    assert status == 200
+    assert body.startswith(b'BUFR')
+    assert server.waiting == 0
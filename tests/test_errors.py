@@ -0,0 +1,41 @@
+"""
+Tests of the errors and the quarantine of bad data rows (errors.py).
+"""
+import io
+import pytest
+from conftest import DAT_TEXT
+import errors
+import rain2bufr
+
+FIRST_ROW = DAT_TEXT.split('\n')[1]
+GOOD_ROW = FIRST_ROW.replace('NSI=100908', 'NSI=100909') + '\n'
+# DAT_TEXT with a wrong value (row 4), a row without "*" (row 5), a row with other
+# key names (row 6) and a good row (row 7).
+BAD_TEXT = (
+    DAT_TEXT
+    + FIRST_ROW.replace('RR=3.4', 'RR=x') + '\n'
+    + FIRST_ROW[:-1] + '\n'
+    + FIRST_ROW.replace('RR_PERIOD=-12;', '') + '\n'
+    + GOOD_ROW
+)
+
+def test_bad_rows_reject_the_input():
+    # A row without "*" is reported before a wrong value in an earlier row.
+    with pytest.raises(errors.RowError) as err:
+        rain2bufr.encode_messages(io.StringIO(BAD_TEXT), 'dat')
+    assert err.value.rows == [5]
+    assert 'row 5.' in str(err.value)
+
+def test_bad_rows_are_quarantined(tmp_path):
+    (tmp_path / 'in.dat').write_text(BAD_TEXT)
+    options = {'on_error': 'quarantine', 'output_dir': str(tmp_path / 'output')}
+    (tmp_path / 'output').mkdir()
+    filenames = rain2bufr.encode_file(str(tmp_path / 'in.dat'), options)
+    assert [name[len(str(tmp_path)):] for name in filenames] == [
+        '/output/ISXD62_EFKL_040600.bufr', '/output/ISXD62_EFKL_040600.quarantine']
+
+    messages = rain2bufr.encode_messages(io.StringIO(DAT_TEXT + GOOD_ROW), 'dat')[2]
+    assert (tmp_path / 'output' / 'ISXD62_EFKL_040600.bufr').read_bytes() == b''.join(messages)
+    report = (tmp_path / 'output' / 'ISXD62_EFKL_040600.quarantine').read_text().splitlines()
+    assert report[0].endswith(': 3')
+    assert [line.split(':')[0] for line in report[1:]] == ['row 4', 'row 5', 'row 6']
@@ -0,0 +1,29 @@
+"""
+Tests of grouping the rows by time (rain2bufr.group_rows).
+"""
+import io
+import pytest
+from conftest import DAT_TEXT
+import errors
+import rain2bufr
+
+def encode(text, on_error):
+    """
+    Encodes the .dat text grouped by time. Returns the result of encode_groups.
+    """
+    options = {'group_by_time': True, 'on_error': on_error}
+    return rain2bufr.encode_groups(io.StringIO(text), 'dat', options)
+
+@pytest.mark.parametrize('value', ['/', 'inf', 'nan', '24', '6.5'])
+def test_row_with_wrong_hour_is_quarantined(value):
+    text = DAT_TEXT.replace('HH24=06;MI=00;MM=04;ELRAIN=/',
+                            'HH24=' + value + ';MI=00;MM=04;ELRAIN=/')
+    groups = encode(text, 'quarantine')
+    assert [group[0] for group in groups] == ['ISXD62_EFKL_040600.bufr']
+    assert groups[0][3].entries == [[3, 'Value of "HH24" to group the rows by time should '
+                                        'be an integer from 0 to 23.']]
+
+def test_row_with_wrong_minute_is_rejected():
+    text = DAT_TEXT.replace('HH24=06;MI=00;MM=04;ELRAIN=/', 'HH24=06;MI=inf;MM=04;ELRAIN=/')
+    with pytest.raises(errors.RowError, match='"MI" to group the rows'):
+        encode(text, 'reject')
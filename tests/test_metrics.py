@@ -0,0 +1,29 @@
+"""
+Tests of metrics.py.
+"""
+import io
+import tracemalloc
+from conftest import DAT_TEXT
+import metrics
+import rain2bufr
+
+def test_stage_traces_memory_in_a_process_which_does_not_trace():
+    record = metrics.new_record('in.dat')
+    # As if the record had been made in a worker process.
+    tracemalloc.stop()
+    with metrics.stage(record, 'write'):
+        data = [bytes(1000) for _ in range(0, 1000)]
+    assert len(data) == 1000
+    assert record['stages']['write']['peak_bytes'] >= 1000 * 1000
+    assert not tracemalloc.is_tracing()
+
+def test_record_of_an_encoding():
+    record = metrics.new_record('in.dat')
+    messages = rain2bufr.encode_messages(io.StringIO(DAT_TEXT), 'dat', None, record)[2]
+    metrics.finish(record)
+    assert record['subsets'] == 2
+    assert record['messages'] == len(messages) == 1
+    assert record['output_bytes'] == len(messages[0])
+    for name in ('parse', 'key_check', 'pivot', 'subset', 'encode'):
+        assert record['stages'][name]['calls'] >= 1
+    assert record['total_seconds'] > 0
@@ -0,0 +1,52 @@
+"""
+Tests of output_writer.py.
+"""
+import os
+from conftest import DAT_TEXT
+import batch_encoding
+import output_writer
+
+def fail_sync(monkeypatch, name):
+    """
+    Makes the sync of the temporary file of the output file name fail.
+    """
+    sync_file = output_writer.sync_file
+    def failing_sync(path):
+        if os.path.basename(path).startswith('.' + name + '.'):
+            return OSError(5, 'Input/output error', path)
+        return sync_file(path)
+    monkeypatch.setattr(output_writer, 'sync_file', failing_sync)
+
+def test_waiting_files_are_not_kept_open(tmp_path):
+    open_files = len(os.listdir('/proc/self/fd'))
+    with output_writer.OutputWriter('batch', 10000) as files:
+        for number in range(0, 2000):
+            files.write(str(tmp_path / (str(number) + '.bufr')), b'BUFR7777')
+        assert len(os.listdir('/proc/self/fd')) == open_files
+    assert len(os.listdir(tmp_path)) == 2000
+
+def test_failed_owner_does_not_discard_the_others(tmp_path, monkeypatch):
+    fail_sync(monkeypatch, 'b2.bufr')
+    files = output_writer.OutputWriter('batch')
+    for owner in ('a', 'b', 'c'):
+        files.start(owner)
+        for number in (1, 2):
+            files.write(str(tmp_path / (owner + str(number) + '.bufr')), b'BUFR7777')
+    failed = files.commit()
+    assert list(failed) == ['b']
+    assert sorted(os.listdir(tmp_path)) == ['a1.bufr', 'a2.bufr', 'c1.bufr', 'c2.bufr']
+
+def test_batch_reports_failed_commit_per_file(tmp_path, monkeypatch, capsys):
+    for hour in ('06', '07', '08'):
+        (tmp_path / (hour + '.dat')).write_text(DAT_TEXT.replace('06:00', hour + ':00'))
+    fail_sync(monkeypatch, 'ISXD62_EFKL_040700.bufr')
+    output_dir = tmp_path / 'output'
+    output_dir.mkdir()
+    options = {'output_dir': str(output_dir), 'durability': 'batch'}
+    failed = batch_encoding.encode_files(batch_encoding.list_input_files(str(tmp_path)), 1,
+                                         options)
+    out, err = capsys.readouterr()
+    assert failed == 1
+    assert [line.split()[0] for line in out.splitlines()[:3]] == ['OK', 'FAILED', 'OK']
+    assert 'Input/output error' in err
+    assert len(os.listdir(output_dir)) == 2
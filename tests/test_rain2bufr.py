@@ -0,0 +1,41 @@
+"""
+Tests of the encoding functions of rain2bufr.py.
+"""
+import io
+import eccodes
+from conftest import DAT_TEXT
+import rain2bufr
+
+def decoded(message, keys):
+    """
+    Decodes the message (bytes) and returns compressedData and the arrays of keys.
+    """
+    ibufr = eccodes.codes_new_from_message(message)
+    try:
+        eccodes.codes_set(ibufr, 'unpack', 1)
+        values = [eccodes.codes_get(ibufr, 'compressedData')]
+        for key in keys:
+            values.append(eccodes.codes_get_array(ibufr, key).tolist())
+    finally:
+        eccodes.codes_release(ibufr)
+    return values
+
+def test_compressed_message_has_the_values_of_the_uncompressed_one():
+    keys = ['nationalStationNumber', 'totalPrecipitationOrTotalWaterEquivalent',
+            'heightOfStationGroundAboveMeanSeaLevel']
+    uncompressed = rain2bufr.encode_messages(io.StringIO(DAT_TEXT), 'dat')[2]
+    compressed = rain2bufr.encode_messages(io.StringIO(DAT_TEXT), 'dat',
+                                           {'compressed': True, 'verify': 1.0})[2]
+    assert len(compressed) == 1
+    assert decoded(uncompressed[0], keys)[0] == 0
+    assert decoded(compressed[0], keys)[0] == 1
+    assert decoded(compressed[0], keys)[1:] == decoded(uncompressed[0], keys)[1:]
+
+def test_encode_bytes_gives_the_messages_of_the_output_file(tmp_path):
+    (tmp_path / 'in.dat').write_text(DAT_TEXT)
+    filenames = rain2bufr.encode_file(str(tmp_path / 'in.dat'),
+                                      {'output_dir': str(tmp_path)})
+    written = (tmp_path / 'ISXD62_EFKL_040600.bufr').read_bytes()
+    assert filenames == [str(tmp_path / 'ISXD62_EFKL_040600.bufr')]
+    for data in [DAT_TEXT, DAT_TEXT.encode('utf8'), DAT_TEXT.splitlines()]:
+        assert rain2bufr.encode_bytes(data) == ['ISXD62_EFKL_040600.bufr', written]
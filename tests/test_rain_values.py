@@ -0,0 +1,57 @@
+"""
+Tests of rain_values.py.
+"""
+import io
+import numpy as np
+import pytest
+from conftest import DAT_TEXT
+import bufr_sequences
+import errors
+import rain2bufr
+import rain_values
+from missing_values import CODES_MISSING_DOUBLE, CODES_MISSING_LONG
+
+# DAT_TEXT with a snow depth and a snow water equivalent which make a wrong snow density.
+WRONG_DENSITY_TEXT = DAT_TEXT.replace('RR=', 'SNOW=10;SWE=1000;RR=')
+PRECIPITATION = {'sequence': 'precipitation'}
+# DAT_TEXT with a snow depth in centimeters, a missing snow depth and a station type
+# out of its valid range.
+CONVERTED_TEXT = (DAT_TEXT.replace('RR=3.4', 'SNOW=150;RR=3.4')
+                  .replace('RR=0.0', 'SNOW=/;RR=0.0')
+                  .replace('STATION_TYPE=1;WSI=0-246', 'STATION_TYPE=7;WSI=0-246'))
+
+def test_columns_are_converted_to_arrays():
+    _, keys, columns, _ = rain2bufr.read_input(
+        io.StringIO(CONVERTED_TEXT), 'dat', rain2bufr.get_options(PRECIPITATION))
+    subset = rain_values.Subset(keys, columns)
+    assert subset.NSUB == 2
+    assert subset.NSI.dtype == np.int64
+    assert subset.NSI.tolist() == [100908, 100963]
+    assert subset.ELRAIN.dtype == np.float64
+    assert subset.ELRAIN.tolist() == [1.5, CODES_MISSING_DOUBLE]
+    assert subset.STATION_TYPE.tolist() == [1, CODES_MISSING_LONG]
+    assert subset.SNOW_TOTAL.tolist() == [1.5, CODES_MISSING_DOUBLE]
+    assert subset.LONG_STATION_NAME == ['Parainen Uto', 'Lohja']
+
+def test_precipitation_does_not_check_snow_density():
+    _, keys, columns, sequence = rain2bufr.read_input(
+        io.StringIO(WRONG_DENSITY_TEXT), 'dat', rain2bufr.get_options(PRECIPITATION))
+    assert sequence.name == 'precipitation'
+    subset = rain_values.Subset(keys, columns, sequence)
+    assert subset.RR.tolist() == [3.4, 0.0]
+    with pytest.raises(errors.RowError, match='snow density'):
+        rain_values.Subset(keys, columns)
+    with pytest.raises(errors.RowError, match='snow density'):
+        rain_values.Subset(keys, columns, bufr_sequences.SEQUENCES['snow'])
+
+def test_precipitation_input_with_snow_keys_is_encoded():
+    messages = rain2bufr.encode_messages(io.StringIO(WRONG_DENSITY_TEXT), 'dat',
+                                         PRECIPITATION)[2]
+    assert messages == rain2bufr.encode_messages(io.StringIO(DAT_TEXT), 'dat', PRECIPITATION)[2]
+
+def test_needed_attributes_include_the_parts_of_derived_ones():
+    needed = rain_values.needed_attributes(bufr_sequences.encoding_plan('snow', False))
+    assert {'SNOW_TOTAL', 'GR', 'GROUND06', 'SNOW_AWS', 'SWE', 'ELSNOW'} <= needed
+    needed = rain_values.needed_attributes(bufr_sequences.encoding_plan('precipitation',
+                                                                        False))
+    assert 'SDLWC' not in needed and 'SWE' not in needed
@@ -0,0 +1,33 @@
+"""
+Tests of read_csv_file.py.
+"""
+import io
+from conftest import DAT_TEXT
+import rain2bufr
+import rain_values
+
+CSV_TEXT = (
+    'ttaaii|nsi|lat|lon|stationName|wmon|wsi|year|month|day|hour|minute|elstat\n'
+    'ISXD62|100908|59.77909|21.37479|Parainen Uto|2981|0-20000-0-02981|2022|04|04|06|00|6\n'
+)
+# The rows of DAT_TEXT as a database export, in another column order and with an
+# empty missing value.
+EXPORT_TEXT = (
+    'year|month|day|hour|minute|ttaaii|elstat|nsi|lat|lon|stationName|stationType|wsi|'
+    'ELRAIN|RR_PERIOD|RR\n'
+    '2022|04|04|06|00|ISXD62|6|100908|59.77909|21.37479|Parainen Uto|1|0-20000-0-02981|'
+    '1.5|-12|3.4\n'
+    '2022|04|04|06|00|ISXD62|96|100963|60.49137|23.76629|Lohja|1|0-246-0-100963|'
+    '|-12|0.0\n'
+)
+
+def test_wmon_is_the_wmo_number():
+    _, keys, columns, _ = rain2bufr.read_input(io.StringIO(CSV_TEXT), 'csv',
+                                               rain2bufr.get_options(None))
+    assert 'WMO' in keys
+    assert rain_values.Subset(keys, columns).WMO.tolist() == [2981]
+
+def test_export_is_encoded_as_the_dat_file():
+    from_csv = rain2bufr.encode_messages(io.StringIO(EXPORT_TEXT), 'csv')
+    from_dat = rain2bufr.encode_messages(io.StringIO(DAT_TEXT), 'dat')
+    assert from_csv[:3] == from_dat[:3]
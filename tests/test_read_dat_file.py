@@ -0,0 +1,60 @@
+"""
+Tests of read_dat_file.py.
+"""
+import pytest
+from conftest import DAT_TEXT
+import errors
+import rain2bufr
+
+# DAT_TEXT with rows which are written in other ways: a row with Windows line
+# ending, a number which is written with spaces and a last row without a line
+# ending.
+PLAIN_ROWS = DAT_TEXT.split('\n')[1:3]
+ODD_TEXT = (
+    DAT_TEXT
+    + PLAIN_ROWS[0].replace('NSI=100908', 'NSI=100909') + '\r\n'
+    + PLAIN_ROWS[1].replace('RR=0.0', 'RR= 0.5 ') + '\n'
+    + PLAIN_ROWS[0].replace('NSI=100908', 'NSI=100910')
+)
+# DAT_TEXT with a wrongly written row and a row with other key names.
+BAD_TEXT = (
+    DAT_TEXT
+    + PLAIN_ROWS[0].replace('RR=3.4', 'RR=x') + '\n'
+    + PLAIN_ROWS[1].replace('RR=0.0;', '') + '\n'
+    + PLAIN_ROWS[0].replace('NSI=100908', 'NSI=100909') + '\n'
+)
+
+def encode(tmp_path, text, **options):
+    """
+    Encodes text in a .dat file in tmp_path with and without memory mapping and
+    returns both results.
+    """
+    path = tmp_path / 'ISXD62_2022-04-04_06:00_SC.dat'
+    path.write_bytes(text.encode('utf8'))
+    results = []
+    for mmap in [False, True]:
+        results.append(rain2bufr.encode_file_messages(
+            str(path), rain2bufr.get_options(dict(options, mmap=mmap))))
+    return results
+
+@pytest.mark.parametrize('text', [DAT_TEXT, ODD_TEXT])
+def test_mapped_input_is_encoded_as_the_streamed_input(tmp_path, text):
+    streamed, mapped = encode(tmp_path, text)
+    assert mapped[0][:3] == streamed[0][:3]
+
+def test_mapped_input_quarantines_the_same_rows(tmp_path):
+    streamed, mapped = encode(tmp_path, BAD_TEXT, on_error='quarantine')
+    assert mapped[0][:3] == streamed[0][:3]
+    assert mapped[0][3].entries == streamed[0][3].entries
+    assert [row for row, _ in mapped[0][3].entries] == [4, 5]
+
+def test_mapped_input_gives_the_error_of_the_streamed_input(tmp_path):
+    messages = []
+    for mmap in [False, True]:
+        path = tmp_path / 'ISXD62_2022-04-04_06:00_SC.dat'
+        path.write_bytes(BAD_TEXT.encode('utf8'))
+        with pytest.raises(errors.RowError) as err:
+            rain2bufr.encode_file_messages(str(path), rain2bufr.get_options({'mmap': mmap}))
+        messages.append(str(err.value))
+    assert messages[0] == messages[1]
+    assert 'row 4' in messages[1]
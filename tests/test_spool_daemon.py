@@ -0,0 +1,76 @@
+"""
+Tests of spool_daemon.py.
+"""
+import os
+from conftest import DAT_TEXT
+import output_writer
+import rain2bufr
+import spool_daemon
+
+def make_daemon(spool_dir, **options):
+    """
+    Returns a SpoolDaemon of spool_dir with the default directories.
+    """
+    options = rain2bufr.get_options(dict(options, output_dir=str(spool_dir / 'output')))
+    return spool_daemon.SpoolDaemon(str(spool_dir), options, str(spool_dir / 'done'),
+                                    str(spool_dir / 'failed'))
+
+def test_failing_file_does_not_stop_the_worker(tmp_path):
+    daemon = make_daemon(tmp_path)
+    (tmp_path / 'a.dat').write_text(DAT_TEXT)
+    (tmp_path / 'b.dat').write_text(DAT_TEXT.replace('06:00', '07:00'))
+    # c.dat is removed after it was queued, so it can not be moved to done or failed.
+    for name in ('c.dat', 'a.dat', 'b.dat'):
+        daemon.work_queue.put(str(tmp_path / name))
+    daemon.work_queue.put(None)
+    daemon.work()
+
+    assert sorted(os.listdir(tmp_path / 'done')) == ['a.dat', 'b.dat']
+    assert sorted(os.listdir(tmp_path / 'output')) == ['ISXD62_EFKL_040600.bufr',
+                                                      'ISXD62_EFKL_040700.bufr']
+    assert os.listdir(tmp_path / 'failed') == ['c.dat.error']
+
+def test_wrong_file_is_moved_to_failed(tmp_path):
+    daemon = make_daemon(tmp_path, durability='batch')
+    (tmp_path / 'a.dat').write_text(DAT_TEXT.replace('RR=3.4', 'RR=x'))
+    (tmp_path / 'b.dat').write_text(DAT_TEXT)
+    daemon.scan()
+    daemon.work_queue.put(None)
+    daemon.work()
+
+    assert os.listdir(tmp_path / 'done') == ['b.dat']
+    assert sorted(os.listdir(tmp_path / 'failed')) == ['a.dat', 'a.dat.error']
+    assert 'row 2' in (tmp_path / 'failed' / 'a.dat.error').read_text()
+
+def test_failed_commit_fails_only_its_own_input(tmp_path, monkeypatch):
+    sync_file = output_writer.sync_file
+    def failing_sync(path):
+        if os.path.basename(path).startswith('.ISXD62_EFKL_040700.bufr.'):
+            return OSError(5, 'Input/output error', path)
+        return sync_file(path)
+    monkeypatch.setattr(output_writer, 'sync_file', failing_sync)
+    daemon = make_daemon(tmp_path, durability='batch')
+    for name, hour in (('a.dat', '06'), ('b.dat', '07'), ('c.dat', '08')):
+        (tmp_path / name).write_text(DAT_TEXT.replace('06:00', hour + ':00'))
+    daemon.scan()
+    daemon.work_queue.put(None)
+    daemon.work()
+
+    assert sorted(os.listdir(tmp_path / 'done')) == ['a.dat', 'c.dat']
+    assert sorted(os.listdir(tmp_path / 'output')) == ['ISXD62_EFKL_040600.bufr',
+                                                      'ISXD62_EFKL_040800.bufr']
+    assert sorted(os.listdir(tmp_path / 'failed')) == ['b.dat', 'b.dat.error']
+
+def test_file_which_can_not_be_moved_is_not_queued_again(tmp_path):
+    daemon = make_daemon(tmp_path)
+    (tmp_path / 'a.dat').write_text(DAT_TEXT)
+    # The done directory is replaced by a file, so a.dat can not be moved there.
+    os.rmdir(tmp_path / 'done')
+    (tmp_path / 'done').write_text('')
+    daemon.scan()
+    daemon.work_queue.put(None)
+    daemon.work()
+    assert os.path.exists(tmp_path / 'a.dat')
+
+    daemon.scan()
+    assert daemon.work_queue.empty()
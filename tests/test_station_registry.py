@@ -0,0 +1,49 @@
+"""
+Tests of station_registry.py.
+"""
+import io
+from conftest import DAT_TEXT
+import rain2bufr
+import station_registry
+from missing_values import CODES_MISSING_DOUBLE
+
+# The stations of DAT_TEXT and a station which is not in it.
+REGISTRY_TEXT = (
+    'NSI=100908;WSI=0-20000-0-02981;LAT=59.77909;LON=21.37479;ELSTAT=6;'
+    'STATION_NAME=Parainen Uto;STATION_TYPE=1*\n'
+    '\n'
+    'NSI=100963;WSI=0-246-0-100963;LAT=60.49137;LON=23.76629;ELSTAT=96;'
+    'STATION_NAME=Lohja;STATION_TYPE=1*\n'
+    'NSI=101004;WSI=0-20000-0-02978;LAT=60.18;LON=24.94;ELSTAT=4;'
+    'STATION_NAME=Helsinki;STATION_TYPE=1*\n'
+)
+
+def without_keys(text, keys):
+    """
+    Returns the .dat text without the keys in its data rows.
+    """
+    lines = text.splitlines()
+    rows = [lines[0]]
+    for line in lines[1:]:
+        pairs = line[:-1].split(';')
+        rows.append(';'.join(pair for pair in pairs if pair.split('=')[0] not in keys) + '*')
+    return '\n'.join(rows) + '\n'
+
+def test_station_keys_are_filled_in(tmp_path):
+    (tmp_path / 'stations.dat').write_text(REGISTRY_TEXT)
+    options = {'stations': str(tmp_path / 'stations.dat')}
+    messages = rain2bufr.encode_messages(io.StringIO(DAT_TEXT), 'dat')[2]
+    for station_key in ('NSI', 'WSI'):
+        keys = [key for key in station_registry.STATION_KEYS if key != station_key]
+        text = without_keys(DAT_TEXT, keys)
+        assert rain2bufr.encode_messages(io.StringIO(text), 'dat', options)[2] == messages
+    assert (tmp_path / 'stations.dat.idx').exists()
+
+def test_unknown_station_has_missing_values(tmp_path):
+    (tmp_path / 'stations.dat').write_text(REGISTRY_TEXT)
+    registry = station_registry.StationRegistry(str(tmp_path / 'stations.dat'))
+    keys, columns = registry.fill(['NSI'], [[101004.0, 100000.0]])
+    assert keys == list(station_registry.STATION_KEYS)
+    values = dict(zip(keys, columns))
+    assert values['LAT'] == [60.18, CODES_MISSING_DOUBLE]
+    assert values['STATION_NAME'] == ['Helsinki', CODES_MISSING_DOUBLE]
@@ -0,0 +1,54 @@
+"""
+Tests of setting the text values of many subsets (rain2bufr.set_string_array).
+"""
+import eccodes
+import pytest
+from conftest import DAT_TEXT
+import rain2bufr
+
+# More subsets than in the biggest messages which were encoded one rank at a time.
+NUMBER_OF_ROWS = 10001
+
+def many_rows():
+    """
+    Returns a .dat input of NUMBER_OF_ROWS rows, each with its own station name and
+    WIGOS local identifier.
+    """
+    first_row, row = DAT_TEXT.splitlines()[:2]
+    rows = [first_row]
+    for i in range(NUMBER_OF_ROWS):
+        rows.append(row.replace('NSI=100908', 'NSI=' + str(100000 + i))
+                    .replace('Parainen Uto', 'Station ' + str(i))
+                    .replace('0-20000-0-02981', '0-246-0-S' + str(i)))
+    return '\n'.join(rows) + '\n'
+
+def decoded_texts(message):
+    """
+    Returns the decoded longStationName and wigosLocalIdentifierCharacter values of
+    the message.
+    """
+    ibufr = eccodes.codes_new_from_message(message)
+    try:
+        eccodes.codes_set(ibufr, 'unpack', 1)
+        assert eccodes.codes_get(ibufr, 'numberOfSubsets') == NUMBER_OF_ROWS
+        names = eccodes.codes_get_string_array(ibufr, 'longStationName')
+        identifiers = eccodes.codes_get_string_array(ibufr, 'wigosLocalIdentifierCharacter')
+    finally:
+        eccodes.codes_release(ibufr)
+    return [[name.rstrip() for name in names], [value.rstrip() for value in identifiers]]
+
+@pytest.mark.parametrize('string_arrays', [True, False], ids=['string_array', 'per_rank'])
+def test_texts_of_many_subsets(monkeypatch, string_arrays):
+    refused = []
+    if not string_arrays:
+        # Like an older eccodes which can not set string arrays of uncompressed data.
+        def not_supported(ibufr, key, values):
+            refused.append(key)
+            raise eccodes.CodesInternalError(-1)
+        monkeypatch.setattr(eccodes, 'codes_set_string_array', not_supported)
+    _, message = rain2bufr.encode_bytes(many_rows(), 'dat')
+    assert len(refused) == (0 if string_arrays else 2)
+
+    names, identifiers = decoded_texts(message)
+    assert names == ['Station ' + str(i) for i in range(NUMBER_OF_ROWS)]
+    assert identifiers == ['S' + str(i) for i in range(NUMBER_OF_ROWS)]
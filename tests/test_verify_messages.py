@@ -0,0 +1,45 @@
+"""
+Tests of verify_messages.py.
+"""
+import io
+import pytest
+from conftest import DAT_TEXT
+import errors
+import rain2bufr
+import rain_values
+import verify_messages
+
+def encoded_subset():
+    """
+    Returns the message of DAT_TEXT, the Subset object which was encoded to it and
+    the bufr sequence.
+    """
+    _, keys, columns, sequence = rain2bufr.read_input(io.StringIO(DAT_TEXT), 'dat',
+                                                      rain2bufr.get_options(None))
+    subs = rain_values.Subset(keys, columns, sequence)
+    return [rain2bufr.encode_subset(subs, False, sequence), subs, sequence]
+
+@pytest.mark.parametrize('sequence', ['precipitation', 'snow'])
+def test_encoded_messages_are_verified(sequence):
+    options = {'sequence': sequence, 'verify': 1.0}
+    for compressed in (False, True):
+        options['compressed'] = compressed
+        assert len(rain2bufr.encode_messages(io.StringIO(DAT_TEXT), 'dat', options)[2]) == 1
+
+def test_changed_values_are_found():
+    message, subs, sequence = encoded_subset()
+    verify_messages.verify(message, subs, sequence)
+    subs.RR[0] = 5.0
+    subs.ELRAIN[1] = 2.0
+    with pytest.raises(errors.EncodingError) as err:
+        verify_messages.verify(message, subs, sequence)
+    assert 'totalPrecipitationOrTotalWaterEquivalent' in str(err.value)
+    assert 'heightOfSensorAboveLocalGroundOrDeckOfMarinePlatform' in str(err.value)
+
+def test_sample_depends_only_on_the_message():
+    messages = [bytes([i]) * 100 for i in range(0, 200)]
+    assert not any(verify_messages.sampled(message, 0.0) for message in messages)
+    assert all(verify_messages.sampled(message, 1.0) for message in messages)
+    chosen = [verify_messages.sampled(message, 0.5) for message in messages]
+    assert chosen == [verify_messages.sampled(message, 0.5) for message in messages]
+    assert 0 < sum(chosen) < len(messages)
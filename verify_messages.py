@@ -0,0 +1,136 @@
+"""
+verify_messages.py checks encoded bufr messages by decoding them again and comparing
+the decoded values to the values of the Subset object (see rain_values) which was
+encoded. Every column of the encoding plan of the sequence (see bufr_sequences) is
+compared as a whole:
+    numbers: the values should be the same within half of the last decimal of the
+             scale of the bufr key (the values are rounded by the scale).
+    texts:   the texts should be the same when cut to the width of the bufr key.
+    missing: missing values should stay missing and other values should not become
+             missing.
+Verifying every message doubles the work of eccodes, so only a part of the messages
+can be verified (rate, see sampled).
+eccodes is imported in the functions, so it is loaded only when a message is verified.
+"""
+import zlib
+import numpy as np
+from missing_values import CODES_MISSING_DOUBLE, CODES_MISSING_LONG
+import bufr_sequences
+import errors
+
+# How many differences of a key are shown in the error message.
+SHOWN_DIFFERENCES = 3
+
+def sampled(message, rate):
+    """
+    Returns True if the message (bytes) should be verified when the part rate
+    (0.0 - 1.0) of the messages is verified. The choice depends only on the content
+    of the message, so the same message is always chosen or left out.
+    """
+    if rate <= 0.0:
+        return False
+    if rate >= 1.0:
+        return True
+    return zlib.crc32(message) % 10000 < rate * 10000
+
+def verify(message, subs, sequence=None):
+    """
+    Decodes the message (bytes) and compares it to the Subset object (subs) which was
+    encoded to it by the sequence (see bufr_sequences, default: bufr_sequences.DEFAULT).
+    If some values differ, errors.EncodingError is raised with the differences.
+    """
+    from eccodes import codes_new_from_message, codes_release, codes_set
+    if sequence is None:
+        sequence = bufr_sequences.SEQUENCES[bufr_sequences.DEFAULT]
+    ibufr = codes_new_from_message(message)
+    try:
+        codes_set(ibufr, 'unpack', 1)
+        differences = compare(ibufr, subs, sequence)
+    finally:
+        codes_release(ibufr)
+    if len(differences) > 0:
+        raise errors.EncodingError('Verifying the bufr message failed:\n' +
+                                   '\n'.join(differences) + '\n')
+
+def compare(ibufr, subs, sequence):
+    """
+    Compares the decoded message (ibufr) to the Subset object (subs) column by column.
+    Returns a list of the differences, empty if the message is right.
+    """
+    from eccodes import codes_get, codes_get_array, codes_get_string_array
+    nsub = codes_get(ibufr, 'numberOfSubsets')
+    if nsub != subs.NSUB:
+        return ['numberOfSubsets: expected ' + str(subs.NSUB) + ', decoded ' + str(nsub)]
+    compressed = codes_get(ibufr, 'compressedData') == 1
+    differences = []
+    for kind, key, attribute, start, step in bufr_sequences.encoding_plan(sequence.name,
+                                                                          compressed):
+        expected = getattr(subs, attribute)
+        if step > 1:
+            expected = expected[start::step]
+        first_key = key if key.startswith('#') else '#1#' + key
+        if kind == 'string':
+            width = codes_get(ibufr, first_key + '->width') // 8
+            expected = np.array([value[:width] for value in expected], dtype=object)
+            decoded = np.array(codes_get_string_array(ibufr, key), dtype=object)
+            decoded = np.array([value.rstrip() for value in decoded], dtype=object)
+            wrong = None if len(decoded) not in (1, len(expected)) else decoded != expected
+        else:
+            expected = np.asarray(expected)
+            decoded = np.asarray(codes_get_array(ibufr, key))
+            wrong = None
+            if len(decoded) in (1, len(expected)):
+                wrong = wrong_numbers(expected, decoded,
+                                      codes_get(ibufr, first_key + '->scale'))
+        if wrong is None:
+            differences.append(key + ': expected ' + str(len(expected)) + ' values, decoded ' +
+                               str(len(decoded)))
+        elif wrong.any():
+            differences.append(describe(key, expected, decoded, wrong))
+    return differences
+
+def wrong_numbers(expected, decoded, scale):
+    """
+    Compares the expected values to the decoded ones with the tolerance of the scale
+    of the bufr key. A compressed message has only one decoded value if all the values
+    are the same. Returns a boolean array
+    which is True for the values that differ.
+    """
+    decoded = np.broadcast_to(decoded, expected.shape)
+    expected_missing = is_missing(expected)
+    decoded_missing = is_missing(decoded)
+    tolerance = 0.5 * 10.0**(-scale) + 1e-9 * np.abs(expected)
+    different = np.abs(np.where(expected_missing | decoded_missing, 0.0,
+                                expected - decoded)) > tolerance
+    return (expected_missing != decoded_missing) | different
+
+def is_missing(values):
+    """
+    Returns a boolean array which is True for the missing values: CODES_MISSING_LONG
+    in integer arrays and CODES_MISSING_DOUBLE in float arrays. eccodes decodes the
+    keys with scale 0 as integers, also when they were set as floats.
+    """
+    if values.dtype.kind in 'iu':
+        return values == CODES_MISSING_LONG
+    return values == CODES_MISSING_DOUBLE
+
+def describe(key, expected, decoded, wrong):
+    """
+    Returns a description of the differences of key: how many values differ and the
+    first SHOWN_DIFFERENCES of them.
+    """
+    decoded = np.broadcast_to(decoded, expected.shape)
+    indices = np.flatnonzero(wrong)
+    text = key + ': ' + str(len(indices)) + ' of ' + str(len(expected)) + ' values differ'
+    for i in indices[:SHOWN_DIFFERENCES]:
+        text = (text + '\n    value ' + str(i + 1) + ': expected ' + show(expected[i]) +
+                ', decoded ' + show(decoded[i]))
+    return text
+
+def show(value):
+    """
+    Returns a value as a text for the error message. Texts are quoted.
+    """
+    if isinstance(value, str):
+        return repr(value)
+    return str(value)